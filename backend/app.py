@@ -1,26 +1,131 @@
 # app.py
-from flask import Flask, jsonify, request
+import time
+_module_import_started = time.perf_counter()
+from flask import Flask, Response, g, has_request_context, jsonify, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS, cross_origin
-import pandas as pd
 import io
+import gzip
+import zipfile
+import queue
+import sqlite3
+import hashlib
+import shutil
+import numbers
+from werkzeug.datastructures import FileStorage
+from werkzeug.utils import secure_filename
+try:
+    import fcntl # Job claims use advisory file locks; not available on Windows
+except ImportError:
+    fcntl = None
 import requests
 import firebase_admin
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date as calendar_date
 from io import BytesIO
 from firebase_admin import credentials, auth
 from functools import wraps
 import uuid
 import logging
 import urllib.parse
-from pmdarima import auto_arima
-import numpy as np
+import re
+import importlib
+import importlib.util
 import json
-from sklearn.linear_model import LinearRegression
-from scipy.stats import spearmanr
 import os
+import threading
+import warnings
+import contextvars
+from contextlib import contextmanager
+import sys
+import logging.handlers
+from collections import Counter
+from cachetools import TTLCache
+import decimal
+from werkzeug.http import http_date
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from dotenv import load_dotenv
 load_dotenv()
 
+try:
+    import orjson # Optional: much faster JSON encoding (see FastJSONProvider)
+except ImportError:
+    orjson = None
+
+# --- Lazily loaded analytics libraries ---
+# pandas and numpy are only imported the first time a route touches them, and pmdarima,
+# statsmodels and scipy.stats are imported inside the forecasting/correlation functions, so
+# worker (re)starts and routes like /api/log_activity or /api/users do not pay for them.
+# ANALYTICS_WARMUP=1 preloads them in a background thread once the server is listening.
+ANALYTICS_MODULES = ["numpy", "pandas", "scipy.stats", "statsmodels.tsa.exponential_smoothing.ets", "pmdarima"]
+ANALYTICS_WARMUP_ENABLED = os.environ.get("ANALYTICS_WARMUP") == "1"
+ANALYTICS_WARMUP_DELAY_SECONDS = float(os.environ.get("ANALYTICS_WARMUP_DELAY_SECONDS", 1))
+IMPORT_SECONDS = {} # module name -> seconds its first import took in this process
+_import_lock = threading.Lock()
+
+def import_analytics_module(name):
+    """Imports `name` (once per process), recording and logging how long the import took."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    with _import_lock:
+        started = time.perf_counter()
+        module = importlib.import_module(name)
+        IMPORT_SECONDS.setdefault(name, time.perf_counter() - started)
+    logging.info(f"Imported {name} in {IMPORT_SECONDS[name]:.2f}s")
+    return module
+
+class LazyModule:
+    """
+    Stand-in for a module global (e.g. `pd`) that imports the module on first attribute access,
+    then rebinds the global to the real module so later lookups cost nothing extra.
+    """
+    def __init__(self, name, alias):
+        self._name = name
+        self._alias = alias
+
+    def __getattr__(self, attr):
+        module = import_analytics_module(self._name)
+        globals()[self._alias] = module
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}>"
+
+pd = LazyModule("pandas", "pd")
+np = LazyModule("numpy", "np")
+
+def warm_up_analytics_imports(wait_for=None, delay=ANALYTICS_WARMUP_DELAY_SECONDS):
+    """
+    Preloads ANALYTICS_MODULES in a daemon thread. With wait_for=(host, port) it first waits until
+    that address accepts connections; otherwise it waits `delay` seconds (for WSGI servers, which
+    import the app before accepting traffic).
+    """
+    def run():
+        if wait_for:
+            import socket
+            while True:
+                try:
+                    with socket.create_connection(wait_for, timeout=1):
+                        break
+                except OSError:
+                    time.sleep(0.2)
+        else:
+            time.sleep(delay)
+        started = time.perf_counter()
+        for name in ANALYTICS_MODULES:
+            try:
+                import_analytics_module(name)
+            except ImportError as e:
+                logging.error(f"Analytics warm-up could not import {name}: {e}")
+        logging.info(f"Analytics warm-up finished in {time.perf_counter() - started:.2f}s: "
+                     + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in IMPORT_SECONDS.items()))
+
+    thread = threading.Thread(target=run, name="analytics-warmup", daemon=True)
+    thread.start()
+    return thread
+
 
 app = Flask(__name__)
 CORS(app)
@@ -28,7 +133,8 @@ CORS(app)
 logging.basicConfig(level=logging.INFO)
 
 # --- Supabase config ---
-SUPABASE_URL = "https://jfajaxpzkjqvdibdyibz.supabase.co"
+# SUPABASE_URL can point at another PostgREST endpoint (e.g. backend/fake_postgrest.py for offline load tests)
+SUPABASE_URL = os.environ.get("SUPABASE_URL", "https://jfajaxpzkjqvdibdyibz.supabase.co").rstrip("/")
 SUPABASE_API_KEY = os.environ.get("SUPABASE_API_KEY")
 
 if not SUPABASE_API_KEY:
@@ -41,28 +147,49 @@ HEADERS = {
 }
 
 # Initialize Firebase Admin SDK
-service_account_key_path = os.environ.get('FIREBASE_ADMIN_SDK_KEY_PATH')
-if not service_account_key_path:
-    logging.error("FIREBASE_ADMIN_SDK_KEY_PATH environment variable is not set. Firebase Admin SDK will not initialize.")
-    print("CRITICAL ERROR: FIREBASE_ADMIN_SDK_KEY_PATH environment variable is not set.")
-    print("Please set it to the path of your serviceAccountKey.json file.")
+# The forecast process pool (see get_forecast_pool) spawns workers that re-import this module only to
+# run model fits; they skip Firebase, the background sampler and the import warm-up.
+IS_MAIN_PROCESS = multiprocessing.parent_process() is None
 
-try:
-    firebase_admin.get_app()
-    logging.info("Firebase Admin SDK already initialized.")
-except ValueError:
-    if service_account_key_path:
-        try:
-            cred = credentials.Certificate(service_account_key_path)
-            firebase_admin.initialize_app(cred)
-            logging.info(f"Firebase Admin SDK initialized successfully from {service_account_key_path}.")
-        except Exception as e:
-            logging.error(f"Error initializing Firebase Admin SDK from {service_account_key_path}: {e}", exc_info=True)
-            print(f"Error initializing Firebase Admin SDK: {e}")
-            print("Firebase features (user management) might not work correctly. Please ensure serviceAccountKey.json is correct.")
-    else:
-        logging.warning("Firebase Admin SDK initialization skipped due to missing service account key path.")
+def init_firebase_admin():
+    service_account_key_path = os.environ.get('FIREBASE_ADMIN_SDK_KEY_PATH')
+    if not service_account_key_path:
+        logging.error("FIREBASE_ADMIN_SDK_KEY_PATH environment variable is not set. Firebase Admin SDK will not initialize.")
+        print("CRITICAL ERROR: FIREBASE_ADMIN_SDK_KEY_PATH environment variable is not set.")
+        print("Please set it to the path of your serviceAccountKey.json file.")
+
+    try:
+        firebase_admin.get_app()
+        logging.info("Firebase Admin SDK already initialized.")
+    except ValueError:
+        if service_account_key_path:
+            try:
+                cred = credentials.Certificate(service_account_key_path)
+                firebase_admin.initialize_app(cred)
+                logging.info(f"Firebase Admin SDK initialized successfully from {service_account_key_path}.")
+            except Exception as e:
+                logging.error(f"Error initializing Firebase Admin SDK from {service_account_key_path}: {e}", exc_info=True)
+                print(f"Error initializing Firebase Admin SDK: {e}")
+                print("Firebase features (user management) might not work correctly. Please ensure serviceAccountKey.json is correct.")
+        else:
+            logging.warning("Firebase Admin SDK initialization skipped due to missing service account key path.")
 
+if IS_MAIN_PROCESS:
+    init_firebase_admin()
+
+# --- Test-only authentication ---
+# With SCAPE_TEST_AUTH=1, bearer tokens of the form "test:<uid>" or "test:<uid>:admin" are accepted
+# without contacting Firebase, so the API can be load-tested offline. Never enable this in production.
+TEST_AUTH_ENABLED = os.environ.get("SCAPE_TEST_AUTH") == "1"
+if TEST_AUTH_ENABLED:
+    logging.warning("SCAPE_TEST_AUTH=1: accepting unsigned 'test:<uid>[:admin]' tokens. DO NOT USE IN PRODUCTION.")
+
+def verify_test_token(id_token):
+    """Decodes a 'test:<uid>[:admin]' token into a Firebase-like decoded token dict."""
+    parts = id_token.split(':')
+    if len(parts) not in (2, 3) or parts[0] != 'test' or not parts[1]:
+        raise ValueError("Malformed test token. Expected 'test:<uid>' or 'test:<uid>:admin'.")
+    return {'uid': parts[1], 'admin': len(parts) == 3 and parts[2] == 'admin', 'test_token': True}
 
 def verify_token(f):
     """
@@ -82,8 +209,11 @@ def verify_token(f):
 
         try:
             id_token = auth_header.split(' ')[1]
-            # Added clock_skew_seconds to allow for minor time differences
-            decoded_token = auth.verify_id_token(id_token, clock_skew_seconds=60) 
+            if TEST_AUTH_ENABLED and id_token.startswith('test:'):
+                decoded_token = verify_test_token(id_token)
+            else:
+                # Added clock_skew_seconds to allow for minor time differences
+                decoded_token = auth.verify_id_token(id_token, clock_skew_seconds=60) 
             request.current_user = decoded_token # Attach decoded token to request for subsequent decorators
             logging.info(f"Token verified for user: {decoded_token['uid']}")
         except Exception as e:
@@ -94,132 +224,795 @@ def verify_token(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# Helper to fetch data from Supabase
-def fetch_table(table_name, select="*", order=None, limit=None, start_date=None, end_date=None, offset=0, count=False, filters=None):
+# --- Pipeline stage timing ---
+# The pandas pipelines below wrap their steps in pipeline_stage(...). This is a no-op unless a
+# recorder has been installed for the current context (e.g. by the benchmark suite), in which
+# case the recorder is called with (stage_name, seconds) as each stage finishes.
+_stage_recorder = contextvars.ContextVar("stage_recorder", default=None)
+
+@contextmanager
+def pipeline_stage(name):
+    """Times the enclosed block as pipeline stage `name` if a stage recorder is active."""
+    recorder = _stage_recorder.get()
+    if recorder is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder(name, time.perf_counter() - started)
+
+@contextmanager
+def record_pipeline_stages(recorder):
+    """Installs `recorder(stage_name, seconds)` for pipeline stages run inside the block."""
+    token = _stage_recorder.set(recorder)
+    try:
+        yield
+    finally:
+        _stage_recorder.reset(token)
+
+# --- Request instrumentation ---
+# Each request collects its stage timings (Supabase pages, DataFrame builds, resampling, model fits,
+# JSON encoding) in flask.g. They are returned in a Server-Timing header and folded into
+# process-wide histograms exposed on /metrics in the Prometheus text format. Histograms are
+# per worker process; Prometheus aggregates across workers when scraping each one.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ROW_BUCKETS = (0, 1, 10, 100, 250, 500, 1000)
+BYTE_BUCKETS = (1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000)
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN") # Optional bearer token required to scrape /metrics
+
+class Histogram:
+    """A minimal thread-safe Prometheus histogram keyed by label values."""
+    def __init__(self, name, documentation, label_names, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        def labels(values, extra=()):
+            pairs = list(zip(self.label_names, values)) + list(extra)
+            return "{" + ",".join(f'{key}="{str(value)}"' for key, value in pairs) + "}"
+
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, series["buckets"]):
+                    lines.append(f"{self.name}_bucket{labels(label_values, [('le', bound)])} {bucket_count}")
+                lines.append(f"{self.name}_bucket{labels(label_values, [('le', '+Inf')])} {series['count']}")
+                lines.append(f"{self.name}_sum{labels(label_values)} {series['sum']}")
+                lines.append(f"{self.name}_count{labels(label_values)} {series['count']}")
+        return "\n".join(lines)
+
+REQUEST_DURATION = Histogram("scape_request_duration_seconds", "End-to-end request latency.",
+                             ("route", "method", "status"), LATENCY_BUCKETS)
+STAGE_DURATION = Histogram("scape_stage_duration_seconds", "Time spent per pipeline stage within a request.",
+                           ("route", "stage", "table"), LATENCY_BUCKETS)
+SUPABASE_PAGE_DURATION = Histogram("scape_supabase_page_duration_seconds", "Latency of one Supabase page fetch.",
+                                   ("route", "table"), LATENCY_BUCKETS)
+SUPABASE_PAGE_ROWS = Histogram("scape_supabase_page_rows", "Rows returned per Supabase page.",
+                               ("route", "table"), ROW_BUCKETS)
+SUPABASE_PAGE_BYTES = Histogram("scape_supabase_page_bytes", "Response bytes per Supabase page.",
+                                ("route", "table"), BYTE_BUCKETS)
+ALL_HISTOGRAMS = [REQUEST_DURATION, STAGE_DURATION, SUPABASE_PAGE_DURATION, SUPABASE_PAGE_ROWS, SUPABASE_PAGE_BYTES]
+
+def _request_route():
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+def _request_stage_recorder(name, seconds):
+    """Stage recorder installed for every request. Stage names may carry a table as 'stage:table'."""
+    if has_request_context() and hasattr(g, "stage_timings"):
+        stage, _, table = name.partition(":")
+        g.stage_timings.append((stage, table, seconds))
+
+def record_supabase_page(table_name, rows, num_bytes, seconds):
+    """Records one fetch_table/fetch_summary round trip for Server-Timing and /metrics."""
+    recorder = _stage_recorder.get()
+    if recorder is not None:
+        recorder(f"fetch:{table_name}", seconds)
+    route = _request_route() if has_request_context() else "background"
+    SUPABASE_PAGE_DURATION.observe(seconds, route, table_name)
+    SUPABASE_PAGE_ROWS.observe(rows, route, table_name)
+    SUPABASE_PAGE_BYTES.observe(num_bytes, route, table_name)
+
+@app.before_request
+def start_request_instrumentation():
+    g.request_started = time.perf_counter()
+    g.stage_timings = []
+    g.stage_recorder_token = _stage_recorder.set(_request_stage_recorder)
+
+@app.after_request
+def add_server_timing(response):
+    if not hasattr(g, "request_started"):
+        return response
+    total = time.perf_counter() - g.request_started
+    route = _request_route()
+
+    # Sum repeated stages (e.g. every page of the same table) into one Server-Timing entry each
+    totals = {}
+    for stage, table, seconds in g.stage_timings:
+        key = f"{stage}_{table}" if table else stage
+        duration, count = totals.get(key, (0.0, 0))
+        totals[key] = (duration + seconds, count + 1)
+        STAGE_DURATION.observe(seconds, route, stage, table)
+
+    entries = [f'{key};dur={duration * 1000:.1f};desc="{count}x"' for key, (duration, count) in totals.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    response.headers["Server-Timing"] = ", ".join(entries)
+    REQUEST_DURATION.observe(total, route, request.method, response.status_code)
+    return response
+
+@app.teardown_request
+def end_request_instrumentation(exc=None):
+    token = g.pop("stage_recorder_token", None)
+    if token is not None:
+        _stage_recorder.reset(token)
+
+def _orjson_default(o):
+    """Types orjson does not serialize itself, encoded the way Flask's default provider does."""
+    # NumPy scalars/arrays orjson rejects (e.g. non-contiguous arrays). Checked first: comparing an
+    # array with itself below would be elementwise
+    if hasattr(o, "tolist"):
+        return o.tolist()
+    if pd.isna(o) is True: # NaT (and any other NaN-like scalar) becomes null, like NaN floats do in orjson
+        return None
+    if isinstance(o, calendar_date): # datetime, date and pd.Timestamp, as an HTTP date string
+        return http_date(o)
+    if isinstance(o, decimal.Decimal):
+        return str(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+class FastJSONProvider(DefaultJSONProvider):
     """
-    Fetches data from a specified Supabase table with optional filters and pagination.
-    This version includes logic to fetch all records if limit is None, handling Supabase's default row limit.
-    
-    Args:
-        table_name (str): The name of the table to fetch from.
-        select (str): Columns to select (e.g., "*", "id,name").
-        order (str): Column to order by (e.g., "date.asc").
-        limit (int): Maximum number of records to return. If None, all available records are fetched via pagination.
-        start_date (str): Start date for filtering (YYYY-MM-DD).
-        end_date (str): End date for filtering (YYYY-MM-DD).
-        offset (int): Starting offset for pagination (used internally for fetching all).
-        count (bool): If True, also return the total count of matching rows (only for the first call).
-        filters (dict): Dictionary of additional filters (e.g., {"user_id": "some_uid"}).
+    JSON provider for the whole app, backed by orjson when it is installed (Flask's default otherwise).
+    Serializes NumPy arrays and scalars natively and NaN/inf as null (valid JSON, unlike the default
+    provider), keeps Flask's key sorting and date format, and reports encoding time as the
+    'json_encode' stage.
+    """
+    def _orjson_option(self, pretty=False):
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        with pipeline_stage("json_encode"):
+            if orjson is None or kwargs:
+                return super().dumps(obj, **kwargs)
+            return orjson.dumps(obj, default=_orjson_default, option=self._orjson_option()).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        # Encode straight to bytes instead of str -> bytes
+        with pipeline_stage("json_encode"):
+            body = orjson.dumps(obj, default=_orjson_default, option=self._orjson_option(pretty))
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+app.json = FastJSONProvider(app)
+if orjson is None:
+    logging.warning("orjson is not installed; using Flask's slower built-in JSON encoder.")
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint with request, stage and Supabase page histograms for this worker."""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "Invalid metrics token."}), 401
+    body = "\n".join(histogram.render() for histogram in ALL_HISTOGRAMS) + "\n"
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+# --- Sampling profiler ---
+# A thread samples Python stacks via sys._current_frames() at a fixed interval and counts them in
+# the collapsed format flamegraph tools read ("outer;inner;leaf <count>", e.g. flamegraph.pl or
+# speedscope). Two ways to use it:
+#   * Per request: admins add ?profile=1 or an 'X-Profile: 1' header to a profiled route and get
+#     the collapsed stacks of that request back instead of its normal body.
+#   * Continuous: PROFILE_SAMPLER_INTERVAL_MS > 0 samples every thread of this process and appends
+#     one window of counts every PROFILE_SAMPLER_FLUSH_SECONDS to a rotating per-process file.
+#     Forecast pool workers import this module too, so auto_arima fits get their own files.
+REQUEST_PROFILE_INTERVAL_SECONDS = float(os.environ.get("REQUEST_PROFILE_INTERVAL_MS", 5)) / 1000
+PROFILE_SAMPLER_INTERVAL_SECONDS = float(os.environ.get("PROFILE_SAMPLER_INTERVAL_MS", 0)) / 1000 # 0 disables
+PROFILE_SAMPLER_FLUSH_SECONDS = float(os.environ.get("PROFILE_SAMPLER_FLUSH_SECONDS", 60))
+PROFILE_SAMPLER_DIR = os.environ.get("PROFILE_SAMPLER_DIR", "profiles")
+PROFILE_SAMPLER_MAX_BYTES = 10_000_000
+PROFILE_SAMPLER_BACKUP_COUNT = 5
+
+def _collapse_stack(frame, root=None):
+    """Renders a frame chain as 'root;outer (file.py:line);...;leaf (file.py:line)'."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    if root:
+        names.append(root)
+    return ";".join(reversed(names))
+
+class StackSampler:
+    """Counts collapsed stacks of the given threads (all other threads if None) every `interval` seconds."""
+    def __init__(self, interval, thread_ids=None):
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.counts = Counter()
+        self.samples = 0
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        own_id = threading.get_ident()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        frames = sys._current_frames()
+        with self.lock:
+            self.samples += 1
+            for thread_id, frame in frames.items():
+                if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                root = thread_names.get(thread_id, str(thread_id)) if self.thread_ids is None else None
+                self.counts[_collapse_stack(frame, root)] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self, name="stack-sampler"):
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def drain(self):
+        """Returns (samples, counts) collected so far and starts a new window."""
+        with self.lock:
+            samples, counts = self.samples, self.counts
+            self.samples, self.counts = 0, Counter()
+        return samples, counts
+
+def format_collapsed_stacks(counts):
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+def profile_requested():
+    return request.args.get('profile') == '1' or request.headers.get('X-Profile') == '1'
+
+def profile_on_request(f):
+    """
+    Decorator (applied after @verify_token) that profiles the request when ?profile=1 or
+    'X-Profile: 1' is sent. Only admins may profile; the response is the collapsed stack profile
+    (text/plain) of the request thread, with the route's own status in X-Profiled-Status.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not profile_requested():
+            return f(*args, **kwargs)
 
-    Returns:
-        tuple or list: (records, total_count) if count=True, else just records.
+        def run_profiled():
+            sampler = StackSampler(REQUEST_PROFILE_INTERVAL_SECONDS, thread_ids={threading.get_ident()}).start("request-profiler")
+            started = time.perf_counter()
+            try:
+                profiled_response = app.make_response(f(*args, **kwargs))
+            finally:
+                sampler.stop()
+            samples, counts = sampler.drain()
+            logging.info(f"Profiled {request.path}: {samples} samples in {time.perf_counter() - started:.2f}s")
+            return Response(format_collapsed_stacks(counts), mimetype="text/plain", headers={
+                "X-Profiled-Status": str(profiled_response.status_code),
+                "X-Profile-Samples": str(samples),
+                "X-Profile-Interval-Ms": f"{REQUEST_PROFILE_INTERVAL_SECONDS * 1000:g}",
+            })
+
+        return admin_required(run_profiled)()
+    return decorated_function
+
+def start_background_sampler():
+    """Starts continuous sampling of every thread into a rotating collapsed-stack file for this process."""
+    if PROFILE_SAMPLER_INTERVAL_SECONDS <= 0:
+        return None
+    os.makedirs(PROFILE_SAMPLER_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_SAMPLER_DIR, f"stacks-{os.getpid()}.collapsed")
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=PROFILE_SAMPLER_MAX_BYTES,
+                                                   backupCount=PROFILE_SAMPLER_BACKUP_COUNT)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    profile_logger = logging.getLogger(f"scape.profile.{os.getpid()}")
+    profile_logger.propagate = False
+    profile_logger.setLevel(logging.INFO)
+    profile_logger.addHandler(handler)
+
+    sampler = StackSampler(PROFILE_SAMPLER_INTERVAL_SECONDS).start("background-stack-sampler")
+
+    def flush_windows():
+        while True:
+            time.sleep(PROFILE_SAMPLER_FLUSH_SECONDS)
+            samples, counts = sampler.drain()
+            if counts:
+                # Comment line per window so files can be split by time; flamegraph tools skip it
+                profile_logger.info(f"# window_end={datetime.now().isoformat(timespec='seconds')} samples={samples}\n"
+                                    f"{format_collapsed_stacks(counts).rstrip()}")
+
+    threading.Thread(target=flush_windows, name="stack-sampler-flush", daemon=True).start()
+    logging.info(f"Background stack sampler every {PROFILE_SAMPLER_INTERVAL_SECONDS * 1000:g} ms writing to {path}")
+    return sampler
+
+background_sampler = start_background_sampler() if IS_MAIN_PROCESS else None
+
+class SupabaseFetchError(Exception):
+    """Raised by _iter_table_pages when Supabase answers a page request with an error status."""
+    pass
+
+def _iter_table_pages(table_name, decode, select="*", order=None, limit=None, start_date=None, end_date=None,
+                      offset=0, count=False, filters=None, accept=None):
+    """
+    Requests a Supabase table page by page (at most 1000 rows each) and yields
+    (decoded_page, rows_on_page, total_count) as each page arrives, so callers never have to hold
+    more than one raw page. `decode(response)` returns (decoded_page, rows_on_page); total_count is
+    the exact total from the first response when count=True, otherwise None. `accept` overrides the
+    Accept header (e.g. "text/csv"). Raises SupabaseFetchError if a request fails.
     """
-    all_records = []
     current_offset = offset
     supabase_page_size = 1000 # Supabase's default limit per request if not explicitly set to a lower value.
-
-    # If a specific limit is provided, respect it and do not paginate beyond it.
-    # Otherwise, we will paginate to get all data.
-    effective_limit_per_request = limit if limit is not None and limit < supabase_page_size else supabase_page_size
+    fetched_rows = 0
     
     total_expected_records = float('inf') # Assume infinite until we get count from Supabase
     is_initial_call = True
 
-    while True:
-        base_url = f"{SUPABASE_URL}/rest/v1/{table_name}"
-        
-        query_params = []
-        query_params.append(f"select={urllib.parse.quote(select)}")
+    base_url = f"{SUPABASE_URL}/rest/v1/{table_name}"
+    
+    query_params = []
+    query_params.append(f"select={urllib.parse.quote(select)}")
 
-        if order:
-            query_params.append(f"order={urllib.parse.quote(order)}")
-        
-        date_column = "date"
+    if order:
+        query_params.append(f"order={urllib.parse.quote(order)}")
+    
+    date_column = "date"
+    if table_name == "activity_logs":
+        date_column = "timestamp"
+
+    # --- Re-enabled date filters for activity_logs ---
+    if start_date:
+        query_params.append(f"{date_column}=gte.{urllib.parse.quote(str(start_date))}")
+    if end_date:
+        # For activity_logs (timestamp with time zone), ensure end_date includes the entire day
         if table_name == "activity_logs":
-            date_column = "timestamp"
-
-        # --- Re-enabled date filters for activity_logs ---
-        if start_date:
-            query_params.append(f"{date_column}=gte.{urllib.parse.quote(str(start_date))}")
-        if end_date:
-            # For activity_logs (timestamp with time zone), ensure end_date includes the entire day
-            if table_name == "activity_logs":
-                # Append 'T23:59:59.999Z' to cover the whole end day in UTC
-                full_end_date = f"{end_date}T23:59:59.999Z" 
-                query_params.append(f"{date_column}=lte.{urllib.parse.quote(full_end_date)}")
-            else:
-                query_params.append(f"{date_column}=lte.{urllib.parse.quote(str(end_date))}")
-        # --- End re-enabled date filters ---
-        
-        if filters:
-            for key, value in filters.items():
-                if value:
-                    query_params.append(f"{key}=eq.{urllib.parse.quote(str(value))}")
+            # Append 'T23:59:59.999Z' to cover the whole end day in UTC
+            full_end_date = f"{end_date}T23:59:59.999Z" 
+            query_params.append(f"{date_column}=lte.{urllib.parse.quote(full_end_date)}")
+        else:
+            query_params.append(f"{date_column}=lte.{urllib.parse.quote(str(end_date))}")
+    # --- End re-enabled date filters ---
+    
+    if filters:
+        # Values are matched with eq; an (operator, value) tuple uses another PostgREST operator, e.g. ("in", "(a,b)")
+        for key, value in filters.items():
+            operator, value = value if isinstance(value, tuple) else ("eq", value)
+            if value:
+                query_params.append(f"{key}={operator}.{urllib.parse.quote(str(value))}")
 
-        # Always explicitly set limit for each paginated request
-        query_params.append(f"limit={effective_limit_per_request}")
-        query_params.append(f"offset={current_offset}")
+    while True:
+        # If a specific limit is provided, never request past it; otherwise paginate through everything
+        limit_per_request = supabase_page_size if limit is None else max(0, min(supabase_page_size, limit - fetched_rows))
 
-        full_url = f"{base_url}?{'&'.join(query_params)}"
+        # Always explicitly set limit for each paginated request
+        full_url = f"{base_url}?{'&'.join(query_params + [f'limit={limit_per_request}', f'offset={current_offset}'])}"
 
         current_headers = HEADERS.copy()
         if count and is_initial_call: # Only request count on the very first call
             current_headers["Prefer"] = "count=exact"
-        else:
-            # Ensure Prefer header is not set to 'count=exact' for subsequent paginated calls
-            # unless the original 'count' flag was true for the very first request
-            if "Prefer" in current_headers:
-                del current_headers["Prefer"]
+        if accept:
+            current_headers["Accept"] = accept
         
         logging.info(f"Attempting to fetch from URL: {full_url}")
 
+        page_started = time.perf_counter()
         response = requests.get(full_url, headers=current_headers)
+        page_seconds = time.perf_counter() - page_started
         
         logging.info(f"Response status from Supabase for {table_name}: {response.status_code}")
 
         # --- FIX: Accept 206 as a successful status code ---
-        if response.status_code in [200, 206]:
-            records = response.json()
-            all_records.extend(records)
+        if response.status_code not in [200, 206]:
+            record_supabase_page(table_name, 0, len(response.content), page_seconds)
+            logging.error(f"Error fetching table {table_name}: {response.status_code} - {response.text}")
+            raise SupabaseFetchError(f"{table_name}: {response.status_code} - {response.text}")
 
-            if is_initial_call and count:
-                try:
-                    # Parse the total count from Content-Range header
-                    content_range = response.headers.get("Content-Range", "0-*/0")
-                    total_expected_records = int(content_range.split('/')[-1])
-                    logging.info(f"Total count from Supabase for {table_name}: {total_expected_records}")
-                except ValueError:
-                    logging.warning(f"Could not parse total count from Content-Range header: {content_range}. Assuming total records based on fetched data.")
-                    total_expected_records = len(records) # Fallback
-            
-            is_initial_call = False # No longer the initial call for subsequent paginated requests
+        with pipeline_stage("decode"):
+            page, rows_on_page = decode(response)
+        record_supabase_page(table_name, rows_on_page, len(response.content), page_seconds)
+        fetched_rows += rows_on_page
 
-            # If a specific limit was originally requested, and we've fetched enough, stop.
-            if limit is not None and len(all_records) >= limit:
-                all_records = all_records[:limit] # Truncate to the requested limit if we over-fetched
-                break
-            
-            # Continue pagination if more data is expected or if we are fetching all (limit=None)
-            # Stop if the number of records returned is less than the effective_limit_per_request
-            # OR if we have fetched all_records up to the total_expected_records
-            if len(records) < effective_limit_per_request or len(all_records) >= total_expected_records:
-                break # No more data or fetched all required
-            
-            current_offset += len(records) # Increment offset by the number of records actually received
-            logging.info(f"Continuing pagination for {table_name}. Next offset: {current_offset}. Current total fetched: {len(all_records)}")
+        if is_initial_call and count:
+            try:
+                # Parse the total count from Content-Range header
+                content_range = response.headers.get("Content-Range", "0-*/0")
+                total_expected_records = int(content_range.split('/')[-1])
+                logging.info(f"Total count from Supabase for {table_name}: {total_expected_records}")
+            except ValueError:
+                logging.warning(f"Could not parse total count from Content-Range header: {content_range}. Assuming total records based on fetched data.")
+                total_expected_records = rows_on_page # Fallback
+        
+        is_initial_call = False # No longer the initial call for subsequent paginated requests
 
-        else:
-            logging.error(f"Error fetching table {table_name}: {response.status_code} - {response.text}")
-            if count:
-                return [], 0
-            return []
+        yield page, rows_on_page, (total_expected_records if count else None)
+
+        # Stop if the page was short (no more data), we have everything Supabase counted,
+        # or a specific limit was requested and has been reached
+        if (rows_on_page < limit_per_request or fetched_rows >= total_expected_records
+                or (limit is not None and fetched_rows >= limit)):
+            break
+        
+        current_offset += rows_on_page # Increment offset by the number of records actually received
+        logging.info(f"Continuing pagination for {table_name}. Next offset: {current_offset}. Current total fetched: {fetched_rows}")
+
+def _decode_json_records(response):
+    records = response.json()
+    return records, len(records)
+
+# Helper to fetch data from Supabase
+def fetch_table(table_name, select="*", order=None, limit=None, start_date=None, end_date=None, offset=0, count=False, filters=None):
+    """
+    Fetches data from a specified Supabase table with optional filters and pagination.
+    This version includes logic to fetch all records if limit is None, handling Supabase's default row limit.
+    
+    Args:
+        table_name (str): The name of the table to fetch from.
+        select (str): Columns to select (e.g., "*", "id,name").
+        order (str): Column to order by (e.g., "date.asc").
+        limit (int): Maximum number of records to return. If None, all available records are fetched via pagination.
+        start_date (str): Start date for filtering (YYYY-MM-DD).
+        end_date (str): End date for filtering (YYYY-MM-DD).
+        offset (int): Starting offset for pagination (used internally for fetching all).
+        count (bool): If True, also return the total count of matching rows (only for the first call).
+        filters (dict): Dictionary of additional filters (e.g., {"user_id": "some_uid"}).
+
+    Returns:
+        tuple or list: (records, total_count) if count=True, else just records.
+    """
+    all_records = []
+    total_count = None
+    try:
+        for records, _, total_count in _iter_table_pages(table_name, _decode_json_records, select=select, order=order,
+                                                         limit=limit, start_date=start_date, end_date=end_date,
+                                                         offset=offset, count=count, filters=filters):
+            all_records.extend(records)
+    except SupabaseFetchError:
+        if count:
+            return [], 0
+        return []
 
     if count:
-        # Return the actual total records fetched, or the count from the header if it was exact.
-        final_total_count = total_expected_records if total_expected_records != float('inf') else len(all_records)
+        # Return the count from the header if it was exact, otherwise the number of records fetched
+        final_total_count = total_count if total_count not in (None, float('inf')) else len(all_records)
         return all_records, final_total_count
     return all_records
 
+# --- Typed columnar fetches ---
+# fetch_frame decodes each page straight into typed NumPy column chunks (datetime64 dates,
+# int64/float64 metrics) and drops the page's dicts before the next one arrives, so a large pull
+# never holds the whole table as Python dicts the way fetch_table's record list does.
+# With wire_format="csv" pages are requested as text/csv (smaller than JSON) and parsed by pandas'
+# C CSV reader, skipping Python objects entirely. SUPABASE_ANALYTICS_WIRE_FORMAT=json switches the
+# analytics routes back to JSON, e.g. behind a proxy that cannot return CSV.
+ANALYTICS_WIRE_FORMAT = os.environ.get("SUPABASE_ANALYTICS_WIRE_FORMAT", "csv")
+TIKTOK_METRIC_COLUMNS = {"date": "datetime64[ns]", "views": "int64", "likes": "int64", "comments": "int64", "shares": "int64"}
+FACEBOOK_METRIC_COLUMNS = {"date": "datetime64[ns]", "likes": "int64", "comments": "int64", "shares": "int64", "reach": "int64"}
+SALES_REVENUE_COLUMNS = {"date": "datetime64[ns]", "revenue": "float64"}
+
+def _typed_column(values, dtype):
+    """
+    Converts one page of raw JSON values into a NumPy array of `dtype`. Unparseable dates become NaT;
+    integer columns holding nulls or fractions fall back to float64, and unparseable numbers become NaN.
+    """
+    if dtype.startswith("datetime64"):
+        return pd.to_datetime(values, errors='coerce', format='ISO8601').to_numpy(dtype=dtype)
+    if dtype == "int64":
+        array = np.array(values)
+        if array.dtype.kind in "iu":
+            return array.astype(np.int64, copy=False)
+        dtype = "float64"
+    if dtype == "float64":
+        try:
+            return np.array(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+    return np.array(values, dtype=object)
+
+def _decode_json_columns(response, columns):
+    records = response.json()
+    page = {name: _typed_column([record.get(name) for record in records], dtype) for name, dtype in columns.items()}
+    return page, len(records)
+
+def _decode_csv_columns(response, columns):
+    if not response.content.strip():
+        return {name: np.array([], dtype=dtype) for name, dtype in columns.items()}, 0
+    # Columns then go through the same typing rules as the JSON path (NULLs arrive as empty fields)
+    frame = pd.read_csv(io.BytesIO(response.content), usecols=lambda name: name in columns)
+    page = {name: _typed_column(frame[name] if name in frame.columns else [None] * len(frame), dtype)
+            for name, dtype in columns.items()}
+    return page, len(frame)
+
+def fetch_frame(table_name, columns, order=None, limit=None, start_date=None, end_date=None, filters=None, wire_format="json"):
+    """
+    Like fetch_table, but returns a DataFrame with typed columns instead of a list of dicts.
+    `columns` maps each selected column to its dtype ("datetime64[ns]", "int64", "float64" or "object").
+    `wire_format` is "json" or "csv" (PostgREST's text/csv output, parsed with pd.read_csv).
+    Returns an empty frame with those columns if Supabase returns an error.
+    Date-ranged reads of a whole table are served from the shared cache (see SharedCache) when enabled
+    and the table has at most SHARED_TABLE_MAX_ROWS rows.
+    """
+    if (shared_cache.enabled and limit is None and not filters and order in (None, "date.asc")
+            and use_shared_table(table_name)):
+        frame = shared_table_frame(table_name, columns, wire_format)
+        if frame is not None:
+            return slice_date_range(frame, start_date, end_date)
+        return _empty_frame(columns)
+    return _fetch_frame_uncached(table_name, columns, order, limit, start_date, end_date, filters, wire_format)
+
+def _empty_frame(columns):
+    return pd.DataFrame({name: np.array([], dtype=dtype) for name, dtype in columns.items()})
+
+def _fetch_frame_uncached(table_name, columns, order=None, limit=None, start_date=None, end_date=None, filters=None,
+                          wire_format="json", raise_errors=False):
+    if wire_format == "csv":
+        decode, accept = (lambda response: _decode_csv_columns(response, columns)), "text/csv"
+    elif wire_format == "json":
+        decode, accept = (lambda response: _decode_json_columns(response, columns)), None
+    else:
+        raise ValueError(f"Unsupported wire format: {wire_format}")
+
+    chunks = {name: [] for name in columns}
+    try:
+        for page, _, _ in _iter_table_pages(table_name, decode, select=",".join(columns), order=order, limit=limit,
+                                            start_date=start_date, end_date=end_date, filters=filters, accept=accept):
+            for name, values in page.items():
+                chunks[name].append(values)
+    except SupabaseFetchError:
+        if raise_errors:
+            raise
+        chunks = {name: [] for name in columns}
+
+    with pipeline_stage("build_frames"):
+        return pd.DataFrame({
+            name: np.concatenate(parts) if parts else np.array([], dtype=columns[name])
+            for name, parts in chunks.items()
+        })
+
+# --- Cross-worker shared cache ---
+# Under a multi-worker WSGI server every process used to pull and hold its own copy of tiktokdata,
+# facebookdata and sales, and warm its own result cache. SharedCache keeps both on local disk where
+# all workers see them: whole-table frames as Arrow IPC files, which workers memory-map and wrap in
+# DataFrames without copying (numeric and date columns are read-only views of the mapping), and
+# analytics responses as JSON. The default directory is under /dev/shm, so "disk" is shared memory.
+# Files are written to a temporary name and renamed into place, so a file's mtime is when it was
+# written; reads refresh its atime, and the least recently used files are deleted once the cache
+# exceeds SHARED_CACHE_MAX_BYTES. Every file name carries the cache generation, which an upload in
+# any worker replaces (see invalidate_analytics_cache), so stale tables and results are never read
+# again. Entries also expire: readers pass the age they accept (SHARED_TABLE_TTL_SECONDS for tables,
+# ANALYTICS_CACHE_TTL_SECONDS for results), so data edited directly in Supabase is picked up and
+# entries left in /dev/shm by an earlier run are not served forever.
+# A table is cached whole, so the first date-ranged read after it expires pays for pulling all of
+# it (every later range is a slice of that copy). That is only worth it while tables are small:
+# one with more than SHARED_TABLE_MAX_ROWS rows (counted once per SHARED_TABLE_TTL_SECONDS) is
+# never cached, and each read fetches just its range from Supabase.
+SHARED_CACHE_ENABLED = os.environ.get("SHARED_CACHE", "1") != "0"
+SHARED_CACHE_DIR = os.environ.get("SHARED_CACHE_DIR") or os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else ".",
+    # One directory per Supabase project, so apps pointed at different projects never share entries
+    f"scape-cache-{hashlib.blake2b(SUPABASE_URL.encode('utf-8'), digest_size=4).hexdigest()}")
+SHARED_CACHE_MAX_BYTES = int(os.environ.get("SHARED_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+SHARED_TABLE_TTL_SECONDS = float(os.environ.get("SHARED_TABLE_TTL_SECONDS", 900))
+SHARED_TABLE_MAX_ROWS = int(os.environ.get("SHARED_TABLE_MAX_ROWS", 2_000_000))
+
+class SharedCache:
+    """Disk-backed cache shared by every worker process on the host. Safe to use from many threads."""
+    def __init__(self, directory, max_bytes, enabled=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.generation_path = os.path.join(directory, "GENERATION")
+        if enabled:
+            try:
+                os.makedirs(directory, exist_ok=True)
+                if importlib.util.find_spec("pyarrow") is None: # Imported on first use, like pandas
+                    raise ImportError("pyarrow is not installed")
+            except (OSError, ImportError) as e:
+                logging.warning(f"Shared cache disabled: {e}")
+                self.enabled = False
+
+    def generation(self):
+        """Current cache generation, shared by all workers (created on first use)."""
+        try:
+            with open(self.generation_path) as f:
+                generation = f.read().strip()
+            if generation:
+                return generation
+        except FileNotFoundError:
+            pass
+        return self.invalidate()
+
+    def invalidate(self):
+        """Starts a new generation; entries of earlier generations are never read again."""
+        generation = uuid.uuid4().hex[:12]
+        self._write_atomic(self.generation_path, generation.encode("utf-8"))
+        return generation
+
+    def _path(self, key, extension):
+        digest = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=16).hexdigest()
+        return os.path.join(self.directory, f"{self.generation()}-{digest}.{extension}")
+
+    def _write_atomic(self, path, data):
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def _fresh(self, path, max_age):
+        """Whether the entry exists and was written at most max_age seconds ago (any age if None). Marks it used."""
+        try:
+            stat = os.stat(path)
+            if max_age is not None and time.time() - stat.st_mtime > max_age:
+                return False
+            os.utime(path, (time.time(), stat.st_mtime)) # Keeps the write time for expiry
+            return True
+        except OSError:
+            return False
+
+    def get_frame(self, key, max_age=None):
+        """Memory-mapped DataFrame for `key`, or None if there is none or it is older than max_age seconds."""
+        path = self._path(key, "arrow")
+        if not self._fresh(path, max_age):
+            return None
+        pa = import_analytics_module("pyarrow")
+        try:
+            table = import_analytics_module("pyarrow.ipc").open_file(pa.memory_map(path)).read_all()
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return None
+        columns = {}
+        for name, column in zip(table.column_names, table.columns):
+            if column.num_chunks == 1 and column.null_count == 0 and (pa.types.is_integer(column.type)
+                    or pa.types.is_floating(column.type) or pa.types.is_timestamp(column.type)):
+                columns[name] = column.chunk(0).to_numpy(zero_copy_only=True)
+            else:
+                columns[name] = column.to_numpy()
+        return pd.DataFrame(columns, copy=False)
+
+    def put_frame(self, key, frame):
+        pa = import_analytics_module("pyarrow")
+        table = pa.Table.from_pandas(frame, preserve_index=False).combine_chunks()
+        sink = pa.BufferOutputStream()
+        with import_analytics_module("pyarrow.ipc").new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        self._put(self._path(key, "arrow"), sink.getvalue().to_pybytes())
+
+    def get_result(self, key, max_age=None):
+        """Cached payload for `key`, or None if there is none or it is older than max_age seconds."""
+        path = self._path(key, "json")
+        if not self._fresh(path, max_age):
+            return None
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        return orjson.loads(data) if orjson is not None else json.loads(data)
+
+    def put_result(self, key, payload):
+        self._put(self._path(key, "json"), app.json.dumps(payload).encode("utf-8"))
+
+    def _put(self, path, data):
+        try:
+            self._write_atomic(path, data)
+            self._evict()
+        except OSError as e:
+            logging.warning(f"Shared cache write failed for {path}: {e}")
+
+    def _evict(self):
+        """Deletes entries of old generations, then least recently used ones beyond max_bytes."""
+        current = self.generation()
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name == "GENERATION" or entry.name.endswith(".tmp"):
+                continue
+            try:
+                if not entry.name.startswith(current + "-"):
+                    os.remove(entry.path)
+                else:
+                    stat = entry.stat()
+                    entries.append((stat.st_atime, stat.st_size, entry.path))
+            except FileNotFoundError:
+                pass # Removed by another worker
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path) # Workers that mapped it keep their mapping
+            except FileNotFoundError:
+                pass
+            total -= size
+
+shared_cache = SharedCache(SHARED_CACHE_DIR, SHARED_CACHE_MAX_BYTES, SHARED_CACHE_ENABLED)
+
+def shared_table_frame(table_name, columns, wire_format="json"):
+    """
+    Whole table (date ascending) from the shared cache, fetched and stored on a miss or once the
+    cached copy is older than SHARED_TABLE_TTL_SECONDS. Returns None if the fetch failed.
+    """
+    key = ("frame", table_name, tuple(columns.items()))
+    frame = shared_cache.get_frame(key, max_age=SHARED_TABLE_TTL_SECONDS)
+    if frame is not None:
+        logging.info(f"Shared cache hit for table {table_name}")
+        return frame
+    try:
+        frame = _fetch_frame_uncached(table_name, columns, order="date.asc", wire_format=wire_format, raise_errors=True)
+    except SupabaseFetchError:
+        return None
+    shared_cache.put_frame(key, frame)
+    return frame
+
+def shared_table_rows(table_name):
+    """Rows in the table, counted by Supabase at most once per SHARED_TABLE_TTL_SECONDS. None if the count failed."""
+    key = ("table-rows", table_name)
+    rows = shared_cache.get_result(key, max_age=SHARED_TABLE_TTL_SECONDS)
+    if rows is None:
+        try:
+            _, _, rows = next(_iter_table_pages(table_name, _decode_json_records, limit=1, count=True))
+        except (SupabaseFetchError, StopIteration):
+            return None
+        shared_cache.put_result(key, rows)
+    return rows
+
+def use_shared_table(table_name):
+    """Whether reads of the table go through a whole-table copy in the shared cache (see SHARED_TABLE_MAX_ROWS)."""
+    rows = shared_table_rows(table_name)
+    return rows is not None and rows <= SHARED_TABLE_MAX_ROWS
+
+def slice_date_range(frame, start_date=None, end_date=None):
+    """Rows with start_date <= date <= end_date, matching the gte/lte filters fetch_frame sends to Supabase."""
+    if not start_date and not end_date:
+        return frame
+    mask = np.ones(len(frame), dtype=bool)
+    if start_date:
+        mask &= (frame["date"] >= pd.Timestamp(start_date)).to_numpy()
+    if end_date:
+        mask &= (frame["date"] <= pd.Timestamp(end_date)).to_numpy()
+    return frame[mask].reset_index(drop=True)
+
+def records_to_frame(records):
+    """
+    DataFrame for either fetch_table records or a fetch_frame result. Frames are shallow-copied so the
+    pipelines' in-place column and index changes never leak into the caller's frame.
+    """
+    if isinstance(records, pd.DataFrame):
+        return records.copy(deep=False)
+    return pd.DataFrame(records if records is not None else [])
+
 def fetch_summary(table_name, field, start_date=None, end_date=None):
     """
     Fetches the sum of a specific field from a Supabase table with optional date filtering.
@@ -246,7 +1039,10 @@ def fetch_summary(table_name, field, start_date=None, end_date=None):
             params[f"{date_column}"] = f"lte.{urllib.parse.quote(str(end_date))}"
 
     logging.info(f"Attempting to fetch summary from URL: {url} with params: {params} and headers: {HEADERS}")
+    summary_started = time.perf_counter()
     response = requests.get(url, headers=HEADERS.copy(), params=params)
+    record_supabase_page(table_name, 1 if response.status_code == 200 else 0, len(response.content),
+                         time.perf_counter() - summary_started)
     
     logging.info(f"Response status from Supabase summary for {table_name} - {field}: {response.status_code}")
     logging.info(f"Response text from Supabase summary for {table_name} - {field}: {response.text}")
@@ -260,34 +1056,38 @@ def fetch_summary(table_name, field, start_date=None, end_date=None):
 
 def fetch_top_products(limit=5, start_date=None, end_date=None):
     """
-    Fetches the top products by sales, aggregating from the 'sales' table
-    and joining with 'products' table for product names, with optional date filtering.
+    Top `limit` products by sales revenue between start_date and end_date (inclusive, optional),
+    as [{product_name, sales}]. Served from the in-memory sales rollup.
     """
-    sales_data = fetch_table("sales", select="product_id,revenue,date", start_date=start_date, end_date=end_date) 
-    
-    if not sales_data:
-        logging.info("No sales data available for top product calculation.")
-        return []
-
-    sales_df = pd.DataFrame(sales_data)
-    sales_df['revenue'] = pd.to_numeric(sales_df['revenue'], errors='coerce').fillna(0)
+    return sales_rollup.top_products(limit=limit, start_date=start_date, end_date=end_date)
 
-    aggregated_sales = sales_df.groupby('product_id')['revenue'].sum().reset_index()
-    aggregated_sales.rename(columns={'revenue': 'sales'}, inplace=True)
-
-    products_info = fetch_table("products", select="product_id,product_name")
+def aggregate_top_products(sales_data, products_info, limit=5):
+    """
+    Sums revenue per product from sales records, joins product names and returns the top `limit`
+    products as [{product_name, sales}].
+    """
+    with pipeline_stage("build_frames"):
+        sales_df = records_to_frame(sales_data)
+        products_df = records_to_frame(products_info)
 
-    if not products_info:
-        logging.info("No product info available for top product calculation.")
-        return []
+    with pipeline_stage("coerce"):
+        sales_df['revenue'] = pd.to_numeric(sales_df['revenue'], errors='coerce').fillna(0)
+        # Ids may arrive as numbers from one source and as text from another (e.g. CSV pages)
+        sales_df['product_id'] = sales_df['product_id'].astype(str)
+        products_df['product_id'] = products_df['product_id'].astype(str)
 
-    products_df = pd.DataFrame(products_info)
+    with pipeline_stage("aggregate"):
+        aggregated_sales = sales_df.groupby('product_id')['revenue'].sum().reset_index()
+        aggregated_sales.rename(columns={'revenue': 'sales'}, inplace=True)
 
-    merged_df = pd.merge(aggregated_sales, products_df, on='product_id', how='inner')
+    with pipeline_stage("merge"):
+        merged_df = pd.merge(aggregated_sales, products_df, on='product_id', how='inner')
 
-    top_products_df = merged_df.sort_values(by='sales', ascending=False).head(limit)
+    with pipeline_stage("rank"):
+        top_products_df = merged_df.sort_values(by='sales', ascending=False).head(limit)
 
-    return top_products_df[['product_name', 'sales']].to_dict(orient='records')
+    with pipeline_stage("serialize"):
+        return top_products_df[['product_name', 'sales']].to_dict(orient='records')
 
 
 @app.route('/api/facebookdata')
@@ -320,6 +1120,203 @@ def sales_data():
     logging.info(f"Data fetched from Supabase for Sales: {len(data)} records")
     return jsonify(data)
 
+# --- Sales revenue rollup ---
+# Top products used to download every sales row in the range plus the whole products table and
+# run groupby/merge/sort on each request. SalesRollup keeps revenue summed per product per day
+# (parallel NumPy arrays sorted by day, one entry per product-day) and a product_id -> name dict.
+# A range query is two binary searches, a bincount over the product-days in range and a partial
+# sort (argpartition) for the top `limit`, so it takes milliseconds for any range and limit.
+# The rollup is built from Supabase on first use. Rows inserted through post_table_records are
+# added to it as they are written. It is rebuilt after SALES_ROLLUP_TTL_SECONDS, or when another
+# worker's upload moves the shared cache to a new generation. Rebuilds fetch without holding the
+# rollup's lock: one thread rebuilds while the others keep answering from the previous arrays
+# (only the very first build makes callers wait).
+SALES_ROLLUP_TTL_SECONDS = float(os.environ.get("SALES_ROLLUP_TTL_SECONDS", 3600))
+SALES_PRODUCT_REVENUE_COLUMNS = {"date": "datetime64[ns]", "product_id": "object", "revenue": "float64"}
+
+def _day_numbers(dates):
+    """Dates (strings or datetime64) -> int64 days since 1970-01-01."""
+    return pd.to_datetime(pd.Series(dates), errors='coerce').to_numpy().astype('datetime64[D]').astype('int64')
+
+class SalesRollup:
+    """Per-product, per-day sales revenue, maintained incrementally. Safe to use from many threads."""
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.rebuild_lock = threading.Lock() # Held for a whole rebuild, so only one thread fetches
+        self.loaded_at = None
+        self.generation = None
+        self.inserts = 0 # Sales writes and deletes recorded; a rebuild that raced with one is stale when it lands
+        self.missed_inserts = False
+        self.product_codes = {} # product_id -> index into the arrays below
+        self.product_ids = []
+        self.product_names = {} # product_id -> product_name
+        self.named = np.zeros(0, dtype=bool) # Per product code: has a products row (a name)
+        self.days = self.codes = self.revenue = None # Sorted by day
+        self.appended = [] # (days, codes, revenue) chunks added since the arrays were last sorted
+
+    def _code(self, product_id):
+        code = self.product_codes.get(product_id)
+        if code is None:
+            code = self.product_codes[product_id] = len(self.product_ids)
+            self.product_ids.append(product_id)
+            self.named = np.append(self.named, product_id in self.product_names)
+        return code
+
+    def _is_stale(self):
+        if self.loaded_at is None or self.missed_inserts or time.monotonic() - self.loaded_at > SALES_ROLLUP_TTL_SECONDS:
+            return True
+        return self.generation is not None and shared_cache.generation() != self.generation
+
+    def _ensure_fresh(self):
+        """Rebuilds a stale rollup. Waits only for the first build; later rebuilds happen in one thread."""
+        with self.lock:
+            if not self._is_stale():
+                return
+            first_build = self.loaded_at is None
+        if not self.rebuild_lock.acquire(blocking=first_build):
+            return # Another thread is rebuilding; answer from the current arrays meanwhile
+        try:
+            with self.lock:
+                stale = self._is_stale()
+            if stale:
+                self.rebuild()
+        finally:
+            self.rebuild_lock.release()
+
+    def rebuild(self):
+        """Loads the rollup from the sales and products tables. Raises SupabaseFetchError on failure."""
+        generation = shared_cache.generation() if shared_cache.enabled else None
+        with self.lock:
+            inserts = self.inserts
+        if shared_cache.enabled and use_shared_table("sales"):
+            sales = shared_table_frame("sales", SALES_PRODUCT_REVENUE_COLUMNS, ANALYTICS_WIRE_FORMAT)
+            if sales is None:
+                raise SupabaseFetchError("Could not load the sales table.")
+        else:
+            sales = _fetch_frame_uncached("sales", SALES_PRODUCT_REVENUE_COLUMNS, order="date.asc",
+                                          wire_format=ANALYTICS_WIRE_FORMAT, raise_errors=True)
+        products = [record for page, _, _ in _iter_table_pages("products", _decode_json_records, select="product_id,product_name")
+                    for record in page]
+        self.load(sales, products, generation, inserts)
+
+    def load(self, sales, products, generation=None, inserts=None):
+        """
+        Replaces the rollup with one built from sales rows (date, product_id, revenue) and product records.
+        `inserts` is self.inserts from before the rows were fetched: if sales were recorded since, the
+        fetch may have missed them, so the new rollup is marked stale.
+        """
+        with pipeline_stage("aggregate"):
+            # Rows without a usable date cannot be placed on a day (record_inserted skips them too)
+            days = _day_numbers(sales["date"])
+            dated = days != np.datetime64('NaT').astype('int64')
+            codes, uniques = pd.factorize(sales["product_id"].astype(str).to_numpy()[dated])
+            revenue = pd.to_numeric(pd.Series(sales["revenue"].to_numpy()[dated]), errors='coerce').fillna(0).to_numpy()
+            rollup = (pd.DataFrame({"day": days[dated], "code": codes, "revenue": revenue})
+                      .groupby(["day", "code"], sort=True)["revenue"].sum().reset_index())
+            product_ids = list(uniques)
+            product_names = {str(record["product_id"]): record["product_name"] for record in products}
+            named = np.array([product_id in product_names for product_id in product_ids], dtype=bool)
+        with self.lock:
+            self.product_ids = product_ids
+            self.product_codes = {product_id: code for code, product_id in enumerate(self.product_ids)}
+            self.product_names = product_names
+            self.named = named
+            self.missed_inserts = inserts is not None and inserts != self.inserts
+            self.days = rollup["day"].to_numpy(dtype='int64')
+            self.codes = rollup["code"].to_numpy(dtype='int64')
+            self.revenue = rollup["revenue"].to_numpy(dtype='float64')
+            self.appended = []
+            self.generation = generation
+            self.loaded_at = time.monotonic()
+        logging.info(f"Sales rollup built: {len(self.days)} product-days, {len(self.product_ids)} products.")
+        return self
+
+    def record_inserted(self, table, records):
+        """Adds rows just written to 'sales' or 'products' (no-op until the rollup is first built)."""
+        if table not in ("sales", "products") or not records:
+            return
+        with self.lock:
+            if self.loaded_at is None:
+                return
+            if table == "products":
+                for record in records:
+                    product_id = str(record["product_id"])
+                    self.product_names[product_id] = record.get("product_name")
+                    if product_id in self.product_codes:
+                        self.named[self.product_codes[product_id]] = True
+                return
+            self.inserts += 1
+            days = _day_numbers([record.get("date") for record in records])
+            codes = np.array([self._code(str(record.get("product_id"))) for record in records], dtype='int64')
+            revenue = pd.to_numeric(pd.Series([record.get("revenue") for record in records]), errors='coerce').fillna(0).to_numpy()
+            valid = days != np.datetime64('NaT').astype('int64')
+            self.appended.append((days[valid], codes[valid], revenue[valid]))
+
+    def record_deleted(self, table, records):
+        """Notes that 'sales' rows were deleted: the rollup is rebuilt before it is next read."""
+        if table != "sales" or not records:
+            return
+        with self.lock:
+            self.inserts += 1
+            self.missed_inserts = True
+
+    def advance_generation(self, previous, current):
+        """Our own upload started `current`; the rollup already holds its rows if it was in sync before."""
+        with self.lock:
+            if self.generation is not None and self.generation == previous:
+                self.generation = current
+
+    def _merge_appended(self):
+        if not self.appended:
+            return
+        days = np.concatenate([self.days] + [chunk[0] for chunk in self.appended])
+        codes = np.concatenate([self.codes] + [chunk[1] for chunk in self.appended])
+        revenue = np.concatenate([self.revenue] + [chunk[2] for chunk in self.appended])
+        order = np.argsort(days, kind='stable')
+        # Repeated product-days are fine: bincount sums them
+        self.days, self.codes, self.revenue = days[order], codes[order], revenue[order]
+        self.appended = []
+
+    def top_products(self, limit=5, start_date=None, end_date=None):
+        """[{product_name, sales}] for the `limit` highest-revenue products in the range, highest first."""
+        self._ensure_fresh()
+        with self.lock:
+            with pipeline_stage("rank"):
+                self._merge_appended()
+                low = np.searchsorted(self.days, _day_numbers([start_date])[0], 'left') if start_date else 0
+                high = np.searchsorted(self.days, _day_numbers([end_date])[0], 'right') if end_date else len(self.days)
+                codes = self.codes[low:high]
+                totals = np.bincount(codes, weights=self.revenue[low:high], minlength=len(self.product_ids))
+                sold = np.bincount(codes, minlength=len(self.product_ids)) > 0
+                # Like the old inner join with products: products without a name are left out
+                candidates = np.flatnonzero(sold & self.named)
+                if limit < len(candidates):
+                    candidates = candidates[np.argpartition(-totals[candidates], limit - 1)[:limit]]
+                candidates = candidates[np.argsort(-totals[candidates], kind='stable')]
+                return [{"product_name": self.product_names[self.product_ids[code]], "sales": round(float(totals[code]), 2)}
+                        for code in candidates]
+
+    def monthly_revenue(self):
+        """
+        (product_ids, product_names, first_month, matrix): revenue per product (rows, in product_ids
+        order) per calendar month (columns, starting at first_month as months since 1970-01).
+        """
+        self._ensure_fresh()
+        with self.lock:
+            with pipeline_stage("aggregate"):
+                self._merge_appended()
+                product_ids, product_names = list(self.product_ids), dict(self.product_names)
+                if not len(self.days):
+                    return product_ids, product_names, 0, np.zeros((len(product_ids), 0))
+                months = self.days.astype('datetime64[D]').astype('datetime64[M]').astype('int64')
+                # self.days is sorted, so the first and last entries bound the month range
+                first_month, n_months = int(months[0]), int(months[-1] - months[0]) + 1
+                flat = np.bincount(self.codes * n_months + (months - first_month), weights=self.revenue,
+                                   minlength=len(product_ids) * n_months)
+                return product_ids, product_names, first_month, flat.reshape(len(product_ids), n_months)
+
+sales_rollup = SalesRollup()
+
 @app.route('/api/sales/summary')
 @verify_token
 def sales_summary():
@@ -333,11 +1330,23 @@ def sales_summary():
 @app.route('/api/sales/top')
 @cross_origin() # Explicitly allow CORS for this route
 @verify_token
+@profile_on_request
 def sales_top():
-    """API endpoint to get the top products by sales, with optional date filtering."""
+    """API endpoint to get the top products by sales, with optional date filtering and 'limit' (default 5)."""
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
-    top_products = fetch_top_products(start_date=start_date, end_date=end_date)
+    try:
+        limit = int(request.args.get('limit', 5))
+    except ValueError:
+        return jsonify({"error": "limit must be a positive integer."}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be a positive integer."}), 400
+
+    try:
+        top_products = fetch_top_products(limit=limit, start_date=start_date, end_date=end_date)
+    except SupabaseFetchError as e:
+        logging.error(f"Could not build the sales rollup: {e}")
+        return jsonify({"error": "Sales data is currently unavailable."}), 502
     return jsonify(top_products)
 
 @app.route('/api/tiktok/reach_summary')
@@ -363,6 +1372,124 @@ def tiktok_engagement_summary():
     total_engagement = (total_likes or 0) + (total_comments or 0) + (total_shares or 0)
     return jsonify({"total_tiktok_engagement": total_engagement})
 
+# --- Dashboard bundle ---
+# /api/dashboard replaces the dashboard page's fan-out (raw tiktokdata/facebookdata/salesdata
+# dumps, /api/sales/top, the summary endpoints): every source table is loaded at most once for the
+# requested range and the summary totals and monthly chart series are computed from that one load;
+# top products come from the sales rollup. Each section is cached on its own (through cached_analytics), so a request whose
+# sections are all cached loads nothing, and a platform switch only recomputes what depends on it.
+DASHBOARD_SECTIONS = ("summary", "chart_series", "top_products")
+DASHBOARD_TOP_PRODUCTS_LIMIT = 5
+
+class DashboardSources:
+    """Source tables for one dashboard request, each loaded on first use only."""
+    def __init__(self, start_date, end_date):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.frames = {}
+
+    def get(self, name):
+        if name not in self.frames:
+            columns = {"tiktokdata": TIKTOK_METRIC_COLUMNS, "facebookdata": FACEBOOK_METRIC_COLUMNS,
+                       "sales": SALES_REVENUE_COLUMNS}[name]
+            self.frames[name] = fetch_frame(name, columns, order="date.asc", start_date=self.start_date,
+                                            end_date=self.end_date, wire_format=ANALYTICS_WIRE_FORMAT)
+        return self.frames[name]
+
+    def social(self, platform_filter):
+        """[(platform, frame with date/reach/engagement)] for the platforms the filter includes."""
+        frames = []
+        if platform_filter in ('all', 'tiktok'):
+            tiktok = self.get("tiktokdata")
+            frames.append(("tiktok", pd.DataFrame({
+                "date": tiktok["date"], "reach": tiktok["views"],
+                "engagement": tiktok["likes"] + tiktok["comments"] + tiktok["shares"]})))
+        if platform_filter in ('all', 'facebook'):
+            facebook = self.get("facebookdata")
+            frames.append(("facebook", pd.DataFrame({
+                "date": facebook["date"], "reach": facebook["reach"],
+                "engagement": facebook["likes"] + facebook["comments"] + facebook["shares"]})))
+        return frames
+
+def compute_dashboard_summary(sources, platform_filter):
+    """Reach and engagement totals per platform and overall, plus total sales revenue."""
+    with pipeline_stage("aggregate"):
+        platforms = {name: {"reach": int(frame["reach"].sum()), "engagement": int(frame["engagement"].sum())}
+                     for name, frame in sources.social(platform_filter)}
+        return {
+            "total_reach": sum(totals["reach"] for totals in platforms.values()),
+            "total_engagement": sum(totals["engagement"] for totals in platforms.values()),
+            "total_sales": round(float(sources.get("sales")["revenue"].sum()), 2),
+            "platforms": platforms,
+        }, 200
+
+def compute_dashboard_chart_series(sources, platform_filter):
+    """Monthly reach, engagement and sales series (months as 'YYYY-MM', oldest first)."""
+    with pipeline_stage("aggregate"):
+        sales = sources.get("sales")
+        frames = [frame for _, frame in sources.social(platform_filter)]
+        frames.append(pd.DataFrame({"date": sales["date"], "sales": sales["revenue"]}))
+        combined = pd.concat(frames, ignore_index=True).dropna(subset=["date"])
+        monthly = (combined.groupby(combined["date"].dt.to_period("M"))[["reach", "engagement", "sales"]]
+                   .sum(min_count=0).sort_index())
+    with pipeline_stage("serialize"):
+        return {
+            "months": monthly.index.strftime("%Y-%m").tolist(),
+            "reach": monthly["reach"].astype("int64").tolist(),
+            "engagement": monthly["engagement"].astype("int64").tolist(),
+            "sales": monthly["sales"].round(2).tolist(),
+        }, 200
+
+def compute_dashboard_top_products(sources):
+    return fetch_top_products(limit=DASHBOARD_TOP_PRODUCTS_LIMIT, start_date=sources.start_date, end_date=sources.end_date), 200
+
+@app.route('/api/dashboard')
+@verify_token
+@profile_on_request
+def dashboard_bundle():
+    """
+    Everything the dashboard page shows, in one response.
+    Query params: start_date, end_date (YYYY-MM-DD, optional), platform ('all', 'tiktok' or 'facebook'),
+    sections (comma separated subset of summary, chart_series, top_products; default all).
+    Sales and top products ignore the platform filter, as on the page.
+    """
+    start_date_str = _normalize_date_param(request.args.get('start_date'))
+    end_date_str = _normalize_date_param(request.args.get('end_date'))
+    platform_filter = (request.args.get('platform') or 'all').strip().lower()
+    sections = [name.strip() for name in request.args.get('sections', ','.join(DASHBOARD_SECTIONS)).split(',') if name.strip()]
+
+    unknown = [name for name in sections if name not in DASHBOARD_SECTIONS]
+    if unknown:
+        return jsonify({"error": f"Unknown dashboard section(s): {', '.join(unknown)}."}), 400
+    if platform_filter not in ('all', 'tiktok', 'facebook'):
+        return jsonify({"error": "Platform must be 'all', 'tiktok' or 'facebook'."}), 400
+    for value in (start_date_str, end_date_str):
+        if value and not re.fullmatch(r"\d{4}-\d{2}-\d{2}", value):
+            return jsonify({"error": f"Invalid date '{value}'. Use YYYY-MM-DD."}), 400
+
+    sources = DashboardSources(start_date_str, end_date_str)
+    section_jobs = {
+        "summary": (("dashboard/summary", start_date_str, end_date_str, platform_filter),
+                    lambda: compute_dashboard_summary(sources, platform_filter)),
+        "chart_series": (("dashboard/chart_series", start_date_str, end_date_str, platform_filter),
+                         lambda: compute_dashboard_chart_series(sources, platform_filter)),
+        "top_products": (("dashboard/top_products", start_date_str, end_date_str),
+                         lambda: compute_dashboard_top_products(sources)),
+    }
+
+    response = {"start_date": start_date_str, "end_date": end_date_str, "platform": platform_filter, "errors": {}}
+    for name in sections:
+        key, compute = section_jobs[name]
+        try:
+            response[name], _ = cached_analytics(key, compute)
+        except Exception as e:
+            # One failing section should not blank the whole dashboard: it comes back as null with its
+            # message under "errors", and the request still succeeds so the other sections get drawn
+            logging.error(f"Dashboard section {name} failed: {e}", exc_info=True)
+            response[name] = None
+            response["errors"][name] = str(e)
+    return jsonify(response), 200
+
 
 # Decorator to require admin privileges for certain API routes
 def admin_required(f):
@@ -376,6 +1503,12 @@ def admin_required(f):
         decoded_token = request.current_user
         uid = decoded_token['uid']
 
+        if decoded_token.get('test_token'):
+            # Test tokens carry their admin flag directly (only possible with SCAPE_TEST_AUTH=1)
+            if decoded_token.get('admin'):
+                return f(*args, **kwargs)
+            return jsonify({'error': 'Admin privileges required!'}), 403
+
         try:
             user = auth.get_user(uid)
             if user.custom_claims and user.custom_claims.get('admin'):
@@ -470,50 +1603,77 @@ def delete_user(uid):
         logging.error(f"Error deleting user {uid}: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 400
 
-@app.route('/api/upload-data', methods=['POST'])
-@verify_token # It's good practice to protect upload routes
-def upload_data():
-    """
-    Handles file uploads for Facebook, TikTok, or Sales data.
-    Supports CSV, Excel (.xlsx, .xls), and JSON file formats.
-    Normalizes Sales data into 'products' and 'sales' tables.
-    """
-    try:
-        app_name = request.form.get("app")
-        file = request.files.get("file")
+class UploadError(Exception):
+    """Raised while parsing or normalizing an upload; carries the HTTP status to respond with."""
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
 
-        if not app_name or not file:
-            return jsonify({"message": "App name and file are required."}), 400
+UPLOAD_COMPRESSION_SUFFIXES = {'.gz': 'gzip', '.zst': 'zstd', '.zstd': 'zstd'}
+SUPPORTED_UPLOAD_TYPES = "CSV, Excel (.xlsx, .xls), JSON, Parquet, and gzip/zstd-compressed CSV or JSON (.csv.gz, .json.zst, ...)"
 
-        df = None
-        file_content = file.read()
+def _decompressing_stream(file_obj, compression):
+    """Wraps a binary file object so it is decompressed incrementally as it is read."""
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=file_obj, mode='rb')
+    try:
+        import zstandard
+    except ImportError:
+        raise UploadError("zstd-compressed uploads require the 'zstandard' package on the server.", 500)
+    return zstandard.ZstdDecompressor().stream_reader(file_obj)
 
-        if file.filename.lower().endswith('.csv'):
-            try:
-                df = pd.read_csv(io.StringIO(file_content.decode("utf-8")))
-            except Exception as e:
-                return jsonify({"message": f"Error reading CSV file: {str(e)}"}), 400
-        elif file.filename.lower().endswith(('.xlsx', '.xls')):
-            try:
-                df = pd.read_excel(io.BytesIO(file_content))
-            except Exception as e:
-                return jsonify({"message": f"Error reading Excel file: {str(e)}. "
-                                         "Ensure 'openpyxl' and 'xlrd' libraries are installed."}), 400
-        elif file.filename.lower().endswith('.json'):
-            try:
-                df = pd.read_json(io.StringIO(file_content.decode("utf-8")))
-            except Exception as e:
-                return jsonify({"message": f"Error reading JSON file: {str(e)}. "
-                                         "Ensure JSON is a flat structure (list of records/objects)."}), 400
-        else:
-            return jsonify({"message": "Unsupported file type. Only CSV, Excel (.xlsx, .xls), and JSON files are supported."}), 400
+def read_upload_file(filename, file_content):
+    """
+    Parses an uploaded file into a DataFrame based on its extension.
+    Supports CSV, Excel (.xlsx, .xls), JSON and Parquet files, and gzip (.gz) or zstd (.zst) compressed
+    CSV and JSON. `file_content` is either bytes or a binary file object; compressed files are
+    decompressed as they are parsed rather than into a second buffer.
+    """
+    lower_name = filename.lower()
+    file_obj = io.BytesIO(file_content) if isinstance(file_content, (bytes, bytearray)) else file_content
 
-        if df is None:
-            return jsonify({"message": "Failed to load file into DataFrame. Please check file content."}), 500
+    compression = next((kind for suffix, kind in UPLOAD_COMPRESSION_SUFFIXES.items() if lower_name.endswith(suffix)), None)
+    if compression:
+        lower_name = lower_name.rsplit('.', 1)[0]
+        if not lower_name.endswith(('.csv', '.json')):
+            raise UploadError(f"Only CSV and JSON files can be uploaded {compression}-compressed.")
+        file_obj = _decompressing_stream(file_obj, compression)
+
+    if lower_name.endswith('.csv'):
+        try:
+            return pd.read_csv(file_obj, encoding="utf-8")
+        except Exception as e:
+            raise UploadError(f"Error reading CSV file: {str(e)}")
+    elif lower_name.endswith(('.xlsx', '.xls')):
+        try:
+            return pd.read_excel(file_obj)
+        except Exception as e:
+            raise UploadError(f"Error reading Excel file: {str(e)}. "
+                              "Ensure 'openpyxl' and 'xlrd' libraries are installed.")
+    elif lower_name.endswith('.json'):
+        try:
+            return pd.read_json(io.TextIOWrapper(file_obj, encoding="utf-8"))
+        except Exception as e:
+            raise UploadError(f"Error reading JSON file: {str(e)}. "
+                              "Ensure JSON is a flat structure (list of records/objects).")
+    elif lower_name.endswith('.parquet'):
+        try:
+            return pd.read_parquet(file_obj)
+        except Exception as e:
+            raise UploadError(f"Error reading Parquet file: {str(e)}. Ensure the 'pyarrow' library is installed.")
+    raise UploadError(f"Unsupported file type. Only {SUPPORTED_UPLOAD_TYPES} files are supported.")
 
-        # Log columns immediately after initial load and normalization
-        logging.info(f"DataFrame columns after initial load and normalization: {df.columns.tolist()}")
+def prepare_upload_tables(df, app_name):
+    """
+    Validates and normalizes an uploaded DataFrame for the given app ('facebook', 'tiktok' or 'sales').
+    Normalizes Sales data into 'products' and 'sales' tables.
+    Returns {table_name: records} ready to insert into Supabase. Raises UploadError on invalid input.
+    """
+    # Log columns immediately after initial load and normalization
+    logging.info(f"DataFrame columns after initial load and normalization: {df.columns.tolist()}")
 
+    with pipeline_stage("coerce"):
         df.columns = df.columns.str.strip().str.lower()
 
         if 'date' in df.columns:
@@ -521,34 +1681,35 @@ def upload_data():
                 df['date'] = pd.to_datetime(df['date']).dt.date
                 df['date'] = df['date'].astype(str)
             except Exception as e:
-                return jsonify({"message": f"Error parsing 'date' column: {str(e)}. "
-                                         "Please ensure dates are in a recognizable format (e.g.,YYYY-MM-DD)."}), 400
+                raise UploadError(f"Error parsing 'date' column: {str(e)}. "
+                                  "Please ensure dates are in a recognizable format (e.g.,YYYY-MM-DD).")
+    
+    target_tables = {}
+    if app_name.lower() == "facebook":
+        table_name = "facebookdata"
+        required_columns = {'date', 'likes', 'comments', 'shares', 'reach'}
         
-        target_tables = {}
-        if app_name.lower() == "facebook":
-            table_name = "facebookdata"
-            required_columns = {'date', 'likes', 'comments', 'shares', 'reach'}
-            
-            logging.info(f"Facebook: DataFrame head before specific processing: {df.head().to_dict(orient='records')}")
+        logging.info(f"Facebook: DataFrame head before specific processing: {df.head().to_dict(orient='records')}")
 
-            if not required_columns.issubset(df.columns):
-                missing_cols = list(required_columns - set(df.columns))
-                return jsonify({"message": f"Missing required Facebook columns: {', '.join(missing_cols)}. Expected: {', '.join(sorted(list(required_columns)))}"}), 400
+        if not required_columns.issubset(df.columns):
+            missing_cols = list(required_columns - set(df.columns))
+            raise UploadError(f"Missing required Facebook columns: {', '.join(missing_cols)}. Expected: {', '.join(sorted(list(required_columns)))}")
 
-            if 'post_id' in df.columns:
-                required_columns.add('post_id')
-            elif 'post_url' in df.columns:
-                required_columns.add('post_url')
-            else:
-                df['post_id'] = [str(uuid.uuid4()) for _ in range(len(df))]
-                required_columns.add('post_id')
-            
-            deduplication_subset = ['date']
-            if 'post_id' in df.columns:
-                deduplication_subset.append('post_id')
-            elif 'post_url' in df.columns:
-                deduplication_subset.append('post_url')
-            
+        if 'post_id' in df.columns:
+            required_columns.add('post_id')
+        elif 'post_url' in df.columns:
+            required_columns.add('post_url')
+        else:
+            df['post_id'] = [str(uuid.uuid4()) for _ in range(len(df))]
+            required_columns.add('post_id')
+        
+        deduplication_subset = ['date']
+        if 'post_id' in df.columns:
+            deduplication_subset.append('post_id')
+        elif 'post_url' in df.columns:
+            deduplication_subset.append('post_url')
+        
+        with pipeline_stage("coerce"):
             for col in ['likes', 'comments', 'shares', 'reach']:
                 if col in df.columns:
                     if not pd.api.types.is_numeric_dtype(df[col]):
@@ -559,23 +1720,26 @@ def upload_data():
                     logging.info(f"Facebook: Column '{col}' after numeric conversion (first 5 values): {df[col].head(5).tolist()}")
 
 
+        with pipeline_stage("aggregate"):
             df.drop_duplicates(subset=deduplication_subset, keep='last', inplace=True)
 
+        with pipeline_stage("serialize"):
             df_to_upload = df[list(required_columns)]
             records = df_to_upload.to_dict(orient='records')
-            logging.info(f"Facebook data prepared for upload (final records to Supabase): {records}") # Debug log
-            target_tables = {table_name: records}
+        logging.info(f"Facebook data prepared for upload (final records to Supabase): {records}") # Debug log
+        target_tables = {table_name: records}
 
-        elif app_name.lower() == "tiktok":
-            table_name = "tiktokdata"
-            required_columns = {'date', 'views', 'likes', 'comments', 'shares'}
-            
-            logging.info(f"TikTok: DataFrame head before specific processing: {df.head().to_dict(orient='records')}")
+    elif app_name.lower() == "tiktok":
+        table_name = "tiktokdata"
+        required_columns = {'date', 'views', 'likes', 'comments', 'shares'}
+        
+        logging.info(f"TikTok: DataFrame head before specific processing: {df.head().to_dict(orient='records')}")
 
-            if not required_columns.issubset(df.columns):
-                missing_cols = list(required_columns - set(df.columns))
-                return jsonify({"message": f"Missing required TikTok columns: {', '.join(missing_cols)}. Expected: {', '.join(sorted(list(required_columns)))}"}), 400
+        if not required_columns.issubset(df.columns):
+            missing_cols = list(required_columns - set(df.columns))
+            raise UploadError(f"Missing required TikTok columns: {', '.join(missing_cols)}. Expected: {', '.join(sorted(list(required_columns)))}")
 
+        with pipeline_stage("coerce"):
             for col in ['views', 'likes', 'comments', 'shares']:
                 if col in df.columns:
                     if not pd.api.types.is_numeric_dtype(df[col]):
@@ -586,6 +1750,7 @@ def upload_data():
                     logging.info(f"TikTok: Column '{col}' after numeric conversion (first 5 values): {df[col].head(5).tolist()}")
 
 
+        with pipeline_stage("aggregate"):
             df = df.groupby('date').agg(
                 views=('views', 'sum'),
                 likes=('likes', 'sum'),
@@ -593,44 +1758,45 @@ def upload_data():
                 shares=('shares', 'sum')
             ).reset_index()
 
-            for col in ['views', 'likes', 'comments', 'shares']:
-                if col not in df.columns:
-                    df[col] = 0
+        for col in ['views', 'likes', 'comments', 'shares']:
+            if col not in df.columns:
+                df[col] = 0
 
+        with pipeline_stage("serialize"):
             df_to_upload = df[list(required_columns)]
             records = df_to_upload.to_dict(orient='records')
-            logging.info(f"TikTok data prepared for upload (final records to Supabase): {records}") # Debug log
-            target_tables = {table_name: records}
-
-        elif app_name.lower() == "sales": 
-            products_table_name = "products"
-            sales_table_name = "sales"
+        logging.info(f"TikTok data prepared for upload (final records to Supabase): {records}") # Debug log
+        target_tables = {table_name: records}
 
-            required_sales_columns = {'date', 'product id', 'product name', 'quantity sold', 'price', 'revenue'}
-            
-            if not required_sales_columns.issubset(df.columns):
-                missing_columns = list(required_sales_columns - set(df.columns))
-                return jsonify({
-                    "message": f"Missing required columns for Sales data. "
-                               f"Expected: {sorted(list(required_sales_columns))}. Missing: {sorted(missing_columns)}."
-                }), 400
-
-            df.rename(columns={
-                'product id': 'product_id',
-                'product name': 'product_name',
-                'quantity sold': 'quantity',
-                'price': 'price_per_unit'
-            }, inplace=True)
+    elif app_name.lower() == "sales": 
+        products_table_name = "products"
+        sales_table_name = "sales"
 
+        required_sales_columns = {'date', 'product id', 'product name', 'quantity sold', 'price', 'revenue'}
+        
+        if not required_sales_columns.issubset(df.columns):
+            missing_columns = list(required_sales_columns - set(df.columns))
+            raise UploadError(f"Missing required columns for Sales data. "
+                              f"Expected: {sorted(list(required_sales_columns))}. Missing: {sorted(missing_columns)}.")
+
+        df.rename(columns={
+            'product id': 'product_id',
+            'product name': 'product_name',
+            'quantity sold': 'quantity',
+            'price': 'price_per_unit'
+        }, inplace=True)
+
+        with pipeline_stage("coerce"):
             for col in ['quantity', 'price_per_unit', 'revenue']:
                 if col in df.columns:
                     df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0) 
 
-            if 'revenue' in df.columns:
-                df['total_price'] = df['revenue']
-            else:
-                df['total_price'] = df['quantity'] * df['price_per_unit']
+        if 'revenue' in df.columns:
+            df['total_price'] = df['revenue']
+        else:
+            df['total_price'] = df['quantity'] * df['price_per_unit']
 
+        with pipeline_stage("aggregate"):
             if 'product_id' in df.columns:
                 products_df = df[['product_id', 'product_name']].drop_duplicates().copy()
                 products_df['product_id'] = products_df['product_id'].astype(str)
@@ -642,15 +1808,17 @@ def upload_data():
 
                 products_df = unique_products
 
+        with pipeline_stage("serialize"):
             products_records = products_df[['product_id', 'product_name']].to_dict(orient='records')
-            logging.info(f"Products records for upload: {products_records}")
+        logging.info(f"Products records for upload: {products_records}")
 
-            sales_df = df.copy()
-            sales_df['sale_id'] = [str(uuid.uuid4()) for _ in range(len(sales_df))]
+        sales_df = df.copy()
+        sales_df['sale_id'] = [str(uuid.uuid4()) for _ in range(len(sales_df))]
 
-            if 'product_id' not in sales_df.columns:
-                return jsonify({"message": "Internal error: product_id not generated/mapped for sales data."}), 500
+        if 'product_id' not in sales_df.columns:
+            raise UploadError("Internal error: product_id not generated/mapped for sales data.", 500)
 
+        with pipeline_stage("serialize"):
             sales_records = sales_df.rename(columns={
                 'price_per_unit': 'price',
                 'total_price': 'revenue',
@@ -658,112 +1826,1130 @@ def upload_data():
             })[[
                 'sale_id', 'product_id', 'date', 'quantity_sold', 'price', 'revenue'
             ]].to_dict(orient='records')
-            logging.info(f"Sales records for upload: {sales_records}")
-
-            target_tables = {
-                products_table_name: products_records,
-                sales_table_name: sales_records
-            }
-
-        else:
-            return jsonify({"message": f"Unsupported app name provided: '{app_name}'. "
-                                      "Please select 'Facebook', 'TikTok', or 'Sales'."}), 400
+        logging.info(f"Sales records for upload: {sales_records}")
 
-        upload_messages = []
-        for tbl_name, records in target_tables.items():
-            if not records:
-                upload_messages.append(f"No data to upload for table: {tbl_name}.")
-                continue
+        target_tables = {
+            products_table_name: products_records,
+            sales_table_name: sales_records
+        }
 
-            url = f"{SUPABASE_URL}/rest/v1/{tbl_name}"
-            supabase_headers = HEADERS.copy()
-            
-            if tbl_name == "products":
-                supabase_headers["Prefer"] = "resolution=merge-duplicates"
-            else:
-                if "Prefer" in supabase_headers:
-                    del supabase_headers["Prefer"]
+    else:
+        raise UploadError(f"Unsupported app name provided: '{app_name}'. "
+                          "Please select 'Facebook', 'TikTok', or 'Sales'.")
 
-            logging.info(f"Attempting to upload to {tbl_name} with {len(records)} records.")
-            response = requests.post(url, headers=supabase_headers, json=records)
+    return target_tables
 
-            if response.status_code in [200, 201, 204]:
-                upload_messages.append(f"'{tbl_name}' data uploaded successfully.")
-            else:
-                supabase_error_detail = f"Supabase returned status {response.status_code}."
-                try:
-                    error_data = response.json()
-                    if 'message' in error_data:
-                        supabase_error_detail = error_data['message']
-                    elif 'error' in error_data:
-                        supabase_error_detail = error_data['error']
-                    else:
-                        supabase_error_detail = str(error_data)
-                except ValueError:
-                    supabase_error_detail = response.text
-                
-                upload_messages.append(f"'{tbl_name}' upload failed: {supabase_error_detail}")
-                return jsonify({"message": "; ".join(upload_messages)}), response.status_code
+def insert_upload_tables(target_tables):
+    """
+    Inserts prepared upload records into their Supabase tables, in order.
+    Returns (upload_messages, status_code); stops at the first failing table.
+    """
+    upload_messages = []
+    for tbl_name, records in target_tables.items():
+        if not records:
+            upload_messages.append(f"No data to upload for table: {tbl_name}.")
+            continue
 
-        return jsonify({"message": "; ".join(upload_messages)}), 200
+        status_code, supabase_error_detail = post_table_records(tbl_name, records)
+        if supabase_error_detail is None:
+            upload_messages.append(f"'{tbl_name}' data uploaded successfully.")
+        else:
+            upload_messages.append(f"'{tbl_name}' upload failed: {supabase_error_detail}")
+            return upload_messages, status_code
 
-    except Exception as e:
-        return jsonify({"message": f"Server error during file upload processing: {str(e)}"}), 500
+    return upload_messages, 200
 
-# NEW API ENDPOINT FOR PERFORMANCE DATA
-@app.route('/api/performance-data', methods=['GET'])
-@verify_token
-def performance_data():
+def post_table_records(tbl_name, records):
     """
-    API endpoint for aggregated historical performance data for charts (not predictive).
-    Fetches historical data for engagement, reach, and aggregates them dynamically
-    (daily, weekly, or monthly) based on the date range, and filters by platform.
+    Writes one batch of records to a Supabase table. Products are upserted on their key. In tables
+    with REPLACE_KEYS, the rows already stored under the batch's keys are deleted first, so the batch
+    replaces them instead of being added next to them; if the insert then fails they are put back.
+    Returns (status_code, error_detail), with error_detail None on success.
     """
-    start_date_str = request.args.get('start_date')
-    end_date_str = request.args.get('end_date')
-    platform_filter = request.args.get('platform', 'all')
+    keys = {key for key in (replace_key(tbl_name, record) for record in records) if key is not None}
+    deleted = []
+    if keys:
+        status_code, error_detail, deleted = _delete_records_by_key(tbl_name, keys)
+        if error_detail is None:
+            status_code, error_detail = _post_records(tbl_name, records)
+        if error_detail is not None and deleted:
+            logging.error(f"Writing '{tbl_name}' failed after replacing {len(deleted)} stored row(s); restoring them.")
+            if _post_records(tbl_name, deleted)[1] is not None:
+                logging.error(f"Could not restore {len(deleted)} deleted '{tbl_name}' row(s): {deleted}")
+        return status_code, error_detail
+    return _post_records(tbl_name, records, upsert=tbl_name == "products")
+
+def _post_records(tbl_name, records, upsert=False):
+    url = f"{SUPABASE_URL}/rest/v1/{tbl_name}"
+    supabase_headers = HEADERS.copy()
+    
+    if upsert:
+        supabase_headers["Prefer"] = "resolution=merge-duplicates"
+    else:
+        if "Prefer" in supabase_headers:
+            del supabase_headers["Prefer"]
 
-    try:
-        # Convert date strings to datetime objects to calculate date range difference
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d') if start_date_str else None
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d') if end_date_str else None
+    logging.info(f"Attempting to {'upsert' if upsert else 'upload'} to {tbl_name} with {len(records)} records.")
+    response = requests.post(url, headers=supabase_headers, json=records)
 
-        # Determine resampling frequency based on date range
-        freq = 'MS' # Default to Month Start
-        date_format = '%Y-%m-%d' # Default date format for output, will be adjusted
-        
-        if start_date and end_date:
-            delta = end_date - start_date
-            if delta <= timedelta(days=30): # Up to 30 days, show daily
-                freq = 'D'
-                date_format = '%Y-%m-%d'
-            elif delta <= timedelta(days=90): # 31 to 90 days, show weekly
-                freq = 'W'
-                date_format = '%Y-%m-%d' # Keep full date for weekly points, frontend can format to 'Week X, YY-MM-DD'
-            else: # More than 90 days, show monthly
-                freq = 'MS'
-                date_format = '%Y-%m' # Format to Year-Month for monthly aggregation
-        
-        logging.info(f"Calculated frequency for performance data: {freq} with date format: {date_format}")
+    if response.status_code in [200, 201, 204]:
+        if UPLOAD_SKIP_UNCHANGED_ROWS and tbl_name in ROW_HASH_COLUMNS:
+            row_hash_index.add(tbl_name, records)
+        sales_rollup.record_inserted(tbl_name, records)
+        return response.status_code, None
+    return response.status_code, _supabase_error_detail(response)
 
-        # Fetch data based on filters
-        # IMPORTANT: fetch_table now handles pagination internally when limit is None
-        tiktok_records = fetch_table("tiktokdata", select="date,views,likes,comments,shares",
-                                     start_date=start_date_str, end_date=end_date_str, limit=None)
-        facebook_records = fetch_table("facebookdata", select="date,likes,comments,shares,reach",
-                                       start_date=start_date_str, end_date=end_date_str, limit=None)
-        sales_records = fetch_table("sales", select="date,revenue",
-                                    start_date=start_date_str, end_date=end_date_str, limit=None)
+def _delete_records_by_key(tbl_name, keys):
+    """
+    Deletes the stored rows under the given REPLACE_KEYS key tuples, one request per value of the
+    leading key columns (e.g. per date) and up to REPLACE_DELETE_CHUNK values of the last one.
+    Returns (status_code, error_detail, deleted rows); rows deleted before a failure are included.
+    """
+    columns = REPLACE_KEYS[tbl_name]
+    last_values = {}
+    for key in keys:
+        last_values.setdefault(key[:-1], []).append(key[-1])
+    supabase_headers = HEADERS.copy()
+    supabase_headers["Prefer"] = "return=representation" # The deleted rows, to restore them if the insert fails
+    deleted, status_code = [], 204
+    for prefix, values in last_values.items():
+        values = sorted(values, key=str)
+        for i in range(0, len(values), REPLACE_DELETE_CHUNK):
+            filters = [f"{column}=eq.{urllib.parse.quote(str(value))}" for column, value in zip(columns, prefix)]
+            in_list = ",".join(_postgrest_quote(value) for value in values[i:i + REPLACE_DELETE_CHUNK])
+            filters.append(f"{columns[-1]}=in.({urllib.parse.quote(in_list)})")
+            response = requests.delete(f"{SUPABASE_URL}/rest/v1/{tbl_name}?{'&'.join(filters)}", headers=supabase_headers)
+            status_code = response.status_code
+            if status_code not in [200, 204]:
+                return status_code, _supabase_error_detail(response), deleted
+            rows = response.json() if response.content else []
+            deleted.extend(rows)
+            if rows:
+                # The index no longer matches what is stored on these dates; they are reloaded when next needed
+                row_hash_index.forget(tbl_name, {_record_date(row) for row in rows})
+                sales_rollup.record_deleted(tbl_name, rows)
+    if deleted:
+        logging.info(f"Replacing {len(deleted)} stored '{tbl_name}' row(s) under {len(keys)} key(s).")
+    return status_code, None, deleted
+
+def _postgrest_quote(value):
+    """A value for a PostgREST in.(...) list, double-quoted so commas and parentheses in it are literal."""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def _supabase_error_detail(response):
+    supabase_error_detail = f"Supabase returned status {response.status_code}."
+    try:
+        error_data = response.json()
+        if 'message' in error_data:
+            supabase_error_detail = error_data['message']
+        elif 'error' in error_data:
+            supabase_error_detail = error_data['error']
+        else:
+            supabase_error_detail = str(error_data)
+    except ValueError:
+        supabase_error_detail = response.text
+    return supabase_error_detail
+
+# --- Upload change detection ---
+# Users re-upload overlapping exports (e.g. the last 90 days, every week). Every dated row gets a
+# content hash (its date plus the columns in ROW_HASH_COLUMNS; generated ids like sale_id and
+# post_id are left out, since they are minted fresh on every upload), and a local SQLite index holds
+# how many rows with each hash Supabase already stores per date. Uploaded rows whose hash is
+# already stored are skipped; new or changed rows are written as before. The index covers a date
+# once it has been loaded from Supabase and is reloaded after UPLOAD_HASH_INDEX_TTL_SECONDS, so rows
+# edited or deleted outside the app are noticed. Inserts made through post_table_records are added
+# to it as they succeed. Matching is by count, so a file that really has two identical sales on one
+# day keeps both when only one is stored.
+# A new or changed row replaces what is stored under its key in REPLACE_KEYS (a TikTok day, a
+# Facebook post on a day, a product's sales on a day) rather than being added next to it: an upload
+# is the truth for the keys it covers. RowChangeFilter keeps all of an upload's rows for a key as
+# soon as one of them is new or changed, and post_table_records deletes the stored rows under those
+# keys before inserting them (plain DELETE and INSERT requests, so no unique index is needed). Rows
+# missing part of their key (e.g. Facebook rows without a post_url) are only ever inserted.
+UPLOAD_SKIP_UNCHANGED_ROWS = os.environ.get("UPLOAD_SKIP_UNCHANGED_ROWS", "1") != "0"
+UPLOAD_HASH_INDEX_PATH = os.environ.get("UPLOAD_HASH_INDEX_PATH", "upload_row_hashes.sqlite3")
+UPLOAD_HASH_INDEX_TTL_SECONDS = float(os.environ.get("UPLOAD_HASH_INDEX_TTL_SECONDS", 3600))
+ROW_HASH_COLUMNS = {
+    "tiktokdata": ["views", "likes", "comments", "shares"],
+    "facebookdata": ["post_url", "likes", "comments", "shares", "reach"],
+    "sales": ["product_id", "quantity_sold", "price", "revenue"],
+}
+REPLACE_KEYS = {"tiktokdata": ["date"], "facebookdata": ["date", "post_url"], "sales": ["date", "product_id"]}
+REPLACE_DELETE_CHUNK = 100 # Key values per DELETE request, keeping URLs short
+ROW_HASH_ORDER = {"sales": "date.asc,sale_id.asc"} # Stable paging order while loading the index; default date.asc
+
+def _canonical_hash_value(value):
+    """Spells a value the same way whether it came from an upload (12.0, 'P1') or Supabase (12, 'P1')."""
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    if isinstance(value, numbers.Real) and not isinstance(value, bool):
+        value = float(value)
+        return str(int(value)) if value.is_integer() else format(value, ".10g")
+    return str(value).strip()
+
+def _record_date(record):
+    value = record.get("date")
+    return str(value)[:10] if value else None
+
+def replace_key(table, record):
+    """The record's REPLACE_KEYS values as a tuple, or None if the table has none or one is missing."""
+    columns = REPLACE_KEYS.get(table)
+    if not columns:
+        return None
+    key = tuple(_record_date(record) if column == "date" else record.get(column) for column in columns)
+    return key if all(value not in (None, "") and value == value for value in key) else None
+
+def group_by_replace_key(table, records):
+    """records reordered so rows sharing a REPLACE_KEYS key are adjacent, keys in order of first appearance."""
+    if table not in REPLACE_KEYS:
+        return records
+    groups = {}
+    for position, record in enumerate(records):
+        groups.setdefault(replace_key(table, record) or (None, position), []).append(record)
+    return [record for group in groups.values() for record in group]
+
+def row_content_hash(table, record):
+    parts = [_record_date(record) or ""] + [_canonical_hash_value(record.get(column)) for column in ROW_HASH_COLUMNS[table]]
+    return hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+class RowHashIndex:
+    """SQLite index of content hash counts per (table, date) for rows already stored in Supabase."""
+    def __init__(self, path):
+        self.path = path
+        self.ready = False
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self.ready:
+            with self.lock, conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS row_hashes (tbl TEXT, date TEXT, content_hash TEXT, n INTEGER, "
+                             "PRIMARY KEY (tbl, date, content_hash))")
+                conn.execute("CREATE TABLE IF NOT EXISTS loaded_dates (tbl TEXT, date TEXT, loaded_at REAL, PRIMARY KEY (tbl, date))")
+                self.ready = True
+        return conn
+
+    def stored_counts(self, table, dates):
+        """{date: Counter(hash -> rows)} for the given dates, loading stale dates from Supabase first."""
+        dates = sorted(dates)
+        conn = self._connect()
+        try:
+            placeholders = ",".join("?" * len(dates))
+            fresh = {date for (date,) in conn.execute(
+                f"SELECT date FROM loaded_dates WHERE tbl = ? AND loaded_at >= ? AND date IN ({placeholders})",
+                [table, time.time() - UPLOAD_HASH_INDEX_TTL_SECONDS, *dates])}
+            stale = [date for date in dates if date not in fresh]
+            if stale:
+                self._load(conn, table, stale[0], stale[-1])
+
+            counts = {date: Counter() for date in dates}
+            for date, content_hash, n in conn.execute(
+                    f"SELECT date, content_hash, n FROM row_hashes WHERE tbl = ? AND date IN ({placeholders})", [table, *dates]):
+                counts[date][content_hash] = n
+            return counts
+        finally:
+            conn.close()
+
+    def _load(self, conn, table, start_date, end_date):
+        """Replaces the index for [start_date, end_date] with hashes of the rows Supabase holds now."""
+        loaded = Counter()
+        with pipeline_stage("supabase_fetch"):
+            for records, _, _ in _iter_table_pages(table, _decode_json_records, order=ROW_HASH_ORDER.get(table, "date.asc"),
+                                                   start_date=start_date, end_date=end_date):
+                loaded.update((_record_date(record), row_content_hash(table, record)) for record in records)
+
+        start, end = calendar_date.fromisoformat(start_date), calendar_date.fromisoformat(end_date)
+        loaded_at = time.time()
+        with conn:
+            conn.execute("DELETE FROM row_hashes WHERE tbl = ? AND date BETWEEN ? AND ?", (table, start_date, end_date))
+            conn.executemany("INSERT INTO row_hashes VALUES (?, ?, ?, ?)",
+                             [(table, date, content_hash, n) for (date, content_hash), n in loaded.items()])
+            conn.executemany("INSERT OR REPLACE INTO loaded_dates VALUES (?, ?, ?)",
+                             [(table, (start + timedelta(days=i)).isoformat(), loaded_at) for i in range((end - start).days + 1)])
+        logging.info(f"Row hash index: loaded {sum(loaded.values())} '{table}' rows for {start_date}..{end_date}.")
+
+    def add(self, table, records):
+        """Counts newly inserted rows. Dates not loaded yet are left alone; loading them picks the rows up."""
+        added = Counter((_record_date(record), row_content_hash(table, record)) for record in records if _record_date(record))
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO row_hashes SELECT ?, ?, ?, ? WHERE EXISTS "
+                        "(SELECT 1 FROM loaded_dates WHERE tbl = ? AND date = ?) "
+                        "ON CONFLICT (tbl, date, content_hash) DO UPDATE SET n = n + excluded.n",
+                        [(table, date, content_hash, n, table, date) for (date, content_hash), n in added.items()])
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logging.warning(f"Row hash index: could not record inserted '{table}' rows: {e}")
+
+    def forget(self, table, dates):
+        """Marks dates as not loaded, so their stored counts are read from Supabase again when next needed."""
+        dates = [date for date in dates if date]
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    for index_table in ("row_hashes", "loaded_dates"):
+                        conn.executemany(f"DELETE FROM {index_table} WHERE tbl = ? AND date = ?", [(table, date) for date in dates])
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logging.warning(f"Row hash index: could not forget '{table}' dates: {e}")
 
+row_hash_index = RowHashIndex(UPLOAD_HASH_INDEX_PATH)
 
-        df_tiktok = pd.DataFrame(tiktok_records)
-        df_facebook = pd.DataFrame(facebook_records)
-        df_sales = pd.DataFrame(sales_records)
+class RowChangeFilter:
+    """
+    Decides, for one upload, which prepared rows are already stored. Stored counts are read once per
+    date when the upload first reaches it, so rows this upload inserts itself (in earlier batches)
+    never cause its later identical rows to be skipped. A key's rows must all be in one call, since
+    one changed row makes its whole key be written.
+    """
+    def __init__(self, index=None):
+        self.index = index or row_hash_index
+        self.available = {} # (table, date) -> Counter(hash -> stored rows not yet matched)
 
+    def keep_mask(self, table, records):
+        """[True for rows to write, False for rows already stored]."""
+        if not UPLOAD_SKIP_UNCHANGED_ROWS or table not in ROW_HASH_COLUMNS:
+            return [True] * len(records)
 
-        # Process social media data for Engagement and Reach charts
-        combined_social_df = pd.DataFrame()
-        
+        new_dates = {date for date in map(_record_date, records) if date and (table, date) not in self.available}
+        if new_dates:
+            try:
+                for date, counts in self.index.stored_counts(table, new_dates).items():
+                    self.available[(table, date)] = counts
+            except (SupabaseFetchError, sqlite3.Error, ValueError) as e:
+                # Without the index every row is written, as uploads did before change detection
+                logging.warning(f"Row hash index unavailable for '{table}', writing all rows: {e}")
+                for date in new_dates:
+                    self.available[(table, date)] = Counter()
+
+        mask = []
+        for record in records:
+            remaining = self.available.get((table, _record_date(record)))
+            content_hash = row_content_hash(table, record) if remaining else None
+            if content_hash and remaining[content_hash] > 0:
+                remaining[content_hash] -= 1
+                mask.append(False)
+            else:
+                mask.append(True)
+        # Writing a key replaces all its stored rows, so its unchanged rows have to be written again too
+        changed = {replace_key(table, record) for record, keep in zip(records, mask) if keep} - {None}
+        if changed:
+            mask = [keep or replace_key(table, record) in changed for record, keep in zip(records, mask)]
+        return mask
+
+def skip_unchanged_rows(target_tables, change_filter=None):
+    """Drops rows that are already stored. Returns (target_tables, {table: rows skipped})."""
+    change_filter = change_filter or RowChangeFilter()
+    filtered, skipped = {}, {}
+    for table, records in target_tables.items():
+        mask = change_filter.keep_mask(table, records)
+        filtered[table] = [record for record, keep in zip(records, mask) if keep]
+        if len(filtered[table]) < len(records):
+            skipped[table] = len(records) - len(filtered[table])
+    return filtered, skipped
+
+@app.route('/api/upload-data', methods=['POST'])
+@verify_token # It's good practice to protect upload routes
+@profile_on_request
+def upload_data():
+    """
+    Handles file uploads for Facebook, TikTok, or Sales data.
+    Supports CSV, Excel (.xlsx, .xls), JSON and Parquet files, plus gzip/zstd-compressed CSV and JSON.
+    Normalizes Sales data into 'products' and 'sales' tables.
+    """
+    try:
+        app_name = request.form.get("app")
+        file = request.files.get("file")
+
+        if not app_name or not file:
+            return jsonify({"message": "App name and file are required."}), 400
+
+        try:
+            # Parse from the uploaded stream (spooled to disk by Werkzeug when large) instead of
+            # reading the whole file into memory first
+            df = read_upload_file(file.filename, file.stream)
+            if df is None:
+                return jsonify({"message": "Failed to load file into DataFrame. Please check file content."}), 500
+            target_tables = prepare_upload_tables(df, app_name)
+        except UploadError as e:
+            return jsonify({"message": e.message}), e.status_code
+
+        # Re-uploaded overlapping exports: only rows not already stored are written
+        target_tables, rows_skipped = skip_unchanged_rows(target_tables)
+        upload_messages, status_code = insert_upload_tables(target_tables)
+        if status_code in [200, 201] and any(target_tables.values()):
+            # New rows change every analytics result, so drop what was computed from the old data
+            invalidate_analytics_cache()
+        if rows_skipped:
+            upload_messages.append(f"Skipped {sum(rows_skipped.values())} unchanged row(s) already stored.")
+        return jsonify({"message": "; ".join(upload_messages), "rows_skipped": rows_skipped}), status_code
+
+    except Exception as e:
+        return jsonify({"message": f"Server error during file upload processing: {str(e)}"}), 500
+
+# --- Batch uploads ---
+# /api/upload-data/batch takes several files and/or zip archives in one request. Each file (and each
+# platform sheet of an Excel workbook) is parsed and normalized concurrently in a thread pool; the
+# prepared rows go through one BatchedTableWriter, which inserts them in fixed-size batches so a
+# year of exports costs a handful of large inserts instead of one request per file.
+UPLOAD_APPS = ("facebook", "tiktok", "sales")
+UPLOAD_APP_ALIASES = {"fb": "facebook", "tt": "tiktok"}
+UPLOAD_PARSE_WORKERS = int(os.environ.get("UPLOAD_PARSE_WORKERS", min(4, os.cpu_count() or 1)))
+UPLOAD_INSERT_BATCH_ROWS = int(os.environ.get("UPLOAD_INSERT_BATCH_ROWS", 5000))
+UPLOAD_TABLE_DEPENDENCIES = {"sales": ["products"]} # Tables that must be written before the key table
+UPLOAD_UPSERT_KEYS = {"products": "product_id"}
+_upload_pool = None
+_upload_pool_lock = threading.Lock()
+
+def get_upload_pool():
+    """Returns the shared upload parsing thread pool, creating it on first use."""
+    global _upload_pool
+    with _upload_pool_lock:
+        if _upload_pool is None:
+            _upload_pool = ThreadPoolExecutor(max_workers=UPLOAD_PARSE_WORKERS, thread_name_prefix="upload-parse")
+        return _upload_pool
+
+def detect_upload_app(name, default_app=None):
+    """Platform for a file or sheet: named in it (e.g. 'tiktok_2023.csv', sheet 'Facebook'), else default_app."""
+    tokens = [token for token in re.split(r"[^a-z]+", os.path.basename(name).lower()) if token]
+    for token in tokens:
+        token = UPLOAD_APP_ALIASES.get(token, token)
+        if token in UPLOAD_APPS:
+            return token
+    return default_app
+
+def expand_upload_files(files):
+    """
+    Turns uploaded files into [(source_name, filename, content)], opening zip archives into their
+    members. content is a stream for plain files and the member's bytes for zip members.
+    """
+    sources = []
+    for file in files:
+        if file.filename.lower().endswith('.zip'):
+            try:
+                archive = zipfile.ZipFile(file.stream)
+            except zipfile.BadZipFile as e:
+                raise UploadError(f"'{file.filename}' is not a valid zip archive: {e}")
+            for member in archive.infolist():
+                base_name = os.path.basename(member.filename)
+                # Skip folders and macOS resource forks / hidden files
+                if member.is_dir() or not base_name or base_name.startswith('.') or member.filename.startswith('__MACOSX/'):
+                    continue
+                sources.append((f"{file.filename}/{member.filename}", member.filename, archive.read(member)))
+        else:
+            sources.append((file.filename, file.filename, file.stream))
+    return sources
+
+def parse_upload_source(source_name, filename, content, default_app=None):
+    """
+    Parses and normalizes one uploaded file. Excel workbooks with sheets named after platforms yield
+    one part per such sheet. Returns [{"source", "app", "rows_parsed", "tables"}]; raises UploadError.
+    """
+    if filename.lower().endswith(('.xlsx', '.xls')):
+        try:
+            sheets = pd.read_excel(io.BytesIO(content) if isinstance(content, bytes) else content, sheet_name=None)
+        except Exception as e:
+            raise UploadError(f"Error reading Excel file: {str(e)}. "
+                              "Ensure 'openpyxl' and 'xlrd' libraries are installed.")
+        platform_sheets = {name: detect_upload_app(name) for name in sheets}
+        frames = [(f"{source_name}#{name}", app_name, sheets[name]) for name, app_name in platform_sheets.items() if app_name]
+        if not frames:
+            # No platform sheets: like /api/upload-data, use the first sheet
+            first_sheet = next(iter(sheets))
+            frames = [(source_name, detect_upload_app(filename, default_app), sheets[first_sheet])]
+    else:
+        frames = [(source_name, detect_upload_app(filename, default_app), read_upload_file(filename, content))]
+
+    parts = []
+    for part_source, app_name, df in frames:
+        if not app_name:
+            raise UploadError(f"Cannot tell which platform '{part_source}' is for. "
+                              "Name the file or sheet after facebook, tiktok or sales, or pass 'app'.")
+        parts.append({"source": part_source, "app": app_name, "rows_parsed": len(df),
+                      "tables": prepare_upload_tables(df, app_name)})
+    return parts
+
+class BatchedTableWriter:
+    """
+    Buffers prepared records per table across many files and inserts them UPLOAD_INSERT_BATCH_ROWS
+    at a time. Tables listed in UPLOAD_TABLE_DEPENDENCIES are flushed before their dependants, and
+    upsert batches are de-duplicated on their key. Each source's rows for a REPLACE_KEYS key are kept
+    together in one batch (a later batch would delete them again); a key that comes again from a
+    later source is replaced by it. Rows already stored (see RowChangeFilter) are skipped. Inserted
+    and skipped row counts and failures are attributed back to the source each row came from.
+    """
+    def __init__(self, batch_rows=UPLOAD_INSERT_BATCH_ROWS, skip_rows=None, on_batch=None):
+        """
+        skip_rows: {table: n} rows to drop from the start of each table's stream (already handled
+        by an earlier attempt). on_batch(table, rows, inserted_by_source, skipped_by_source, error_detail)
+        runs after every batch; rows counts the whole batch, written or skipped.
+        """
+        self.batch_rows = batch_rows
+        self.skip_rows = dict(skip_rows or {})
+        self.on_batch = on_batch
+        self.change_filter = RowChangeFilter()
+        self.pending = {} # table -> [(source, record)]
+        self.inserted = {} # source -> {table: rows}
+        self.skipped = {} # source -> {table: rows}
+        self.errors = {} # source -> [message]
+        self.lock = threading.RLock()
+
+    def add(self, source, tables):
+        with self.lock:
+            for table, records in tables.items():
+                records = group_by_replace_key(table, records)
+                skip = min(self.skip_rows.get(table, 0), len(records))
+                if skip:
+                    records = records[skip:]
+                    self.skip_rows[table] -= skip
+                self.pending.setdefault(table, []).extend((source, record) for record in records)
+            for table in list(self.pending):
+                while len(self.pending.get(table, [])) >= self.batch_rows:
+                    self._flush_table(table, self.batch_rows)
+
+    def flush(self):
+        with self.lock:
+            for table in list(self.pending):
+                while self.pending.get(table):
+                    self._flush_table(table, self.batch_rows)
+
+    def _flush_table(self, table, max_rows):
+        for dependency in UPLOAD_TABLE_DEPENDENCIES.get(table, []):
+            while self.pending.get(dependency):
+                self._flush_table(dependency, self.batch_rows)
+
+        pending, end = self.pending[table], max_rows
+        if table in REPLACE_KEYS:
+            while (0 < end < len(pending) and pending[end][0] == pending[end - 1][0]
+                   and replace_key(table, pending[end][1]) is not None
+                   and replace_key(table, pending[end][1]) == replace_key(table, pending[end - 1][1])):
+                end += 1
+        batch, self.pending[table] = pending[:end], pending[end:]
+        mask = self.change_filter.keep_mask(table, [record for _, record in batch])
+        to_write = [item for item, keep in zip(batch, mask) if keep]
+        skipped_by_source = Counter(source for (source, _), keep in zip(batch, mask) if not keep)
+        records = [record for _, record in to_write]
+        key = UPLOAD_UPSERT_KEYS.get(table)
+        if key:
+            # The same product may come from several files; one upsert cannot touch a row twice
+            records = list({record[key]: record for record in records}.values())
+
+        error_detail = post_table_records(table, records)[1] if records else None
+        inserted_by_source = Counter(source for source, _ in to_write)
+        for source, rows in skipped_by_source.items():
+            counts = self.skipped.setdefault(source, {})
+            counts[table] = counts.get(table, 0) + rows
+        for source, rows in inserted_by_source.items():
+            if error_detail is None:
+                counts = self.inserted.setdefault(source, {})
+                counts[table] = counts.get(table, 0) + rows
+            else:
+                self.errors.setdefault(source, []).append(f"'{table}' upload failed: {error_detail}")
+        if self.on_batch:
+            self.on_batch(table, len(batch), inserted_by_source, skipped_by_source, error_detail)
+
+@app.route('/api/upload-data/batch', methods=['POST'])
+@verify_token
+@profile_on_request
+def upload_data_batch():
+    """
+    Batch upload: several files (form field 'files', repeatable) and/or zip archives of files.
+    Excel workbooks may hold one sheet per platform. Each file's platform comes from its name or
+    sheet name, falling back to the optional 'app' form field. Responds with a per-file report.
+    """
+    try:
+        default_app = (request.form.get("app") or "").lower() or None
+        files = request.files.getlist("files") + request.files.getlist("file")
+        if not files:
+            return jsonify({"message": "At least one file is required."}), 400
+
+        try:
+            sources = expand_upload_files(files)
+        except UploadError as e:
+            return jsonify({"message": e.message}), e.status_code
+
+        reports = {source_name: {"source": source_name, "parts": [], "rows_parsed": 0, "errors": []}
+                   for source_name, _, _ in sources}
+        writer = BatchedTableWriter()
+        pool = get_upload_pool()
+        futures = {pool.submit(parse_upload_source, source_name, filename, content, default_app): source_name
+                   for source_name, filename, content in sources}
+        # Insert each file's rows as soon as it is parsed, while the other files are still parsing
+        for future in as_completed(futures):
+            report = reports[futures[future]]
+            try:
+                parts = future.result()
+            except UploadError as e:
+                report["errors"].append(e.message)
+                continue
+            except Exception as e:
+                logging.error(f"Failed to parse upload {futures[future]}: {e}", exc_info=True)
+                report["errors"].append(f"Server error while parsing file: {str(e)}")
+                continue
+            for part in parts:
+                report["parts"].append({"source": part["source"], "app": part["app"], "rows_parsed": part["rows_parsed"]})
+                report["rows_parsed"] += part["rows_parsed"]
+                writer.add(report["source"], part["tables"])
+        writer.flush()
+
+        rows_inserted = rows_skipped = 0
+        for report in reports.values():
+            report["rows_inserted"] = writer.inserted.get(report["source"], {})
+            report["rows_skipped"] = writer.skipped.get(report["source"], {})
+            report["errors"].extend(writer.errors.get(report["source"], []))
+            report["status"] = "error" if report["errors"] else "ok"
+            rows_inserted += sum(report["rows_inserted"].values())
+            rows_skipped += sum(report["rows_skipped"].values())
+
+        if rows_inserted:
+            invalidate_analytics_cache()
+
+        failed = [report for report in reports.values() if report["errors"]]
+        status_code = 200 if not failed else (207 if len(failed) < len(reports) else 400)
+        return jsonify({
+            "files": list(reports.values()),
+            "rows_parsed": sum(report["rows_parsed"] for report in reports.values()),
+            "rows_inserted": rows_inserted,
+            "rows_skipped": rows_skipped,
+            "message": f"{len(reports) - len(failed)} of {len(reports)} file(s) uploaded successfully."
+        }), status_code
+
+    except Exception as e:
+        logging.error(f"Server error during batch upload: {e}", exc_info=True)
+        return jsonify({"message": f"Server error during batch upload processing: {str(e)}"}), 500
+
+# --- Background ingest jobs ---
+# POST /api/upload-jobs stores the uploaded files under UPLOAD_JOB_DIR/<job_id>/ and answers 202 at
+# once; a small pool of worker threads parses and inserts them like the batch upload does, and
+# GET /api/upload-jobs/<job_id> reports progress from the job's job.json. The job file is rewritten
+# (atomically) after every insert batch with the number of rows of each table already written, so a
+# job interrupted by a restart is picked up again and skips those rows instead of inserting them
+# twice. Each running job holds an flock on its 'claim' file: the lock dies with the process, which
+# is how other workers (and the restarted server) know a 'running' job was orphaned. Claims only
+# coordinate processes on one host sharing UPLOAD_JOB_DIR.
+# Once a job has completed or failed its stored files are deleted; job.json stays readable for
+# UPLOAD_JOB_RETENTION_SECONDS after it finished and is then removed with the job's directory.
+# One scanner thread per process requeues orphaned jobs and removes expired ones every
+# UPLOAD_JOB_RESCAN_SECONDS.
+UPLOAD_JOB_DIR = os.environ.get("UPLOAD_JOB_DIR", "upload_jobs")
+UPLOAD_JOB_WORKERS = int(os.environ.get("UPLOAD_JOB_WORKERS", 2))
+UPLOAD_JOB_RESCAN_SECONDS = float(os.environ.get("UPLOAD_JOB_RESCAN_SECONDS", 60))
+UPLOAD_JOB_RETENTION_SECONDS = float(os.environ.get("UPLOAD_JOB_RETENTION_SECONDS", 7 * 24 * 3600))
+UNFINISHED_JOB_STATUSES = ("queued", "running")
+_upload_job_queue = queue.Queue()
+_queued_upload_jobs = set() # Job ids waiting in _upload_job_queue, so the scanner never queues one twice
+_upload_job_workers = []
+_upload_job_workers_lock = threading.Lock()
+
+def _upload_job_path(job_id, *parts):
+    if not re.fullmatch(r"[0-9a-f]{32}", job_id or ""):
+        raise ValueError(f"Invalid upload job id: {job_id!r}")
+    return os.path.join(UPLOAD_JOB_DIR, job_id, *parts)
+
+def load_upload_job(job_id):
+    try:
+        with open(_upload_job_path(job_id, "job.json")) as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        return None
+
+def save_upload_job(job):
+    """Writes job.json atomically so a crash mid-write never leaves a truncated job file."""
+    path = _upload_job_path(job["id"], "job.json")
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(job, f)
+    os.replace(temp_path, path)
+
+def create_upload_job(files, default_app, user_id):
+    """Saves the uploaded files to disk and returns the new (queued) job's state."""
+    job_id = uuid.uuid4().hex
+    os.makedirs(_upload_job_path(job_id, "files"))
+    stored_files = []
+    for index, file in enumerate(files):
+        stored_name = f"{index:03d}_{secure_filename(file.filename) or 'upload'}"
+        file.save(_upload_job_path(job_id, "files", stored_name))
+        stored_files.append({"name": file.filename, "stored_name": stored_name})
+
+    job = {
+        "id": job_id, "user_id": user_id, "app": default_app, "status": "queued", "files": stored_files,
+        "created_at": datetime.now().isoformat(timespec='seconds'), "started_at": None, "finished_at": None,
+        "attempts": 0, "rows_parsed": 0, "rows_inserted": 0, "rows_skipped": 0, "active_seconds": 0.0,
+        "processed_rows": {}, # table -> rows already handled (inserted, skipped or failed); what a resumed job skips
+        "inserted_by_source": {}, "skipped_by_source": {}, "reports": [], "errors": [],
+    }
+    save_upload_job(job)
+    return job
+
+def _claim_upload_job(job_id):
+    """Returns an open, exclusively locked claim file for the job, or None if another process holds it."""
+    claim = open(_upload_job_path(job_id, "claim"), "a")
+    if fcntl is None:
+        return claim
+    try:
+        fcntl.flock(claim.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return claim
+    except BlockingIOError:
+        claim.close()
+        return None
+
+def run_upload_job(job_id):
+    """Parses and inserts one job's files, checkpointing after every insert batch. Safe to re-run."""
+    claim = _claim_upload_job(job_id)
+    if claim is None:
+        return
+    try:
+        job = load_upload_job(job_id)
+        if job is None or job["status"] not in UNFINISHED_JOB_STATUSES:
+            return
+        if job["status"] == "running":
+            logging.info(f"Resuming upload job {job_id}; skipping already written rows {job['processed_rows']}.")
+        job.update(status="running", attempts=job["attempts"] + 1, rows_parsed=0, reports=[],
+                   started_at=job["started_at"] or datetime.now().isoformat(timespec='seconds'))
+        save_upload_job(job)
+        _process_upload_job(job)
+    except Exception as e:
+        logging.error(f"Upload job {job_id} failed: {e}", exc_info=True)
+        job = load_upload_job(job_id) or {"id": job_id, "errors": []}
+        job.update(status="failed", finished_at=datetime.now().isoformat(timespec='seconds'))
+        job["errors"].append(f"Server error while processing upload: {str(e)}")
+        save_upload_job(job)
+    finally:
+        claim.close()
+    # Completed and failed jobs are never re-run, so their uploaded files are no longer needed
+    shutil.rmtree(_upload_job_path(job_id, "files"), ignore_errors=True)
+
+def _process_upload_job(job):
+    attempt_started = time.monotonic()
+    active_seconds_before = job["active_seconds"]
+    job_lock = threading.Lock()
+
+    def checkpoint():
+        job["active_seconds"] = round(active_seconds_before + time.monotonic() - attempt_started, 3)
+        save_upload_job(job)
+
+    def count_rows(by_source_key, table, rows_by_source, total_key):
+        for source, source_rows in rows_by_source.items():
+            counts = job[by_source_key].setdefault(source, {})
+            counts[table] = counts.get(table, 0) + source_rows
+            job[total_key] += source_rows
+
+    def on_batch(table, rows, inserted_by_source, skipped_by_source, error_detail):
+        with job_lock:
+            job["processed_rows"][table] = job["processed_rows"].get(table, 0) + rows
+            count_rows("skipped_by_source", table, skipped_by_source, "rows_skipped")
+            if error_detail is None:
+                count_rows("inserted_by_source", table, inserted_by_source, "rows_inserted")
+            checkpoint()
+
+    files = [FileStorage(stream=open(_upload_job_path(job["id"], "files", stored["stored_name"]), "rb"), filename=stored["name"])
+             for stored in job["files"]]
+    writer = None
+    try:
+        sources = expand_upload_files(files)
+        writer = BatchedTableWriter(skip_rows=job["processed_rows"], on_batch=on_batch)
+        pool = get_upload_pool()
+        futures = [(source_name, pool.submit(parse_upload_source, source_name, filename, content, job["app"]))
+                   for source_name, filename, content in sources]
+        # Files are handed to the writer in upload order (not completion order) so every attempt
+        # produces the same row stream per table, which is what makes skipping by row count valid
+        for source_name, future in futures:
+            report = {"source": source_name, "parts": [], "rows_parsed": 0, "errors": []}
+            try:
+                parts = future.result()
+            except UploadError as e:
+                report["errors"].append(e.message)
+                parts = []
+            for part in parts:
+                report["parts"].append({"source": part["source"], "app": part["app"], "rows_parsed": part["rows_parsed"]})
+                report["rows_parsed"] += part["rows_parsed"]
+            with job_lock:
+                job["reports"].append(report)
+                job["rows_parsed"] += report["rows_parsed"]
+                checkpoint()
+            for part in parts:
+                writer.add(source_name, part["tables"])
+        writer.flush()
+    except UploadError as e:
+        job["errors"].append(e.message)
+    finally:
+        for file in files:
+            file.stream.close()
+
+    with job_lock:
+        for report in job["reports"]:
+            report["rows_inserted"] = job["inserted_by_source"].get(report["source"], {})
+            report["rows_skipped"] = job["skipped_by_source"].get(report["source"], {})
+            if writer is not None:
+                report["errors"].extend(writer.errors.get(report["source"], []))
+        failed = job["errors"] or any(report["errors"] for report in job["reports"])
+        job["status"] = "failed" if failed and not job["rows_inserted"] else "completed"
+        job["finished_at"] = datetime.now().isoformat(timespec='seconds')
+        checkpoint()
+    if job["rows_inserted"]:
+        invalidate_analytics_cache()
+    logging.info(f"Upload job {job['id']} {job['status']}: {job['rows_parsed']} rows parsed, {job['rows_inserted']} inserted.")
+
+def scan_upload_jobs(now=None):
+    """
+    Returns the ids of unfinished jobs (oldest first) and deletes the directories of jobs that
+    finished more than UPLOAD_JOB_RETENTION_SECONDS ago.
+    """
+    if not os.path.isdir(UPLOAD_JOB_DIR):
+        return []
+    now = time.time() if now is None else now
+    unfinished = []
+    for job_id in sorted(os.listdir(UPLOAD_JOB_DIR)):
+        job = load_upload_job(job_id)
+        if job and job["status"] in UNFINISHED_JOB_STATUSES:
+            unfinished.append((job["created_at"], job_id))
+            continue
+        # Finished jobs by their finish time; unreadable ones (e.g. a crash while creating) by the directory's
+        try:
+            finished_at = (datetime.fromisoformat(job["finished_at"]).timestamp() if job and job.get("finished_at")
+                           else os.path.getmtime(_upload_job_path(job_id)))
+        except (ValueError, OSError):
+            continue
+        if now - finished_at > UPLOAD_JOB_RETENTION_SECONDS:
+            shutil.rmtree(_upload_job_path(job_id), ignore_errors=True)
+            logging.info(f"Removed expired upload job {job_id}.")
+    return [job_id for _, job_id in sorted(unfinished)]
+
+def queue_upload_job(job_id):
+    with _upload_job_workers_lock:
+        if job_id in _queued_upload_jobs:
+            return
+        _queued_upload_jobs.add(job_id)
+    _upload_job_queue.put(job_id)
+
+def _upload_job_worker():
+    while True:
+        job_id = _upload_job_queue.get()
+        with _upload_job_workers_lock:
+            _queued_upload_jobs.discard(job_id)
+        run_upload_job(job_id)
+
+def _upload_job_scanner():
+    while True:
+        # Picks up jobs orphaned by a crashed worker process (their claim lock is free again);
+        # jobs another live process is running are skipped by run_upload_job's claim
+        try:
+            for job_id in scan_upload_jobs():
+                queue_upload_job(job_id)
+        except Exception as e:
+            logging.error(f"Upload job scan failed: {e}", exc_info=True)
+        time.sleep(UPLOAD_JOB_RESCAN_SECONDS)
+
+def start_upload_job_workers():
+    """Starts the background job threads and the job scanner (once per process); the first scan queues unfinished jobs."""
+    with _upload_job_workers_lock:
+        if _upload_job_workers:
+            return
+        for index in range(UPLOAD_JOB_WORKERS):
+            worker = threading.Thread(target=_upload_job_worker, name=f"upload-job-{index}", daemon=True)
+            worker.start()
+            _upload_job_workers.append(worker)
+        scanner = threading.Thread(target=_upload_job_scanner, name="upload-job-scan", daemon=True)
+        scanner.start()
+        _upload_job_workers.append(scanner)
+
+def describe_upload_job(job):
+    """Job status for the API: progress counters, throughput and per-file reports."""
+    seconds = job.get("active_seconds") or 0
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "attempts": job["attempts"],
+        "files": [stored["name"] for stored in job["files"]],
+        "rows_parsed": job["rows_parsed"],
+        "rows_inserted": job["rows_inserted"],
+        "rows_skipped": job.get("rows_skipped", 0),
+        "rows_per_second": round((job["rows_inserted"] + job.get("rows_skipped", 0)) / seconds, 1) if seconds else None,
+        "reports": job["reports"],
+        "errors": job["errors"],
+    }
+
+@app.route('/api/upload-jobs', methods=['POST'])
+@verify_token
+def create_upload_job_route():
+    """
+    Accepts the same form as /api/upload-data/batch ('files'/'file', optional 'app'), stores the files
+    and queues them for background processing. Responds 202 with the job id to poll.
+    """
+    try:
+        default_app = (request.form.get("app") or "").lower() or None
+        files = request.files.getlist("files") + request.files.getlist("file")
+        if not files:
+            return jsonify({"message": "At least one file is required."}), 400
+
+        job = create_upload_job(files, default_app, request.current_user['uid'])
+        start_upload_job_workers()
+        queue_upload_job(job["id"])
+        logging.info(f"Queued upload job {job['id']} with {len(files)} file(s).")
+        return jsonify({**describe_upload_job(job), "status_url": f"/api/upload-jobs/{job['id']}",
+                        "message": "Upload accepted for processing."}), 202
+    except Exception as e:
+        logging.error(f"Server error while queueing upload: {e}", exc_info=True)
+        return jsonify({"message": f"Server error while queueing upload: {str(e)}"}), 500
+
+@app.route('/api/upload-jobs/<job_id>', methods=['GET'])
+@verify_token
+def get_upload_job(job_id):
+    """Progress of an upload job. Only the user who submitted it can see it."""
+    job = load_upload_job(job_id)
+    if job is None or job["user_id"] != request.current_user['uid']:
+        return jsonify({"message": "Upload job not found."}), 404
+    return jsonify(describe_upload_job(job))
+
+# --- Analytics result cache ---
+# Finished response bodies of the analytics routes, keyed by route and normalized query params.
+# Entries expire after ANALYTICS_CACHE_TTL_SECONDS and are dropped whenever an upload succeeds.
+# Only 200 responses are cached. The cache is per worker process; a miss first looks in the shared
+# cache for a result another worker computed less than ANALYTICS_CACHE_TTL_SECONDS ago.
+# Misses are single-flight: while one request computes a key, identical concurrent requests wait
+# for it and share its result (whatever the status) instead of repeating the Supabase pulls and
+# model fits. An upload bumps the cache generation, so requests arriving after it start a fresh
+# computation and a computation that straddled it is not cached.
+ANALYTICS_CACHE_TTL_SECONDS = float(os.environ.get("ANALYTICS_CACHE_TTL_SECONDS", 900))
+ANALYTICS_CACHE_MAX_ENTRIES = int(os.environ.get("ANALYTICS_CACHE_MAX_ENTRIES", 256))
+_analytics_cache = TTLCache(maxsize=ANALYTICS_CACHE_MAX_ENTRIES, ttl=ANALYTICS_CACHE_TTL_SECONDS)
+_analytics_cache_lock = threading.Lock()
+_analytics_cache_generation = 0
+_analytics_in_flight = {} # key -> AnalyticsFlight
+
+class AnalyticsFlight:
+    """One in-progress computation of an analytics key, shared by every request that asks for it."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+def cached_analytics(key, compute):
+    """
+    Returns (payload, status_code) for `key`, calling `compute()` (which returns the same pair)
+    on a miss and caching the result if it succeeded. Concurrent misses for the same key share one call.
+    Results are also shared with the other workers through the shared cache.
+    """
+    sync_shared_cache_generation()
+    with _analytics_cache_lock:
+        payload = _analytics_cache.get(key)
+        if payload is None:
+            flight = _analytics_in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _analytics_in_flight[key] = AnalyticsFlight()
+                generation = _analytics_cache_generation
+    if payload is not None:
+        logging.info(f"Analytics cache hit for {key}")
+        return payload, 200
+
+    if not leader:
+        logging.info(f"Analytics request coalesced with in-flight computation for {key}")
+        with pipeline_stage("coalesced_wait"):
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        payload = shared_cache.get_result(key, max_age=ANALYTICS_CACHE_TTL_SECONDS) if shared_cache.enabled else None
+        shared_hit = payload is not None
+        if shared_hit:
+            logging.info(f"Shared cache hit for {key}")
+            status_code = 200
+        else:
+            payload, status_code = compute()
+        flight.result = (payload, status_code)
+        if status_code == 200:
+            store_analytics_result(key, payload, generation, share=not shared_hit)
+        return payload, status_code
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _analytics_cache_lock:
+            if _analytics_in_flight.get(key) is flight:
+                del _analytics_in_flight[key]
+        flight.done.set()
+
+def store_analytics_result(key, payload, generation=None, share=False):
+    """
+    Caches a payload (also in the shared cache if `share`), unless the cache was invalidated since
+    `generation` (from current_analytics_generation, when given) was read: then it was computed
+    from data an upload has since replaced.
+    """
+    sync_shared_cache_generation()
+    with _analytics_cache_lock:
+        current = generation is None or generation == _analytics_cache_generation
+        if current:
+            _analytics_cache[key] = payload
+    if current and share and shared_cache.enabled:
+        shared_cache.put_result(key, payload)
+
+def current_analytics_generation():
+    """The analytics cache generation to pass to store_analytics_result for a computation starting now."""
+    sync_shared_cache_generation()
+    with _analytics_cache_lock:
+        return _analytics_cache_generation
+
+def invalidate_analytics_cache():
+    """Drops cached results and tables in this worker and, through the shared cache, in all others."""
+    global _shared_generation_seen
+    if shared_cache.enabled:
+        previous = shared_cache.generation()
+        _shared_generation_seen = shared_cache.invalidate()
+        sales_rollup.advance_generation(previous, _shared_generation_seen)
+    _clear_local_analytics_cache()
+    logging.info("Analytics result cache cleared.")
+
+def _clear_local_analytics_cache():
+    global _analytics_cache_generation
+    with _analytics_cache_lock:
+        _analytics_cache.clear()
+        _analytics_cache_generation += 1
+        # Requests from now on must not join computations that started on the old data
+        _analytics_in_flight.clear()
+
+_shared_generation_seen = None
+
+def sync_shared_cache_generation():
+    """Clears this worker's result cache if another worker invalidated the shared cache since we last looked."""
+    global _shared_generation_seen
+    if not shared_cache.enabled:
+        return
+    generation = shared_cache.generation()
+    if generation != _shared_generation_seen:
+        if _shared_generation_seen is not None:
+            _clear_local_analytics_cache()
+            logging.info("Analytics result cache cleared: data changed in another worker.")
+        _shared_generation_seen = generation
+
+def _normalize_date_param(value):
+    """'2024-5-1 ' -> '2024-05-01' so equivalent query strings share cache and in-flight entries."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        return value # Left for the compute function to reject
+
+def choose_performance_frequency(start_date, end_date):
+    """
+    Picks the chart bucket size for a date range: daily up to 30 days, weekly up to 90 days,
+    monthly beyond that (or when no range is given).
+    Returns (pandas frequency, output date format).
+    """
+    freq = 'MS' # Default to Month Start
+    date_format = '%Y-%m-%d' # Default date format for output, will be adjusted
+
+    if start_date and end_date:
+        delta = end_date - start_date
+        if delta <= timedelta(days=30): # Up to 30 days, show daily
+            freq = 'D'
+            date_format = '%Y-%m-%d'
+        elif delta <= timedelta(days=90): # 31 to 90 days, show weekly
+            freq = 'W'
+            date_format = '%Y-%m-%d' # Keep full date for weekly points, frontend can format to 'Week X, YY-MM-DD'
+        else: # More than 90 days, show monthly
+            freq = 'MS'
+            date_format = '%Y-%m' # Format to Year-Month for monthly aggregation
+    return freq, date_format
+
+# --- Chart downsampling ---
+# Long daily ranges have thousands of points, which bloats responses and makes Chart.js slow.
+# With ?max_points=N, daily chart series are reduced with Largest-Triangle-Three-Buckets (LTTB):
+# the first and last points are kept and every bucket in between contributes the point forming the
+# largest triangle with the previously kept point and the next bucket's average, so peaks and
+# troughs survive. Buckets are processed in order (each depends on the previous pick), but all
+# candidate areas within a bucket are computed with one NumPy expression.
+MIN_CHART_MAX_POINTS = 3
+MAX_CHART_MAX_POINTS = 10000
+
+def lttb_indices(x, y, n_out):
+    """Indices (sorted) of the `n_out` points LTTB keeps from the series (x, y)."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n_out >= n or n_out < MIN_CHART_MAX_POINTS:
+        return np.arange(n)
+
+    # n - 2 inner points split into n_out - 2 buckets; bounds[i]..bounds[i+1] is bucket i
+    bounds = np.linspace(1, n - 1, n_out - 1).astype(int)
+    # Average of every bucket, plus the last point as the "next bucket" of the final one
+    sums_x, sums_y = np.add.reduceat(x[1:n - 1], bounds[:-1] - 1), np.add.reduceat(y[1:n - 1], bounds[:-1] - 1)
+    counts = np.diff(bounds)
+    averages_x = np.append(sums_x / counts, x[-1])
+    averages_y = np.append(sums_y / counts, y[-1])
+
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = bounds[bucket], bounds[bucket + 1]
+        next_x, next_y = averages_x[bucket + 1], averages_y[bucket + 1]
+        # Twice the triangle area (previous pick, candidate, next bucket average) for all candidates at once
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+def downsample_chart_frame(frame, x, value_columns, max_points):
+    """
+    Rows of `frame` kept for a chart of at most `max_points` points. Each value column gets an equal share
+    of the budget and the union of their LTTB picks is kept, so every series keeps its own peaks. When the
+    budget is too small to give every column MIN_CHART_MAX_POINTS, the columns are scaled to [0, 1] and
+    summed into one series, which is downsampled to max_points instead.
+    """
+    if max_points is None or len(frame) <= max_points:
+        return frame
+    per_column = max_points // max(1, len(value_columns))
+    if per_column < MIN_CHART_MAX_POINTS:
+        values = frame[list(value_columns)].to_numpy(dtype=float)
+        spread = np.nanmax(values, axis=0) - np.nanmin(values, axis=0)
+        scaled = (values - np.nanmin(values, axis=0)) / np.where(spread > 0, spread, 1)
+        return frame.iloc[lttb_indices(x, np.nan_to_num(scaled).sum(axis=1), max_points)]
+    keep = np.unique(np.concatenate([lttb_indices(x, frame[column].to_numpy(dtype=float), per_column)
+                                     for column in value_columns]))
+    return frame.iloc[keep]
+
+def parse_max_points(args):
+    """The optional max_points query parameter. Returns (max_points or None, error message or None)."""
+    raw = args.get('max_points')
+    if raw in (None, ''):
+        return None, None
+    try:
+        max_points = int(raw)
+    except ValueError:
+        return None, "max_points must be an integer."
+    if not MIN_CHART_MAX_POINTS <= max_points <= MAX_CHART_MAX_POINTS:
+        return None, f"max_points must be between {MIN_CHART_MAX_POINTS} and {MAX_CHART_MAX_POINTS}."
+    return max_points, None
+
+def aggregate_performance_data(tiktok_records, facebook_records, sales_records, freq, date_format, platform_filter='all'):
+    """
+    Aggregates raw TikTok, Facebook and sales records into chart buckets of `freq`.
+    Returns (aggregated_social_data, aggregated_sales_data_for_charts, total_sales).
+    """
+    with pipeline_stage("build_frames"):
+        df_tiktok = records_to_frame(tiktok_records)
+        df_facebook = records_to_frame(facebook_records)
+        df_sales = records_to_frame(sales_records)
+
+    # Process social media data for Engagement and Reach charts
+    combined_social_df = pd.DataFrame()
+    
+    with pipeline_stage("coerce"):
         if not df_tiktok.empty:
             df_tiktok['date'] = pd.to_datetime(df_tiktok['date'], errors='coerce')
             # Filter by platform here
@@ -780,8 +2966,9 @@ def performance_data():
                 df_facebook['reach_raw'] = df_facebook['reach'].fillna(0)
                 combined_social_df = pd.concat([combined_social_df, df_facebook[['date', 'engagement_raw', 'reach_raw']]])
 
-        # Aggregate combined social media data dynamically
-        if not combined_social_df.empty:
+    # Aggregate combined social media data dynamically
+    if not combined_social_df.empty:
+        with pipeline_stage("resample"):
             combined_social_df = combined_social_df.dropna(subset=['date'])
             combined_social_df.set_index('date', inplace=True)
             
@@ -805,18 +2992,20 @@ def performance_data():
 
             # Format date column according to chosen frequency
             aggregated_social_data['date'] = aggregated_social_data['date'].dt.strftime(date_format)
-        else:
-            aggregated_social_data = pd.DataFrame(columns=['date', 'engagement_total', 'reach_total', 'engagement'])
+    else:
+        aggregated_social_data = pd.DataFrame(columns=['date', 'engagement_total', 'reach_total', 'engagement'])
 
-        # Process Sales data for charting
-        aggregated_sales_data_for_charts = pd.DataFrame(columns=['date', 'sales_total'])
-        total_sales = 0 # Initialize total_sales here
-        if not df_sales.empty:
+    # Process Sales data for charting
+    aggregated_sales_data_for_charts = pd.DataFrame(columns=['date', 'sales_total'])
+    total_sales = 0 # Initialize total_sales here
+    if not df_sales.empty:
+        with pipeline_stage("coerce"):
             df_sales['date'] = pd.to_datetime(df_sales['date'], errors='coerce')
             df_sales = df_sales.dropna(subset=['date'])
             df_sales['revenue'] = pd.to_numeric(df_sales['revenue'], errors='coerce').fillna(0)
             df_sales.set_index('date', inplace=True)
-            
+        
+        with pipeline_stage("resample"):
             # Aggregate sales data by the determined frequency
             aggregated_sales_data_for_charts = df_sales.resample(freq).agg({
                 'revenue': 'sum'
@@ -829,26 +3018,640 @@ def performance_data():
 
             # Calculate total sales from the aggregated data (or directly from df_sales)
             total_sales = df_sales['revenue'].sum() # Sum all revenue for the total summary
-        
+
+    return aggregated_social_data, aggregated_sales_data_for_charts, total_sales
+
+def build_performance_payload(aggregated_social_data, aggregated_sales_data_for_charts, total_sales, performance_insights):
+    """Converts aggregated performance frames into the /api/performance-data response body."""
+    with pipeline_stage("serialize"):
         # Format for frontend - select all necessary columns for social media performance
         performance_charts_data = aggregated_social_data[['date', 'engagement', 'engagement_total', 'reach_total']].to_dict(orient='records')
         performance_charts_data.sort(key=lambda x: x['date']) # Ensure sorted by date
 
-        # Generate performance insights (NEW ADDITION)
-        performance_insights = generate_performance_insights(aggregated_social_data, aggregated_sales_data_for_charts, start_date, end_date, platform_filter)
-
-        return jsonify({
+        return {
             "performance_charts_data": performance_charts_data, # Social media charts data
             "sales_charts_data": aggregated_sales_data_for_charts.to_dict(orient='records'), # Aggregated sales data for charts
             "total_sales_summary": total_sales, # Include total sales summary here
             "performance_insights": performance_insights # NEW: Add performance insights
-        })
+        }
+
+# NEW API ENDPOINT FOR PERFORMANCE DATA
+@app.route('/api/performance-data', methods=['GET'])
+@verify_token
+@profile_on_request
+def performance_data():
+    """
+    API endpoint for aggregated historical performance data for charts (not predictive).
+    Fetches historical data for engagement, reach, and aggregates them dynamically
+    (daily, weekly, or monthly) based on the date range, and filters by platform.
+    With max_points, the charts get daily points for any range, downsampled with LTTB to at most
+    max_points per chart (the insights still use the range's usual buckets).
+    With approx=true the buckets are estimated from a sample of days, with margins of error
+    (see compute_approx_performance_data); max_points does not apply then.
+    """
+    start_date_str = _normalize_date_param(request.args.get('start_date'))
+    end_date_str = _normalize_date_param(request.args.get('end_date'))
+    platform_filter = (request.args.get('platform') or 'all').strip().lower()
+    max_points, error = parse_max_points(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+
+    try:
+        if parse_approx_flag(request.args):
+            payload, status_code = cached_analytics(
+                ("performance-data/approx", start_date_str, end_date_str, platform_filter),
+                lambda: compute_approx_performance_data(start_date_str, end_date_str, platform_filter))
+            return jsonify(payload), status_code
+
+        payload, status_code = cached_analytics(
+            ("performance-data", start_date_str, end_date_str, platform_filter, max_points),
+            lambda: compute_performance_data(start_date_str, end_date_str, platform_filter, max_points))
+        return jsonify(payload), status_code
 
     except Exception as e:
         logging.error(f"Server error during performance data retrieval: {e}", exc_info=True)
         return jsonify({"error": f"An error occurred during performance data retrieval: {str(e)}"}), 500
 
 
+def compute_performance_data(start_date_str, end_date_str, platform_filter='all', max_points=None):
+    """Fetches, aggregates and summarizes performance data. Returns (payload, status_code)."""
+    # Convert date strings to datetime objects to calculate date range difference
+    start_date = datetime.strptime(start_date_str, '%Y-%m-%d') if start_date_str else None
+    end_date = datetime.strptime(end_date_str, '%Y-%m-%d') if end_date_str else None
+
+    # Determine resampling frequency based on date range
+    freq, date_format = choose_performance_frequency(start_date, end_date)
+    
+    logging.info(f"Calculated frequency for performance data: {freq} with date format: {date_format}")
+
+    # Fetch data based on filters
+    # IMPORTANT: fetch_table now handles pagination internally when limit is None
+    tiktok_records = fetch_frame("tiktokdata", TIKTOK_METRIC_COLUMNS, start_date=start_date_str, end_date=end_date_str,
+                                 wire_format=ANALYTICS_WIRE_FORMAT)
+    facebook_records = fetch_frame("facebookdata", FACEBOOK_METRIC_COLUMNS, start_date=start_date_str, end_date=end_date_str,
+                                   wire_format=ANALYTICS_WIRE_FORMAT)
+    sales_records = fetch_frame("sales", SALES_REVENUE_COLUMNS, start_date=start_date_str, end_date=end_date_str,
+                                wire_format=ANALYTICS_WIRE_FORMAT)
+
+    aggregated_social_data, aggregated_sales_data_for_charts, total_sales = aggregate_performance_data(
+        tiktok_records, facebook_records, sales_records, freq, date_format, platform_filter)
+
+    # Unusual days in the period feed into the insights; the scan is optional, so failures are only logged
+    try:
+        period_anomalies = filter_anomalies(get_anomaly_scan()["anomalies"], start_date_str, end_date_str,
+                                            insight_anomaly_platforms(platform_filter))
+    except Exception as e:
+        logging.warning(f"Anomaly scan unavailable for performance insights: {e}")
+        period_anomalies = None
+
+    # Generate performance insights (NEW ADDITION)
+    performance_insights = generate_performance_insights(aggregated_social_data, aggregated_sales_data_for_charts, start_date, end_date,
+                                                         platform_filter, period_anomalies)
+
+    if max_points is None:
+        return build_performance_payload(aggregated_social_data, aggregated_sales_data_for_charts, total_sales, performance_insights), 200
+
+    # Charts: daily points for the whole range, each chart downsampled to max_points
+    daily_social, daily_sales, _ = aggregate_performance_data(
+        tiktok_records, facebook_records, sales_records, 'D', '%Y-%m-%d', platform_filter)
+    with pipeline_stage("downsample"):
+        chart_social = downsample_chart_frame(daily_social, np.arange(len(daily_social)),
+                                              ['engagement', 'engagement_total', 'reach_total'], max_points)
+        chart_sales = downsample_chart_frame(daily_sales, np.arange(len(daily_sales)), ['sales_total'], max_points)
+    payload = build_performance_payload(chart_social, chart_sales, total_sales, performance_insights)
+    payload["downsampling"] = {"method": "lttb", "max_points": max_points, "frequency": "daily",
+                               "performance_points": len(daily_social), "sales_points": len(daily_sales)}
+    return payload, 200
+
+
+# --- Anomaly detection ---
+# Flags unusual days in every daily metric series at once. Series are (platform, metric):
+# engagement and reach for tiktok, facebook and both combined, plus sales revenue. They are stacked
+# into one (series x days) array, NaN outside each series' first..last day and 0 on days without
+# rows inside it, and scored with two vectorized tests:
+#   * rolling robust z-score: distance from the median of the previous ANOMALY_WINDOW_DAYS days,
+#     in units of that window's median absolute deviation, on values with the day-of-week effect
+#     removed (via sliding_window_view, no Python loop over days or series);
+#   * seasonal residual: what is left after removing a centered 7-day rolling median (trend, the
+#     day itself left out) and each series' median day-of-week effect, scaled by the residuals'
+#     robust spread on that day of the week.
+# The full-history scan is computed once per data generation (kept until the next upload or for
+# ANALYTICS_CACHE_TTL_SECONDS, shared with other workers through the shared cache) and filtered per
+# request.
+ANOMALY_WINDOW_DAYS = int(os.environ.get("ANOMALY_WINDOW_DAYS", 28))
+ANOMALY_MIN_PERIODS = int(os.environ.get("ANOMALY_MIN_PERIODS", 14)) # Non-missing days needed in the window
+ANOMALY_Z_THRESHOLD = float(os.environ.get("ANOMALY_Z_THRESHOLD", 3.5))
+ANOMALY_RESIDUAL_THRESHOLD = float(os.environ.get("ANOMALY_RESIDUAL_THRESHOLD", 3.5))
+ANOMALY_PLATFORMS = ("combined", "tiktok", "facebook", "sales")
+ANOMALY_METRICS = ("engagement", "reach", "revenue")
+ANOMALY_PLATFORM_LABELS = {"combined": "Social", "tiktok": "TikTok", "facebook": "Facebook", "sales": "Sales"}
+ANOMALY_INSIGHT_EXAMPLES = 3 # Unusual days named in the performance insights text
+MAD_TO_SIGMA = 1.4826 # Scales a median absolute deviation to a normal standard deviation
+
+def build_daily_metric_matrix(tiktok_records, facebook_records, sales_records):
+    """
+    Aggregates raw rows into daily series. Returns (keys, days, values) where keys is a list of
+    (platform, metric), days a DatetimeIndex and values a (len(keys), len(days)) float array.
+    """
+    with pipeline_stage("aggregate"):
+        columns = {}
+        for platform, records, reach_column in (("tiktok", tiktok_records, "views"), ("facebook", facebook_records, "reach")):
+            frame = records_to_frame(records)
+            if frame.empty:
+                continue
+            day = pd.to_datetime(frame['date'], errors='coerce').dt.normalize()
+            daily = pd.DataFrame({
+                "engagement": frame[['likes', 'comments', 'shares']].fillna(0).sum(axis=1),
+                "reach": frame[reach_column].fillna(0),
+            }).groupby(day).sum()
+            columns[(platform, "engagement")] = daily["engagement"]
+            columns[(platform, "reach")] = daily["reach"]
+        for metric in ("engagement", "reach"):
+            per_platform = [columns[(platform, metric)] for platform in ("tiktok", "facebook") if (platform, metric) in columns]
+            if per_platform:
+                columns[("combined", metric)] = pd.concat(per_platform, axis=1).sum(axis=1, min_count=1)
+
+        sales = records_to_frame(sales_records)
+        if not sales.empty:
+            day = pd.to_datetime(sales['date'], errors='coerce').dt.normalize()
+            columns[("sales", "revenue")] = sales['revenue'].fillna(0).groupby(day).sum()
+
+    if not columns:
+        return [], pd.DatetimeIndex([]), np.zeros((0, 0))
+    with pipeline_stage("merge"):
+        frame = pd.concat(columns, axis=1)
+        frame = frame.reindex(pd.date_range(frame.index.min(), frame.index.max(), freq='D'))
+        # Days without rows inside a series' span had nothing happen (0); outside the span nothing was recorded
+        inside = frame.ffill().notna() & frame.bfill().notna()
+        frame = frame.fillna(0).where(inside)
+    return list(frame.columns), frame.index, frame.to_numpy(dtype=float).T
+
+def rolling_robust_zscores(values, window, min_periods):
+    """
+    (z, baseline) arrays shaped like `values`: each day scored against the median and MAD of the
+    `window` days before it. NaN where the window has fewer than `min_periods` values.
+    """
+    n_series, n_days = values.shape
+    z = np.full(values.shape, np.nan)
+    baseline = np.full(values.shape, np.nan)
+    if n_days <= window:
+        return z, baseline
+    # windows[:, i] covers days i .. i + window - 1 and is the history of day i + window
+    windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=1)[:, :n_days - window]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning) # All-NaN windows before a series starts
+        median = np.nanmedian(windows, axis=2)
+        deviation = np.abs(windows - median[..., None])
+        mad = np.nanmedian(deviation, axis=2) * MAD_TO_SIGMA
+        # Mostly-constant windows have MAD 0; fall back to the mean absolute deviation (scaled likewise)
+        scale = np.where(mad > 0, mad, np.nanmean(deviation, axis=2) * 1.2533)
+    enough = np.sum(~np.isnan(windows), axis=2) >= min_periods
+    current = values[:, window:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = np.where(enough & (scale > 0), (current - median) / scale, np.nan)
+    z[:, window:] = scores
+    baseline[:, window:] = np.where(enough, median, np.nan)
+    return z, baseline
+
+def seasonal_residual_scores(values, days):
+    """
+    (scores, weekly) arrays shaped like `values`: the residual after a centered 7-day rolling median (the
+    day itself left out) and the median day-of-week effect, in robust standard deviations, and that
+    day-of-week effect per day.
+    """
+    with pipeline_stage("seasonal"):
+        weekday = np.asarray(days.dayofweek)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            # The trend is the median of the three days either side, leaving the day itself out (with it
+            # in, a seventh of the residuals are exactly zero and the spread comes out too small), taken
+            # on roughly deseasonalized values so one outlier among the neighbours cannot swap a weekday
+            # median for a weekend one
+            level = np.nanmedian(values, axis=1, keepdims=True)
+            rough_weekly = np.column_stack([np.nanmedian(values[:, weekday == d], axis=1) if (weekday == d).any()
+                                            else level[:, 0] for d in range(7)]) - level
+            padded = np.pad(values - rough_weekly[:, weekday], ((0, 0), (3, 3)), constant_values=np.nan)
+            windows = np.lib.stride_tricks.sliding_window_view(padded, 7, axis=1)
+            neighbours = np.concatenate([windows[..., :3], windows[..., 4:]], axis=-1)
+            trend = np.where(np.sum(~np.isnan(neighbours), axis=-1) >= 4, np.nanmedian(neighbours, axis=-1), np.nan)
+            detrended = values - trend
+            seasonal = np.column_stack([np.nanmedian(detrended[:, weekday == d], axis=1) if (weekday == d).any()
+                                        else np.zeros(len(values)) for d in range(7)])
+            residual = detrended - seasonal[:, weekday]
+            # Spread per day of week: busy days vary more in absolute terms, and one spread for all days
+            # would flag ordinary weekends
+            center = np.zeros_like(residual)
+            sigma = np.full_like(residual, np.nan)
+            for d in range(7):
+                columns = weekday == d
+                if columns.any():
+                    day_center = np.nanmedian(residual[:, columns], axis=1, keepdims=True)
+                    center[:, columns] = day_center
+                    sigma[:, columns] = np.nanmedian(np.abs(residual[:, columns] - day_center), axis=1, keepdims=True) * MAD_TO_SIGMA
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(sigma > 0, (residual - center) / sigma, np.nan), seasonal[:, weekday]
+
+def detect_anomalies(keys, days, values):
+    """Anomaly dicts for every flagged day of every series, oldest first."""
+    residual, weekly = seasonal_residual_scores(values, days)
+    with pipeline_stage("rolling_zscore"):
+        # Scored on weekday-adjusted values, so a normal weekend is not flagged against a weekday window
+        z, baseline = rolling_robust_zscores(values - weekly, ANOMALY_WINDOW_DAYS, ANOMALY_MIN_PERIODS)
+        baseline = baseline + weekly
+    with np.errstate(invalid='ignore'):
+        z_flag = np.abs(z) >= ANOMALY_Z_THRESHOLD
+        residual_flag = np.abs(residual) >= ANOMALY_RESIDUAL_THRESHOLD
+    series_index, day_index = np.nonzero(z_flag | residual_flag)
+    order = np.lexsort((series_index, day_index))
+    series_index, day_index = series_index[order], day_index[order]
+
+    dates = days.strftime('%Y-%m-%d')
+    anomalies = []
+    for s, d in zip(series_index.tolist(), day_index.tolist()):
+        platform, metric = keys[s]
+        # The sign of whichever test is more extreme decides the direction
+        score = z[s, d] if z_flag[s, d] and not (residual_flag[s, d] and abs(residual[s, d]) > abs(z[s, d])) else residual[s, d]
+        anomalies.append({
+            "date": dates[d], "platform": platform, "metric": metric,
+            "value": round(float(values[s, d]), 2),
+            "expected": None if np.isnan(baseline[s, d]) else round(float(baseline[s, d]), 2),
+            "robust_z": None if np.isnan(z[s, d]) else round(float(z[s, d]), 2),
+            "seasonal_score": None if np.isnan(residual[s, d]) else round(float(residual[s, d]), 2),
+            "direction": "spike" if score > 0 else "drop",
+            "methods": [name for name, flagged in (("rolling_zscore", z_flag[s, d]), ("seasonal_residual", residual_flag[s, d])) if flagged],
+        })
+    return anomalies
+
+def compute_anomaly_scan():
+    """Scans the full history of every series. Returns the JSON-ready scan payload."""
+    tiktok_records = fetch_frame("tiktokdata", TIKTOK_METRIC_COLUMNS, order="date.asc", wire_format=ANALYTICS_WIRE_FORMAT)
+    facebook_records = fetch_frame("facebookdata", FACEBOOK_METRIC_COLUMNS, order="date.asc", wire_format=ANALYTICS_WIRE_FORMAT)
+    sales_records = fetch_frame("sales", SALES_REVENUE_COLUMNS, order="date.asc", wire_format=ANALYTICS_WIRE_FORMAT)
+    keys, days, values = build_daily_metric_matrix(tiktok_records, facebook_records, sales_records)
+    anomalies = detect_anomalies(keys, days, values)
+    logging.info(f"Anomaly scan: {len(anomalies)} anomalies in {len(keys)} series over {len(days)} days.")
+    return {
+        "anomalies": anomalies,
+        "series": [{"platform": platform, "metric": metric, "days": int(np.count_nonzero(~np.isnan(row)))}
+                   for (platform, metric), row in zip(keys, values)],
+        "computed_at": datetime.now().isoformat(timespec='seconds'),
+    }
+
+_anomaly_scan_lock = threading.Lock()
+_anomaly_scans = {} # analytics cache generation -> (scan payload, time.monotonic() it was stored); only the current one is kept
+
+def _current_anomaly_scan(generation):
+    scan, stored_at = _anomaly_scans.get(generation, (None, None))
+    return scan if scan is not None and time.monotonic() - stored_at <= ANALYTICS_CACHE_TTL_SECONDS else None
+
+def get_anomaly_scan():
+    """
+    The anomaly scan for the current data, computed at most once per upload across workers (and again
+    once it is older than ANALYTICS_CACHE_TTL_SECONDS, for data edited outside the app).
+    """
+    sync_shared_cache_generation()
+    generation = _analytics_cache_generation
+    scan = _current_anomaly_scan(generation)
+    if scan is not None:
+        return scan
+    with _anomaly_scan_lock:
+        scan = _current_anomaly_scan(generation)
+        if scan is None:
+            scan = shared_cache.get_result(("anomalies/scan",), max_age=ANALYTICS_CACHE_TTL_SECONDS) if shared_cache.enabled else None
+            if scan is None:
+                scan = compute_anomaly_scan()
+                if shared_cache.enabled:
+                    shared_cache.put_result(("anomalies/scan",), scan)
+            # An upload during the scan moved the generation on; the next request rescans
+            if generation == _analytics_cache_generation:
+                _anomaly_scans.clear()
+                _anomaly_scans[generation] = (scan, time.monotonic())
+    return scan
+
+def filter_anomalies(anomalies, start_date=None, end_date=None, platforms=None, metrics=None):
+    """Anomalies within [start_date, end_date] (YYYY-MM-DD strings) for the given platforms and metrics."""
+    return [anomaly for anomaly in anomalies
+            if (not start_date or anomaly["date"] >= start_date) and (not end_date or anomaly["date"] <= end_date)
+            and (not platforms or anomaly["platform"] in platforms) and (not metrics or anomaly["metric"] in metrics)]
+
+def insight_anomaly_platforms(platform_filter):
+    """Series the performance insights report on: the filtered social platform plus sales."""
+    return ("combined" if platform_filter == 'all' else platform_filter, "sales")
+
+@app.route('/api/anomalies', methods=['GET'])
+@verify_token
+@profile_on_request
+def anomalies():
+    """
+    API endpoint listing unusual days in the daily engagement, reach and revenue series.
+    Query params: start_date, end_date, platform ('all' or one of ANOMALY_PLATFORMS), metric
+    ('all' or one of ANOMALY_METRICS), limit (most recent first, default 200).
+    """
+    start_date = _normalize_date_param(request.args.get('start_date'))
+    end_date = _normalize_date_param(request.args.get('end_date'))
+    platform = request.args.get('platform', 'all').lower()
+    metric = request.args.get('metric', 'all').lower()
+    if platform != 'all' and platform not in ANOMALY_PLATFORMS:
+        return jsonify({"error": f"platform must be 'all' or one of: {', '.join(ANOMALY_PLATFORMS)}."}), 400
+    if metric != 'all' and metric not in ANOMALY_METRICS:
+        return jsonify({"error": f"metric must be 'all' or one of: {', '.join(ANOMALY_METRICS)}."}), 400
+    try:
+        limit = int(request.args.get('limit', 200))
+    except ValueError:
+        return jsonify({"error": "limit must be a positive integer."}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be a positive integer."}), 400
+
+    try:
+        scan = get_anomaly_scan()
+    except Exception as e:
+        logging.error(f"Anomaly scan failed: {e}", exc_info=True)
+        return jsonify({"error": f"An error occurred during anomaly detection: {str(e)}"}), 500
+
+    matched = filter_anomalies(scan["anomalies"], start_date, end_date,
+                               None if platform == 'all' else (platform,), None if metric == 'all' else (metric,))
+    return jsonify({
+        "anomalies": matched[::-1][:limit],
+        "total": len(matched),
+        "series": scan["series"],
+        "computed_at": scan["computed_at"],
+        "settings": {"window_days": ANOMALY_WINDOW_DAYS, "z_threshold": ANOMALY_Z_THRESHOLD,
+                     "residual_threshold": ANOMALY_RESIDUAL_THRESHOLD},
+    })
+
+
+# --- Forecast model registry ---
+# Every model has the same signature: fit(series, forecast_periods, alpha, hint=None) and returns
+# (mean, lower, upper, hint) as NumPy arrays covering the whole horizon. `hint` lets an expensive
+# model reuse what it learned on the validation fit (e.g. the ARIMA order) when refitting on the
+# full series. Models are tried cheapest first; expensive ones only run if the time budget allows.
+# The budget is checked before each model and also bounds auto_arima's order search (pmdarima's
+# StepwiseContext max_dur). The search only stops between candidate fits and always runs its first
+# few, so a request can still overrun the budget by those fits (each capped at `maxiter` iterations)
+# plus the final refit of the chosen order: a second or two on monthly series, not the whole search.
+FORECAST_SEASONAL_PERIOD = 12 # Monthly data with yearly seasonality
+FORECAST_CONFIDENCE_LEVEL = 0.95
+FORECAST_TIME_BUDGET_SECONDS = float(os.environ.get("FORECAST_TIME_BUDGET_SECONDS", 20))
+MAX_FORECAST_TIME_BUDGET_SECONDS = 120
+AUTO_ARIMA_MIN_SEARCH_SECONDS = 0.5 # Search time granted even when the budget is (nearly) spent
+_forecast_deadline = contextvars.ContextVar("forecast_deadline", default=None) # time.perf_counter() deadline of perform_forecast
+
+@contextmanager
+def forecast_deadline(deadline):
+    """Lets model fits inside the block see perform_forecast's deadline."""
+    token = _forecast_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _forecast_deadline.reset(token)
+DEFAULT_FORECAST_MONTHS = 36
+MAX_FORECAST_MONTHS = 120
+
+# auto_arima search settings, kept in one place so they can be tuned against backtest results
+AUTO_ARIMA_SEARCH_SETTINGS = {
+    "seasonal": True,
+    "m": FORECAST_SEASONAL_PERIOD,
+    "stepwise": True,
+    "max_p": 3,
+    "max_q": 3,
+    "max_P": 2,
+    "max_Q": 2,
+    "maxiter": 50,
+}
+
+def _normal_or_t_quantile(alpha, dof=None):
+    """Two-sided critical value for a (1 - alpha) interval, Student's t if degrees of freedom are known."""
+    from scipy.stats import norm, t as student_t
+    if dof:
+        return float(student_t.ppf(1 - alpha / 2, dof))
+    return float(norm.ppf(1 - alpha / 2))
+
+def _fit_linear_trend(series, hint=None):
+    """OLS trend line over the month index, plus what the prediction intervals need."""
+    y = series.to_numpy(dtype=float)
+    n = len(y)
+    x = np.arange(n, dtype=float)
+    slope, intercept = np.polyfit(x, y, 1)
+    dof = n - 2
+    residual_std = np.sqrt(np.sum((y - (intercept + slope * x)) ** 2) / dof) if dof > 0 else None
+    return {"n": n, "slope": slope, "intercept": intercept, "dof": dof, "residual_std": residual_std,
+            "x_mean": x.mean(), "sxx": np.sum((x - x.mean()) ** 2)}
+
+def _predict_linear_trend(fitted, forecast_periods, alpha):
+    """Exact prediction intervals for the fitted trend line, evaluated over the whole horizon at once."""
+    n = fitted["n"]
+    x_future = np.arange(n, n + forecast_periods, dtype=float)
+    mean = fitted["intercept"] + fitted["slope"] * x_future
+    if fitted["residual_std"] is not None:
+        standard_error = fitted["residual_std"] * np.sqrt(1 + 1 / n + (x_future - fitted["x_mean"]) ** 2 / fitted["sxx"])
+        margin = _normal_or_t_quantile(alpha, fitted["dof"]) * standard_error
+    else:
+        # A line through two points has no residual variance to estimate an interval from
+        margin = np.zeros(forecast_periods)
+    return mean, mean - margin, mean + margin, None
+
+def _fit_seasonal_naive(series, hint=None):
+    """
+    Keeps the last observed season and the seasonal error. Falls back to a plain naive (last value)
+    model when there is less than two seasons of data to estimate the seasonal error from.
+    """
+    y = series.to_numpy(dtype=float)
+    m = FORECAST_SEASONAL_PERIOD if len(y) >= 2 * FORECAST_SEASONAL_PERIOD else 1
+    residuals = y[m:] - y[:-m]
+    return {"season": y[-m:], "m": m, "residual_std": residuals.std(ddof=1) if len(residuals) > 1 else 0.0}
+
+def _predict_seasonal_naive(fitted, forecast_periods, alpha):
+    """Repeats the last observed season."""
+    m = fitted["m"]
+    steps = np.arange(forecast_periods)
+    mean = fitted["season"][steps % m]
+    # Error grows with the number of whole seasons (or steps, for m=1) ahead
+    seasons_ahead = steps // m + 1
+    margin = _normal_or_t_quantile(alpha) * fitted["residual_std"] * np.sqrt(seasons_ahead)
+    return mean, mean - margin, mean + margin, None
+
+def _fit_ets(series, hint=None):
+    """Damped additive Holt-Winters (statsmodels ETS)."""
+    from statsmodels.tsa.exponential_smoothing.ets import ETSModel
+    y = series.asfreq('MS') if series.index.freq is None else series
+    seasonal = "add" if len(y) >= 2 * FORECAST_SEASONAL_PERIOD else None
+    model = ETSModel(y.astype(float), error="add", trend="add", damped_trend=True,
+                     seasonal=seasonal, seasonal_periods=FORECAST_SEASONAL_PERIOD if seasonal else None)
+    return {"results": model.fit(disp=False), "n": len(y)}
+
+def _predict_ets(fitted, forecast_periods, alpha):
+    """ETS forecast with analytical prediction intervals."""
+    n = fitted["n"]
+    frame = fitted["results"].get_prediction(start=n, end=n + forecast_periods - 1).summary_frame(alpha=alpha)
+    return frame["mean"].to_numpy(), frame["pi_lower"].to_numpy(), frame["pi_upper"].to_numpy(), None
+
+def _fit_auto_arima(series, hint=None):
+    """
+    Seasonal ARIMA. Without a hint this runs the (expensive) auto_arima order search;
+    with a hint it refits the already-selected order, which is much cheaper.
+    """
+    from pmdarima import auto_arima, ARIMA
+    if hint:
+        model = ARIMA(order=hint["order"], seasonal_order=hint["seasonal_order"],
+                      suppress_warnings=True, maxiter=AUTO_ARIMA_SEARCH_SETTINGS["maxiter"])
+        model.fit(series)
+        return model
+    deadline = _forecast_deadline.get()
+    if deadline is None:
+        return auto_arima(series, suppress_warnings=True, error_action="ignore", trace=False, **AUTO_ARIMA_SEARCH_SETTINGS)
+    from pmdarima.arima import StepwiseContext
+    with StepwiseContext(max_dur=max(deadline - time.perf_counter(), AUTO_ARIMA_MIN_SEARCH_SECONDS)):
+        return auto_arima(series, suppress_warnings=True, error_action="ignore", trace=False, **AUTO_ARIMA_SEARCH_SETTINGS)
+
+def _predict_auto_arima(model, forecast_periods, alpha):
+    """ARIMA forecast with its confidence intervals; the hint is the fitted order, for cheap refits."""
+    forecast, conf_int = model.predict(n_periods=forecast_periods, return_conf_int=True, alpha=alpha)
+    hint = {"order": model.order, "seasonal_order": model.seasonal_order}
+    return np.asarray(forecast, dtype=float), conf_int[:, 0], conf_int[:, 1], hint
+
+def _fit_and_predict(fit_model, predict):
+    """
+    The registry's one-shot `fit(series, forecast_periods, alpha, hint=None)`, returning
+    (mean, lower, upper, hint). `fit_model` and `predict` stay separate for the backtest's timings.
+    """
+    def fit(series, forecast_periods, alpha, hint=None):
+        return predict(fit_model(series, hint=hint), forecast_periods, alpha)
+    return fit
+
+# Ordered cheapest first. `min_points` applies to the series a model is fitted on;
+# `default_cost` (seconds) is used until the first fit has been timed in this process.
+# `fit` does both steps; `fit_model(series, hint)` and `predict(fitted, forecast_periods, alpha)` are the two halves.
+FORECAST_MODELS = {
+    "seasonal_naive": {"fit_model": _fit_seasonal_naive, "predict": _predict_seasonal_naive,
+                       "min_points": 3, "expensive": False, "default_cost": 0.01},
+    "linear_trend": {"fit_model": _fit_linear_trend, "predict": _predict_linear_trend,
+                     "min_points": 2, "expensive": False, "default_cost": 0.01},
+    "ets": {"fit_model": _fit_ets, "predict": _predict_ets, "min_points": 10, "expensive": False, "default_cost": 0.5},
+    "auto_arima": {"fit_model": _fit_auto_arima, "predict": _predict_auto_arima,
+                   "min_points": 24, "expensive": True, "default_cost": 8.0},
+}
+for _model in FORECAST_MODELS.values():
+    _model["fit"] = _fit_and_predict(_model["fit_model"], _model["predict"])
+
+# Moving average of observed fit times per model, used to decide whether a model fits in the remaining budget
+_forecast_model_costs = {}
+
+def _record_model_cost(model_name, seconds):
+    previous = _forecast_model_costs.get(model_name)
+    _forecast_model_costs[model_name] = seconds if previous is None else 0.7 * previous + 0.3 * seconds
+
+def _estimated_model_cost(model_name):
+    return _forecast_model_costs.get(model_name, FORECAST_MODELS[model_name]["default_cost"])
+
+def _smape(actual, predicted):
+    """Symmetric mean absolute percentage error, in percent (0 where both values are 0)."""
+    denominator = np.abs(actual) + np.abs(predicted)
+    ratio = np.divide(2 * np.abs(predicted - actual), denominator,
+                      out=np.zeros_like(denominator, dtype=float), where=denominator != 0)
+    return float(np.mean(ratio) * 100)
+
+def _format_forecast_results(last_historical_date, mean, lower, upper):
+    """Turns forecast arrays into the [{date, value, lower_bound, upper_bound}] list the frontend expects."""
+    forecast_periods = len(mean)
+    # Starting from the month AFTER the last historical month
+    forecast_dates = pd.date_range(start=last_historical_date + timedelta(days=1), periods=forecast_periods, freq='MS')
+
+    # Enforce non-negativity for engagement/reach/sales type metrics
+    values = np.round(np.clip(mean, 0, None), 2)
+    lower_bounds = np.round(np.clip(lower, 0, None), 2)
+    upper_bounds = np.round(np.clip(upper, 0, None), 2)
+
+    return [
+        {"date": date, "value": value, "lower_bound": lower_bound, "upper_bound": upper_bound}
+        for date, value, lower_bound, upper_bound in zip(forecast_dates.strftime('%Y-%m-%d'), values.tolist(),
+                                                         lower_bounds.tolist(), upper_bounds.tolist())
+    ]
+
+def perform_forecast(series, forecast_periods, time_budget=None, models=None):
+    """
+    Selects and fits a forecast model within a time budget.
+    Cheap models are scored first on a hold-out of the most recent months (sMAPE);
+    expensive models (auto_arima) are only tried if their expected cost fits in the remaining budget.
+    The winner is refitted on the full series.
+
+    Args:
+        series (pd.Series): Monthly series indexed by month start.
+        forecast_periods (int): Number of months to forecast.
+        time_budget (float): Seconds available for model selection (defaults to FORECAST_TIME_BUDGET_SECONDS).
+        models (list): Restrict selection to these registry names, in this order.
+
+    Returns:
+        tuple: (forecast_results, last_historical_date, selection) where selection describes the chosen
+               model, each candidate's hold-out score and the forecast distribution (unclipped mean and
+               standard error per month).
+    """
+    time_budget = FORECAST_TIME_BUDGET_SECONDS if time_budget is None else time_budget
+    deadline = time.perf_counter() + time_budget
+    candidates = models or list(FORECAST_MODELS)
+    alpha = 1 - FORECAST_CONFIDENCE_LEVEL
+
+    last_historical_date = series.index.max() if not series.empty else None
+    selection = {"model": None, "scores": {}}
+    if len(series) < 2:
+        logging.warning("Not enough data to forecast. Returning empty forecast.")
+        return [], last_historical_date, selection
+
+    # Hold out the most recent months for scoring, but only when there is enough history left to train on
+    holdout = min(FORECAST_SEASONAL_PERIOD, len(series) // 4)
+    train, test = (series.iloc[:-holdout], series.iloc[-holdout:]) if holdout >= 3 else (series, None)
+
+    best_name, best_score, best_hint = None, float('inf'), None
+    for model_name in candidates:
+        model = FORECAST_MODELS[model_name]
+        if len(train) < model["min_points"]:
+            continue
+        # Expensive models need time for the validation fit plus the refit
+        remaining = deadline - time.perf_counter()
+        expected_cost = _estimated_model_cost(model_name) * (1.5 if model["expensive"] else 1)
+        if best_name is not None and expected_cost > remaining:
+            logging.info(f"Skipping forecast model '{model_name}': expected {expected_cost:.1f}s, {remaining:.1f}s of budget left.")
+            continue
+
+        started = time.perf_counter()
+        try:
+            if test is None:
+                # Too short to validate: take the first applicable model in priority order
+                score, hint = None, None
+            else:
+                with forecast_deadline(deadline):
+                    mean, _, _, hint = model["fit"](train, holdout, alpha)
+                score = _smape(test.to_numpy(dtype=float), np.clip(mean, 0, None))
+        except Exception as e:
+            logging.warning(f"Forecast model '{model_name}' failed during selection: {e}")
+            continue
+        finally:
+            _record_model_cost(model_name, time.perf_counter() - started)
+
+        selection["scores"][model_name] = None if score is None else round(score, 2)
+        if score is None:
+            best_name, best_hint = model_name, hint
+            break
+        if score < best_score:
+            best_name, best_score, best_hint = model_name, score, hint
+
+    # Refit the winner on the full series, falling back to the linear trend if it fails
+    for model_name in ([best_name] if best_name else []) + ["linear_trend"]:
+        try:
+            with forecast_deadline(deadline):
+                mean, lower, upper, _ = FORECAST_MODELS[model_name]["fit"](series, forecast_periods, alpha, hint=best_hint if model_name == best_name else None)
+        except Exception as e:
+            logging.error(f"Forecast model '{model_name}' failed on the full series: {e}", exc_info=True)
+            continue
+        selection["model"] = model_name
+        # Unclipped mean and per-month standard error implied by the model's interval, for scenario simulation
+        selection["distribution"] = {"mean": np.asarray(mean, dtype=float).tolist(),
+                                     "sigma": ((np.asarray(upper, dtype=float) - np.asarray(lower, dtype=float))
+                                               / (2 * _normal_or_t_quantile(alpha))).tolist()}
+        logging.info(f"Selected forecast model '{model_name}' (hold-out sMAPE scores: {selection['scores']}).")
+        return _format_forecast_results(last_historical_date, mean, lower, upper), last_historical_date, selection
+
+    return [], last_historical_date, selection
+
 def perform_arima_forecast(series, forecast_periods):
     """
     Performs ARIMA forecasting on a given time series.
@@ -860,49 +3663,14 @@ def perform_arima_forecast(series, forecast_periods):
     # even if ARIMA can't run.
     last_historical_date = series.index.max() if not series.empty else None
 
-    # Check for minimum data points for ARIMA
-    # For monthly data, pmdarima generally needs more than 5 points for robust seasonality.
     # A common rule of thumb is at least 2 seasons (24 points for monthly data with m=12).
-    # If less than 2, perform_linear_regression_forecast will also warn.
-    if len(series) < 24: # Adjusted minimum data points for monthly ARIMA with seasonality
+    if len(series) < FORECAST_MODELS["auto_arima"]["min_points"]:
         logging.warning(f"Insufficient data ({len(series)} points) for robust ARIMA with monthly seasonality. Falling back to Linear Regression.")
-        # Pass the original series to linear regression for it to handle its own data requirements
         return perform_linear_regression_forecast(series, forecast_periods), last_historical_date
 
     try:
-        # Fit auto_arima model
-        # Using seasonal=True and m=12 for monthly seasonality
-        model = auto_arima(series, seasonal=True, m=12, suppress_warnings=True,
-                           error_action="ignore", trace=False, stepwise=True)
-        
-        # Make predictions including confidence intervals
-        forecast, conf_int = model.predict(n_periods=forecast_periods, return_conf_int=True)
-
-        forecast_results = []
-        
-        # Generate future dates for the forecast
-        # Starting from the month AFTER the last historical month
-        # Using MonthEnd (ME) to align with typical monthly data points
-        forecast_dates = pd.date_range(start=series.index.max() + timedelta(days=1), periods=forecast_periods, freq='MS')
-        
-        for i in range(forecast_periods):
-            # Ensure predicted values are not negative for engagement/reach type metrics
-            predicted_value = round(float(forecast.iloc[i]), 2)
-            lower_bound = round(float(conf_int[i][0]), 2)
-            upper_bound = round(float(conf_int[i][1]), 2)
-
-            # Enforce non-negativity for appropriate metrics
-            if predicted_value < 0:
-                predicted_value = 0
-            if lower_bound < 0:
-                lower_bound = 0
-
-            forecast_results.append({
-                "date": forecast_dates[i].strftime('%Y-%m-%d'), # Format date as YYYY-MM-DD
-                "value": predicted_value,
-                "lower_bound": lower_bound,
-                "upper_bound": upper_bound
-            })
+        mean, lower, upper, _ = FORECAST_MODELS["auto_arima"]["fit"](series, forecast_periods, 1 - FORECAST_CONFIDENCE_LEVEL)
+        forecast_results = _format_forecast_results(last_historical_date, mean, lower, upper)
         logging.info(f"ARIMA forecast results: {forecast_results}")
         return forecast_results, last_historical_date
 
@@ -915,53 +3683,36 @@ def perform_arima_forecast(series, forecast_periods):
 def perform_linear_regression_forecast(series, forecast_periods):
     """
     Performs Linear Regression forecasting as a fallback.
-    Returns forecasted values, assuming no confidence intervals for simplicity.
+    Returns forecasted values with OLS prediction intervals.
     """
     logging.info(f"Performing Linear Regression forecast for {len(series)} data points.")
     if len(series) < 2: # Need at least two points for a line
         logging.warning("Not enough data for Linear Regression. Returning empty forecast.")
         return []
 
-    # Create numerical representation of dates (e.g., months since epoch or first date)
-    # Using ordinal dates for linear regression
-    first_date_ordinal = series.index.min().toordinal()
-    X = np.array([dt.toordinal() - first_date_ordinal for dt in series.index]).reshape(-1, 1) 
-    y = series.values # Metric values
-
-    model = LinearRegression()
-    model.fit(X, y)
-
-    last_historical_date_ordinal = series.index.max().toordinal()
-    
-    forecast_results = []
-    # Generate future dates for the forecast
-    # Starting from the month AFTER the last historical month
-    forecast_dates = pd.date_range(start=series.index.max() + timedelta(days=1), periods=forecast_periods, freq='MS')
-
-    for i in range(forecast_periods):
-        future_date_ordinal = forecast_dates[i].toordinal() - first_date_ordinal
-        predicted_value = round(float(model.predict(np.array([[future_date_ordinal]]))[0]), 2)
-        
-        # Enforce non-negativity for appropriate metrics
-        if predicted_value < 0:
-            predicted_value = 0
-
-        # Simple proxy for CI, also ensuring non-negativity
-        lower_bound = round(float(predicted_value * 0.9), 2) 
-        upper_bound = round(float(predicted_value * 1.1), 2)  
-        
-        if lower_bound < 0:
-            lower_bound = 0
-
-        forecast_results.append({
-            "date": forecast_dates[i].strftime('%Y-%m-%d'), # Format date as YYYY-MM-DD
-            "value": predicted_value,
-            "lower_bound": lower_bound,
-            "upper_bound": upper_bound
-        })
+    mean, lower, upper, _ = FORECAST_MODELS["linear_trend"]["fit"](series, forecast_periods, 1 - FORECAST_CONFIDENCE_LEVEL)
+    forecast_results = _format_forecast_results(series.index.max(), mean, lower, upper)
     logging.info(f"Linear Regression forecast results: {forecast_results}")
     return forecast_results
 
+def parse_forecast_request_args(args):
+    """
+    Reads and clamps the forecast_months and time_budget query parameters.
+    Returns (forecast_months, time_budget).
+    """
+    forecast_months = args.get('forecast_months', DEFAULT_FORECAST_MONTHS, type=int) or DEFAULT_FORECAST_MONTHS
+    forecast_months = max(1, min(forecast_months, MAX_FORECAST_MONTHS))
+    time_budget = args.get('time_budget', FORECAST_TIME_BUDGET_SECONDS, type=float)
+    time_budget = max(0.0, min(time_budget, MAX_FORECAST_TIME_BUDGET_SECONDS))
+    return forecast_months, time_budget
+
+def describe_forecast_horizon(forecast_periods):
+    """Human-readable horizon for recommendation text, e.g. '3 years' or '18 months'."""
+    if forecast_periods % 12 == 0:
+        years = forecast_periods // 12
+        return f"{years} year" if years == 1 else f"{years} years"
+    return f"{forecast_periods} months" if forecast_periods != 1 else "month"
+
 def generate_recommendation(historical_series, forecast_results, metric_name):
     """
     Generates a recommendation based on historical and forecasted trends for monthly data,
@@ -982,24 +3733,26 @@ def generate_recommendation(historical_series, forecast_results, metric_name):
             overall_forecast_change_percent = ((forecast_results[0]['value'] - last_historical_value) / last_historical_value) * 100 if last_historical_value != 0 else 0
 
 
+        horizon = describe_forecast_horizon(len(forecast_results))
+
         # Use the next month's forecast for the immediate value in the first sentence
         forecast_value_next_month = forecast_results[0]['value'] if forecast_results else last_historical_value
 
         recommendation = f"Based on historical data and projected trends, your {metric_name} is forecasted to be around {forecast_value_next_month:,.0f} next month."
 
         if overall_forecast_change_percent > 5:
-            recommendation += (f" The long-term forecast indicates a strong positive growth of approximately +{overall_forecast_change_percent:.1f}% over the next 3 years. "
+            recommendation += (f" The long-term forecast indicates a strong positive growth of approximately +{overall_forecast_change_percent:.1f}% over the next {horizon}. "
                                f"This is an excellent sign for {metric_name} performance and suggests sustained positive momentum. "
                                f"Consider doubling down on successful strategies that have driven this growth, and explore opportunities to scale up initiatives contributing to this positive outlook. "
                                f"Proactive investment in these areas can lead to significant long-term gains.")
         elif overall_forecast_change_percent < -5:
-            recommendation += (f" The long-term forecast indicates a potential decline of approximately -{-overall_forecast_change_percent:.1f}% over the next 3 years. "
+            recommendation += (f" The long-term forecast indicates a potential decline of approximately -{-overall_forecast_change_percent:.1f}% over the next {horizon}. "
                                f"This trend could significantly impact overall business objectives. "
                                f"It's crucial to immediately analyze recent activities and market shifts to identify root causes of this projected decline. "
                                f"We recommend re-evaluating your current strategy for {metric_name} to mitigate this trend and implement corrective actions to stabilize or reverse the decline. "
                                f"Early intervention is key to preventing further losses.")
         else:
-            recommendation += (f" The long-term forecast indicates a relatively stable trend ({overall_forecast_change_percent:.1f}%) over the next 3 years. "
+            recommendation += (f" The long-term forecast indicates a relatively stable trend ({overall_forecast_change_percent:.1f}%) over the next {horizon}. "
                                f"While stability can be good, it also suggests a lack of significant growth. "
                                f"Continue optimizing current efforts, but also explore new avenues or innovative strategies to stimulate further growth and achieve higher {metric_name} targets. "
                                f"Consider A/B testing new approaches, targeting new segments, or diversifying your efforts to break through current plateaus.")
@@ -1009,10 +3762,11 @@ def generate_recommendation(historical_series, forecast_results, metric_name):
         return f"Not enough data to provide a comprehensive recommendation for {metric_name}. Please upload more historical data to enable robust forecasting and insights."
 
 # NEW FUNCTION: Generate Performance Insights
-def generate_performance_insights(social_data_df, sales_data_df, start_date, end_date, platform_filter):
+def generate_performance_insights(social_data_df, sales_data_df, start_date, end_date, platform_filter, anomalies=None):
     """
     Generates text-based insights for overall performance based on aggregated social and sales data.
     This function analyzes trends and provides actionable recommendations.
+    `anomalies` (from the anomaly scan, already filtered to the period and platform) adds a note on unusual days.
     """
     insights = []
     period_str = ""
@@ -1081,6 +3835,19 @@ def generate_performance_insights(social_data_df, sales_data_df, start_date, end
     else:
         insights.append(f"No social media reach data available{platform_str} for the selected period. ")
 
+    # Insight for unusual days, most extreme first
+    if anomalies:
+        def severity(anomaly):
+            return max(abs(anomaly["robust_z"] or 0), abs(anomaly["seasonal_score"] or 0))
+        notable = sorted(anomalies, key=severity, reverse=True)[:ANOMALY_INSIGHT_EXAMPLES]
+        examples = "; ".join(
+            f"{ANOMALY_PLATFORM_LABELS[anomaly['platform']]} {anomaly['metric']} "
+            f"{'spiked' if anomaly['direction'] == 'spike' else 'dropped'} on {anomaly['date']} ({anomaly['value']:,.0f}"
+            + (f" vs. a typical {anomaly['expected']:,.0f})" if anomaly['expected'] is not None else ")")
+            for anomaly in notable)
+        insights.append(f"{len(anomalies)} unusual day{'s' if len(anomalies) != 1 else ''} stood out{period_str}: {examples}. "
+                        f"Check what drove these days (campaigns, outages, promotions) before reading trends from them. ")
+
     return " ".join(insights)
 
 
@@ -1190,236 +3957,1026 @@ def get_recommendation_text(correlation, var1_name, var2_name, series1, series2,
 
     return message
 
+PREDICTIVE_METRIC_NAMES = {
+    'sales': "Sales Revenue",
+    'engagement': "Engagement",
+    'reach': "Reach",
+}
+
+def build_metric_series(metric_type, sales_records=None, tiktok_records=None, facebook_records=None):
+    """
+    Builds the raw (daily, date-indexed) historical series for a predictive metric
+    from already-fetched Supabase records.
+    Raises ValueError if the records are missing a 'date' column.
+    """
+    if metric_type == 'sales':
+        with pipeline_stage("build_frames"):
+            df = records_to_frame(sales_records)
+        # Check if 'date' column exists before processing
+        if 'date' not in df.columns:
+            raise ValueError(f"Missing 'date' column in sales data for {metric_type}. Please check your uploaded sales data for a 'date' column.")
+        with pipeline_stage("coerce"):
+            df['date'] = pd.to_datetime(df['date'], errors='coerce') # Coerce errors will turn invalid dates into NaT
+            df = df.dropna(subset=['date']) # Drop rows where date parsing failed
+            df['revenue'] = pd.to_numeric(df['revenue'], errors='coerce').fillna(0)
+            df = df.set_index('date')
+        return df['revenue']
+
+    with pipeline_stage("build_frames"):
+        df = _combine_social_records(tiktok_records, facebook_records)
+    # Check if 'date' column exists after combining data before processing
+    if 'date' not in df.columns:
+        raise ValueError(f"Missing 'date' column in combined data for {metric_type}. Please check your uploaded TikTok and Facebook data for a 'date' column.")
+    with pipeline_stage("coerce"):
+        df['date'] = pd.to_datetime(df['date'], errors='coerce') # Coerce errors will turn invalid dates into NaT
+        df = df.dropna(subset=['date']) # Drop rows where date parsing failed
+
+        if metric_type == 'engagement':
+            df['value'] = pd.to_numeric(df['likes'], errors='coerce').fillna(0) + \
+                          pd.to_numeric(df['comments'], errors='coerce').fillna(0) + \
+                          pd.to_numeric(df['shares'], errors='coerce').fillna(0)
+        else: # metric_type == 'reach'
+            df['value'] = pd.to_numeric(df['views'], errors='coerce').fillna(0)
+
+        df = df.set_index('date')
+    return df['value']
+
+def _combine_social_records(tiktok_records, facebook_records):
+    """Stacks TikTok and Facebook records into one frame with a shared 'views' reach column."""
+    if isinstance(tiktok_records, pd.DataFrame) or isinstance(facebook_records, pd.DataFrame):
+        return _combine_social_frames(tiktok_records, facebook_records)
+
+    combined_data = []
+
+    # Include TikTok data
+    for item in tiktok_records or []:
+        # Ensure 'date' exists in item before trying to access
+        if 'date' in item:
+            combined_data.append({
+                "date": item.get('date'),
+                "likes": item.get('likes', 0),
+                "comments": item.get('comments', 0),
+                "shares": item.get('shares', 0),
+                "views": item.get('views', 0) # TikTok uses 'views'
+            })
+        else:
+            logging.warning(f"TikTok record missing 'date' key: {item}")
+
+    for item in facebook_records or []:
+        # Ensure 'date' exists in item before trying to access
+        if 'date' in item:
+            combined_data.append({
+                "date": item.get('date'),
+                "likes": item.get('likes', 0),
+                "comments": item.get('comments', 0),
+                "shares": item.get('shares', 0),
+                "views": item.get('reach', 0) # Facebook uses 'reach'
+            })
+        else:
+            logging.warning(f"Facebook record missing 'date' key: {item}")
+
+    return pd.DataFrame(combined_data)
+
+def _combine_social_frames(tiktok_frame, facebook_frame):
+    """Column-wise version of _combine_social_records for fetch_frame results."""
+    stacked = []
+    for frame, reach_column in ((records_to_frame(tiktok_frame), 'views'), (records_to_frame(facebook_frame), 'reach')):
+        if frame.empty or 'date' not in frame.columns:
+            continue
+        stacked.append(pd.DataFrame({
+            "date": frame['date'],
+            "likes": frame.get('likes', 0),
+            "comments": frame.get('comments', 0),
+            "shares": frame.get('shares', 0),
+            "views": frame.get(reach_column, 0) # TikTok uses 'views', Facebook uses 'reach'
+        }))
+    return pd.concat(stacked, ignore_index=True) if stacked else pd.DataFrame()
+
+def prepare_monthly_forecast_series(historical_series):
+    """
+    Resamples a daily historical series to monthly totals and drops the current
+    (incomplete) calendar month so it does not drag the forecast down.
+    """
+    # Resample to MONTHLY data. If a month has no data, it will be NaN.
+    with pipeline_stage("resample"):
+        historical_series_monthly = historical_series.resample('MS').sum() # 'MS' for Month Start
+    logging.info(f"Initial monthly historical series before dropping NaNs:\n{historical_series_monthly}")
+
+    # --- LOGIC TO Exclude INCOMPLETE current month data from historical for forecasting ---
+    current_calendar_date = datetime.now()
+    current_calendar_year = current_calendar_date.year
+    current_calendar_month = current_calendar_date.month
+
+    # Determine the cutoff date for historical data to be used in the model.
+    # If the current calendar day is NOT the last day of the month, then the current calendar month's
+    # data is inherently incomplete for monthly aggregation purposes.
+    # For simplicity, if it's not the first day of the next month, we exclude the current month.
+    if current_calendar_date.day < pd.Timestamp(current_calendar_date).days_in_month:
+        # If it's not the last day of the month, exclude the current month
+        last_complete_historical_date_for_model = (current_calendar_date.replace(day=1) - timedelta(days=1)).replace(day=1)
+        logging.info(f"Current calendar month {current_calendar_month}/{current_calendar_year} is incomplete (day is {current_calendar_date.day}). "
+                     f"Historical data for model training will end at {last_complete_historical_date_for_model.strftime('%Y-%m-%d')}.")
+    else:
+        # If it's the last day of the month, the current month is considered complete.
+        last_complete_historical_date_for_model = current_calendar_date.replace(day=1) # Start of current month
+        logging.info(f"Current calendar month {current_calendar_month}/{current_calendar_year} is complete (day is {current_calendar_date.day}). "
+                     f"Historical data for model training will end at {last_complete_historical_date_for_model.strftime('%Y-%m-%d')}.")
+
+    # Filter the monthly resampled series to only include months up to last_complete_historical_date_for_model.
+    # Drop NaNs *after* this filtering to ensure we only have data for months we intend to include.
+    historical_series_for_forecast = historical_series_monthly[historical_series_monthly.index <= last_complete_historical_date_for_model].dropna()
+
+    logging.info(f"Historical series FOR FORECASTING MODEL (after filtering for complete months):\n{historical_series_for_forecast}")
+    # --- END LOGIC ---
+    return historical_series_for_forecast
+
+def build_predictive_response(historical_series_for_forecast, forecast_results, metric_name, selection=None):
+    """
+    Builds the JSON-ready predictive analytics payload (historical points, forecast, recommendation).
+    `selection` is the model selection summary returned by perform_forecast.
+    """
+    # Format historical data for frontend plotting (using the filtered series)
+    # Ensure historical data is sorted by date; round all values at once rather than per point
+    historical_sorted = historical_series_for_forecast.sort_index()
+    historical_formatted = [
+        {'date': date, 'value': value} # Date as YYYY-MM-DD
+        for date, value in zip(historical_sorted.index.strftime('%Y-%m-%d'),
+                               np.round(historical_sorted.to_numpy(dtype=float), 2).tolist())
+    ]
+
+    # Generate recommendation
+    recommendation = generate_recommendation(historical_series_for_forecast, forecast_results, metric_name)
+
+    return {
+        "historical_data": historical_formatted,
+        "forecast_data": forecast_results,
+        "recommendation": recommendation,
+        "model": (selection or {}).get("model"),
+        "model_scores": (selection or {}).get("scores", {}),
+        "message": "Predictive analytics successful."
+    }
+
+def insufficient_history_response(metric_name):
+    """Payload returned when there are fewer than 24 complete months to forecast from."""
+    return {
+        "historical_data": [], # No historical data for plot if filtered too much
+        "forecast_data": [],
+        "recommendation": f"Not enough complete historical data (at least 24 months) to generate a robust monthly forecast for {metric_name}. Please upload more complete historical data.",
+        "message": "Not enough complete historical data for forecasting."
+    }
+
 @app.route('/api/predictive-analytics', methods=['GET'])
 @verify_token
+@profile_on_request
 def predictive_analytics():
     """
     API endpoint for predictive analytics.
     Fetches historical data, performs forecasting (ARIMA or Linear Regression fallback),
     and generates recommendations.
+    Query params: metric_type, forecast_months (default 36), time_budget (seconds for model selection).
     """
-    metric_type = request.args.get('metric_type')
+    metric_type = (request.args.get('metric_type') or '').strip().lower()
+    forecast_periods, time_budget = parse_forecast_request_args(request.args)
     if not metric_type:
         return jsonify({"error": "Metric type is required (e.g., 'sales', 'engagement', 'reach')."}), 400
 
     metric_name = ""
     
     try:
-        if metric_type == 'sales':
-            metric_name = "Sales Revenue"
-            # Ensure limit=None is passed so fetch_table paginates to get all data
-            sales_records = fetch_table("sales", select="date,revenue", order="date.asc", limit=None)
-            df = pd.DataFrame(sales_records)
-            # Check if 'date' column exists before processing
-            if 'date' not in df.columns:
-                return jsonify({"error": f"Missing 'date' column in sales data for {metric_type}. Please check your uploaded sales data for a 'date' column."}), 400
-            df['date'] = pd.to_datetime(df['date'], errors='coerce') # Coerce errors will turn invalid dates into NaT
-            df = df.dropna(subset=['date']) # Drop rows where date parsing failed
-            df['revenue'] = pd.to_numeric(df['revenue'], errors='coerce').fillna(0)
-            df = df.set_index('date')
-            historical_series = df['revenue']
+        if metric_type not in PREDICTIVE_METRIC_NAMES:
+            return jsonify({"error": "Unsupported metric type."}), 400
+        metric_name = PREDICTIVE_METRIC_NAMES[metric_type]
 
-        elif metric_type == 'engagement' or metric_type == 'reach':
-            metric_name = "Engagement" if metric_type == 'engagement' else "Reach"
-            
-            # Ensure limit=None is passed so fetch_table paginates to get all data
-            tiktok_records = fetch_table("tiktokdata", select="date,views,likes,comments,shares", order="date.asc", limit=None)
-            facebook_records = fetch_table("facebookdata", select="date,likes,comments,shares,reach", order="date.asc", limit=None)
-            
-            combined_data = []
-            
-            # Include TikTok data
-            for item in tiktok_records:
-                # Ensure 'date' exists in item before trying to access
-                if 'date' in item:
-                    combined_data.append({
-                        "date": item.get('date'),
-                        "likes": item.get('likes', 0),
-                        "comments": item.get('comments', 0),
-                        "shares": item.get('shares', 0),
-                        "views": item.get('views', 0) # TikTok uses 'views'
-                    })
-                else:
-                    logging.warning(f"TikTok record missing 'date' key: {item}")
-            
-            for item in facebook_records:
-                # Ensure 'date' exists in item before trying to access
-                if 'date' in item:
-                    combined_data.append({
-                        "date": item.get('date'),
-                        "likes": item.get('likes', 0),
-                        "comments": item.get('comments', 0),
-                        "shares": item.get('shares', 0),
-                        "views": item.get('reach', 0) # Facebook uses 'reach'
-                    })
-                else:
-                    logging.warning(f"Facebook record missing 'date' key: {item}")
+        payload, status_code = cached_analytics(
+            ("predictive-analytics", metric_type, forecast_periods, time_budget),
+            lambda: compute_predictive_analytics(metric_type, forecast_periods, time_budget))
+        return jsonify(payload), status_code
 
+    except Exception as e:
+        logging.error(f"Server error during predictive analytics for {metric_type}: {e}", exc_info=True)
+        return jsonify({"error": f"An error occurred during predictive analytics for {metric_name}: {str(e)}"}), 500
 
-            df = pd.DataFrame(combined_data)
-            # Check if 'date' column exists after combining data before processing
-            if 'date' not in df.columns:
-                return jsonify({"error": f"Missing 'date' column in combined data for {metric_type}. Please check your uploaded TikTok and Facebook data for a 'date' column."}), 400
-            df['date'] = pd.to_datetime(df['date'], errors='coerce') # Coerce errors will turn invalid dates into NaT
-            df = df.dropna(subset=['date']) # Drop rows where date parsing failed
-            
-            if metric_type == 'engagement':
-                df['value'] = pd.to_numeric(df['likes'], errors='coerce').fillna(0) + \
-                              pd.to_numeric(df['comments'], errors='coerce').fillna(0) + \
-                              pd.to_numeric(df['shares'], errors='coerce').fillna(0)
-            else: # metric_type == 'reach'
-                df['value'] = pd.to_numeric(df['views'], errors='coerce').fillna(0)
-            
-            df = df.set_index('date')
-            historical_series = df['value']
+def compute_predictive_analytics(metric_type, forecast_periods, time_budget=None):
+    """Fetches history for one metric and forecasts it. Returns (payload, status_code)."""
+    payload, status_code, _ = fit_metric_forecast(metric_type, forecast_periods, time_budget)
+    return payload, status_code
 
-        else:
-            return jsonify({"error": "Unsupported metric type."}), 400
+def fit_metric_forecast(metric_type, forecast_periods, time_budget=None, generation=None):
+    """
+    Fetches history for one metric and forecasts it. Returns (payload, status_code, forecast_model), where
+    forecast_model is the cached scenario basis (see store_forecast_model), or None if nothing was fitted.
+    `generation` is the analytics cache generation the caller read before starting (read here if None).
+    """
+    metric_name = PREDICTIVE_METRIC_NAMES[metric_type]
+    if generation is None:
+        generation = current_analytics_generation()
 
-        # Resample to MONTHLY data. If a month has no data, it will be NaN.
-        historical_series_monthly = historical_series.resample('MS').sum() # 'MS' for Month Start
-        logging.info(f"Initial monthly historical series before dropping NaNs:\n{historical_series_monthly}")
-        
-        # --- LOGIC TO Exclude INCOMPLETE current month data from historical for forecasting ---
-        current_calendar_date = datetime.now()
-        current_calendar_year = current_calendar_date.year
-        current_calendar_month = current_calendar_date.month
-
-        # Determine the cutoff date for historical data to be used in the model.
-        # If the current calendar day is NOT the last day of the month, then the current calendar month's
-        # data is inherently incomplete for monthly aggregation purposes.
-        # For simplicity, if it's not the first day of the next month, we exclude the current month.
-        if current_calendar_date.day < pd.Timestamp(current_calendar_date).days_in_month:
-            # If it's not the last day of the month, exclude the current month
-            last_complete_historical_date_for_model = (current_calendar_date.replace(day=1) - timedelta(days=1)).replace(day=1)
-            logging.info(f"Current calendar month {current_calendar_month}/{current_calendar_year} is incomplete (day is {current_calendar_date.day}). "
-                         f"Historical data for model training will end at {last_complete_historical_date_for_model.strftime('%Y-%m-%d')}.")
-        else:
-            # If it's the last day of the month, the current month is considered complete.
-            last_complete_historical_date_for_model = current_calendar_date.replace(day=1) # Start of current month
-            logging.info(f"Current calendar month {current_calendar_month}/{current_calendar_year} is complete (day is {current_calendar_date.day}). "
-                         f"Historical data for model training will end at {last_complete_historical_date_for_model.strftime('%Y-%m-%d')}.")
-
-        # Filter the monthly resampled series to only include months up to last_complete_historical_date_for_model.
-        # Drop NaNs *after* this filtering to ensure we only have data for months we intend to include.
-        historical_series_for_forecast = historical_series_monthly[historical_series_monthly.index <= last_complete_historical_date_for_model].dropna()
-
-        logging.info(f"Historical series FOR FORECASTING MODEL (after filtering for complete months):\n{historical_series_for_forecast}")
-
-        # Ensure we still have enough data after filtering for complete months
-        # For monthly data with m=12, a minimum of 24 points (2 seasons) is recommended for ARIMA.
-        if historical_series_for_forecast.empty or len(historical_series_for_forecast) < 24:
-            return jsonify({
-                "historical_data": [], # No historical data for plot if filtered too much
-                "forecast_data": [],
-                "recommendation": f"Not enough complete historical data (at least 24 months) to generate a robust monthly forecast for {metric_name}. Please upload more complete historical data.",
-                "message": "Not enough complete historical data for forecasting."
-            }), 200
-        # --- END LOGIC ---
-
-        last_historical_date_for_forecast_model = historical_series_for_forecast.index.max() 
-        
-        # Fixed forecast periods to 36 months (3 years)
-        forecast_periods = 36
+    # Ensure limit=None is passed so fetch_table paginates to get all data
+    if metric_type == 'sales':
+        source_records = {
+            "sales_records": fetch_frame("sales", SALES_REVENUE_COLUMNS, order="date.asc", wire_format=ANALYTICS_WIRE_FORMAT)
+        }
+    else:
+        source_records = {
+            "tiktok_records": fetch_frame("tiktokdata", TIKTOK_METRIC_COLUMNS, order="date.asc", wire_format=ANALYTICS_WIRE_FORMAT),
+            "facebook_records": fetch_frame("facebookdata", FACEBOOK_METRIC_COLUMNS, order="date.asc", wire_format=ANALYTICS_WIRE_FORMAT)
+        }
 
-        logging.info(f"Forecasting {forecast_periods} periods starting from the month after {last_historical_date_for_forecast_model.strftime('%Y-%m-%d')}.")
+    try:
+        historical_series = build_metric_series(metric_type, **source_records)
+    except ValueError as e:
+        return {"error": str(e)}, 400, None
+
+    historical_series_for_forecast = prepare_monthly_forecast_series(historical_series)
+
+    # Ensure we still have enough data after filtering for complete months
+    # For monthly data with m=12, a minimum of 24 points (2 seasons) is recommended for ARIMA.
+    if historical_series_for_forecast.empty or len(historical_series_for_forecast) < 24:
+        return insufficient_history_response(metric_name), 200, None
+
+    last_historical_date_for_forecast_model = historical_series_for_forecast.index.max() 
+
+    logging.info(f"Forecasting {forecast_periods} periods starting from the month after {last_historical_date_for_forecast_model.strftime('%Y-%m-%d')}.")
+
+    # Pick the best model that fits in the time budget (cheap models first, auto_arima if time remains)
+    with pipeline_stage("model_fit"):
+        forecast_results, _, selection = perform_forecast(historical_series_for_forecast, forecast_periods, time_budget=time_budget)
+
+    forecast_model = store_forecast_model(metric_type, forecast_periods, time_budget, historical_series_for_forecast, selection,
+                                          generation)
+    return build_predictive_response(historical_series_for_forecast, forecast_results, metric_name, selection), 200, forecast_model
+
+# --- Parallel forecasting for several metrics at once ---
+# auto_arima is CPU bound and holds the GIL, so fits run in a process pool rather than threads.
+# The pool is created lazily and reused across requests so workers only pay the import cost once.
+# 'spawn' is used because forking a threaded Flask server (and OpenBLAS thread pools) is not fork-safe.
+FORECAST_POOL_WORKERS = int(os.environ.get("FORECAST_POOL_WORKERS", os.cpu_count() or 1))
+_forecast_pool = None
+_forecast_pool_lock = threading.Lock()
+
+def get_forecast_pool():
+    """Returns the shared forecasting process pool, creating it on first use."""
+    global _forecast_pool
+    with _forecast_pool_lock:
+        if _forecast_pool is None:
+            _forecast_pool = ProcessPoolExecutor(max_workers=FORECAST_POOL_WORKERS,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            logging.info(f"Started forecast process pool with {FORECAST_POOL_WORKERS} workers.")
+        return _forecast_pool
+
+def reset_forecast_pool():
+    """Discards a broken forecasting pool so the next call starts a fresh one."""
+    global _forecast_pool
+    with _forecast_pool_lock:
+        if _forecast_pool is not None:
+            _forecast_pool.shutdown(wait=False, cancel_futures=True)
+        _forecast_pool = None
+
+def _forecast_worker(series, forecast_periods, time_budget=None):
+    """Process pool entry point: fits one monthly series and returns (forecast_results, selection)."""
+    forecast_results, _, selection = perform_forecast(series, forecast_periods, time_budget=time_budget)
+    return forecast_results, selection
+
+def forecast_many(series_by_key, forecast_periods, time_budget=None):
+    """
+    Fits every series in `series_by_key` concurrently across CPU cores, each with its own time budget.
+    Returns {key: (forecast_results, selection)}. Falls back to fitting in-process if the pool breaks.
+    """
+    if len(series_by_key) <= 1 or FORECAST_POOL_WORKERS <= 1:
+        return {key: _forecast_worker(series, forecast_periods, time_budget) for key, series in series_by_key.items()}
 
-        # Use ARIMA for all forecasts (with Linear Regression fallback inside perform_arima_forecast)
-        forecast_results, _ = perform_arima_forecast(historical_series_for_forecast, forecast_periods)
-        
-        # Format historical data for frontend plotting (using the filtered series)
-        historical_formatted = []
-        for date_dt, value in historical_series_for_forecast.items():
-            historical_formatted.append({
-                'date': date_dt.strftime('%Y-%m-%d'), # Format date as YYYY-MM-DD
-                'value': round(float(value), 2)
-            })
-        # Ensure historical data is sorted by date
-        historical_formatted.sort(key=lambda x: x['date'])
+    try:
+        pool = get_forecast_pool()
+        futures = {key: pool.submit(_forecast_worker, series, forecast_periods, time_budget) for key, series in series_by_key.items()}
+        return {key: future.result() for key, future in futures.items()}
+    except BrokenProcessPool as e:
+        logging.error(f"Forecast process pool broke ({e}). Retrying fits in-process.", exc_info=True)
+        reset_forecast_pool()
+        return {key: _forecast_worker(series, forecast_periods, time_budget) for key, series in series_by_key.items()}
+
+@app.route('/api/predictive-analytics/batch', methods=['GET'])
+@verify_token
+@profile_on_request
+def predictive_analytics_batch():
+    """
+    API endpoint for forecasting several metrics in one request.
+    Loads each source table once, builds every requested monthly series and fits
+    them in parallel, so the response takes about as long as the slowest single fit.
+    Query params: metric_types (comma separated, defaults to 'sales,engagement,reach'),
+    forecast_months (default 36), time_budget (seconds for model selection, per metric).
+    """
+    forecast_periods, time_budget = parse_forecast_request_args(request.args)
+    metric_types_param = request.args.get('metric_types', ','.join(PREDICTIVE_METRIC_NAMES))
+    metric_types = [m.strip() for m in metric_types_param.split(',') if m.strip()]
+    # Keep request order but drop duplicates
+    metric_types = list(dict.fromkeys(metric_types))
+
+    if not metric_types:
+        return jsonify({"error": "At least one metric type is required (e.g., 'sales', 'engagement', 'reach')."}), 400
+    unsupported = [m for m in metric_types if m not in PREDICTIVE_METRIC_NAMES]
+    if unsupported:
+        return jsonify({"error": f"Unsupported metric type(s): {', '.join(unsupported)}."}), 400
+
+    try:
+        payload, status_code = cached_analytics(
+            ("predictive-analytics/batch", tuple(metric_types), forecast_periods, time_budget),
+            lambda: compute_predictive_batch(metric_types, forecast_periods, time_budget))
+        return jsonify(payload), status_code
+
+    except Exception as e:
+        logging.error(f"Server error during batch predictive analytics for {metric_types}: {e}", exc_info=True)
+        return jsonify({"error": f"An error occurred during batch predictive analytics: {str(e)}"}), 500
+
+def compute_predictive_batch(metric_types, forecast_periods, time_budget=None):
+    """
+    Forecasts several metrics from shared table pulls. Returns (payload, status_code).
+    Each successful per-metric result is also cached for the single-metric route.
+    """
+    # Read before the tables: an upload during the fits must not be overwritten by these results
+    generation = current_analytics_generation()
+    # Fetch each source table at most once, shared by every metric that needs it
+    source_records = {}
+    if 'sales' in metric_types:
+        source_records["sales_records"] = fetch_frame("sales", SALES_REVENUE_COLUMNS, order="date.asc", wire_format=ANALYTICS_WIRE_FORMAT)
+    if 'engagement' in metric_types or 'reach' in metric_types:
+        source_records["tiktok_records"] = fetch_frame("tiktokdata", TIKTOK_METRIC_COLUMNS, order="date.asc", wire_format=ANALYTICS_WIRE_FORMAT)
+        source_records["facebook_records"] = fetch_frame("facebookdata", FACEBOOK_METRIC_COLUMNS, order="date.asc", wire_format=ANALYTICS_WIRE_FORMAT)
+
+    results = {}
+    series_to_fit = {}
+    for metric_type in metric_types:
+        metric_name = PREDICTIVE_METRIC_NAMES[metric_type]
+        try:
+            historical_series = build_metric_series(metric_type, **source_records)
+        except ValueError as e:
+            results[metric_type] = {"error": str(e)}
+            continue
 
-        # Generate recommendation
-        recommendation = generate_recommendation(historical_series_for_forecast, forecast_results, metric_name)
+        series_for_forecast = prepare_monthly_forecast_series(historical_series)
+        if series_for_forecast.empty or len(series_for_forecast) < 24:
+            results[metric_type] = insufficient_history_response(metric_name)
+        else:
+            series_to_fit[metric_type] = series_for_forecast
+
+    logging.info(f"Batch forecasting {list(series_to_fit)} for {forecast_periods} periods in parallel.")
+    with pipeline_stage("model_fit"):
+        forecasts = forecast_many(series_to_fit, forecast_periods, time_budget)
+
+    for metric_type, series_for_forecast in series_to_fit.items():
+        forecast_results, selection = forecasts[metric_type]
+        results[metric_type] = build_predictive_response(series_for_forecast, forecast_results,
+                                                         PREDICTIVE_METRIC_NAMES[metric_type], selection)
+        store_forecast_model(metric_type, forecast_periods, time_budget, series_for_forecast, selection, generation)
+
+    for metric_type, result in results.items():
+        if "error" not in result:
+            store_analytics_result(("predictive-analytics", metric_type, forecast_periods, time_budget), result, generation)
+
+    # Preserve the requested metric order in the response
+    return {
+        "forecasts": {metric_type: results[metric_type] for metric_type in metric_types},
+        "message": "Predictive analytics successful."
+    }, 200
+
+# --- Monte Carlo scenarios on top of forecasts ---
+# The recommendation text only reasons about the single mean path. Scenarios instead simulate
+# thousands of future paths from the fitted model's error distribution: every registry model gives
+# Gaussian prediction intervals, so each month's standard error is read back from its interval and
+# the paths are built as a cumulative sum of independent shocks whose variances add up to exactly
+# those standard errors (errors accumulate as they do for ARIMA / ETS forecasts). The whole
+# (paths x months) array is drawn in one call. The fitted model (mean, standard errors, history) is
+# cached next to the predictive-analytics result and the simulated paths are cached per model, so
+# changing thresholds, percentiles or the shock only re-summarizes the array: no refit, no redraw.
+SCENARIO_DEFAULT_PATHS = 5000
+SCENARIO_MAX_PATHS = 20000
+SCENARIO_DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+SCENARIO_DEFAULT_THRESHOLDS = (-10, -5, 5, 10) # Percent change of the compared months' total
+SCENARIO_COMPARE_MONTHS = 12
+SCENARIO_RANDOM_SEED = 20240501 # Fixed so cached and recomputed simulations agree
+SCENARIO_PATH_CACHE_ENTRIES = 16 # Each entry is paths x months float64 (5000 x 36 is ~1.4 MB)
+_scenario_paths = TTLCache(maxsize=SCENARIO_PATH_CACHE_ENTRIES, ttl=ANALYTICS_CACHE_TTL_SECONDS)
+_scenario_paths_lock = threading.Lock()
+
+def forecast_model_key(metric_type, forecast_periods, time_budget):
+    return ("predictive-analytics/model", metric_type, forecast_periods, time_budget)
+
+def store_forecast_model(metric_type, forecast_periods, time_budget, historical_series, selection, generation=None):
+    """Caches what the scenario simulation needs from a fitted forecast. Returns it (None if no model was fitted)."""
+    distribution = (selection or {}).get("distribution")
+    if not distribution:
+        return None
+    forecast_model = {
+        "metric_type": metric_type,
+        "model": selection["model"],
+        "last_historical_date": historical_series.index.max().strftime('%Y-%m-%d'),
+        "history": historical_series.sort_index().to_numpy(dtype=float).tolist(),
+        "mean": distribution["mean"],
+        "sigma": distribution["sigma"],
+    }
+    store_analytics_result(forecast_model_key(metric_type, forecast_periods, time_budget), forecast_model, generation, share=True)
+    return forecast_model
+
+def compute_forecast_model(metric_type, forecast_periods, time_budget=None):
+    """Fits the metric's forecast (also caching the predictive-analytics payload). Returns (forecast_model, status_code)."""
+    generation = current_analytics_generation()
+    payload, status_code, forecast_model = fit_metric_forecast(metric_type, forecast_periods, time_budget, generation)
+    if status_code != 200:
+        return payload, status_code
+    store_analytics_result(("predictive-analytics", metric_type, forecast_periods, time_budget), payload, generation)
+    if forecast_model is None:
+        return {"error": payload.get("message") or "No forecast model could be fitted."}, 422
+    return forecast_model, 200
+
+def simulate_forecast_paths(mean, sigma, n_paths, seed=SCENARIO_RANDOM_SEED):
+    """
+    (n_paths, months) array of simulated future values, non-negative like the forecasts.
+    Month h deviates from the mean by a sum of h independent normal shocks whose variance adds up to sigma[h]**2.
+    """
+    mean = np.asarray(mean, dtype=float)
+    # Standard errors can only grow with the horizon for cumulative shocks
+    sigma = np.maximum.accumulate(np.nan_to_num(np.asarray(sigma, dtype=float), nan=0.0).clip(0))
+    increments = np.sqrt(np.diff(np.square(sigma), prepend=0.0))
+    rng = np.random.default_rng(seed)
+    with pipeline_stage("simulate"):
+        shocks = rng.standard_normal((n_paths, len(mean))) * increments
+        return np.clip(mean + np.cumsum(shocks, axis=1), 0, None)
+
+def get_simulated_paths(model_key, forecast_model, n_paths):
+    """Simulated paths for a cached forecast model, drawn once per model, data generation and path count."""
+    key = (model_key, n_paths, _analytics_cache_generation)
+    with _scenario_paths_lock:
+        paths = _scenario_paths.get(key)
+    if paths is None:
+        paths = simulate_forecast_paths(forecast_model["mean"], forecast_model["sigma"], n_paths)
+        paths.setflags(write=False) # Shared between requests
+        with _scenario_paths_lock:
+            _scenario_paths[key] = paths
+    return paths
+
+def describe_scenario_probability(metric_name, threshold_pct, compare_months):
+    period = describe_forecast_horizon(compare_months)
+    if threshold_pct < 0:
+        return f"{metric_name} drops more than {-threshold_pct:g}% over the next {period}"
+    if threshold_pct > 0:
+        return f"{metric_name} grows more than {threshold_pct:g}% over the next {period}"
+    return f"{metric_name} declines over the next {period}"
+
+def summarize_scenarios(forecast_model, paths, metric_name, percentiles, thresholds, compare_months, shock_pct=0.0):
+    """
+    Percentile bands per month and threshold probabilities for the total of the first `compare_months`
+    simulated months against the same number of most recent actual months. `shock_pct` scales every
+    simulated value (e.g. -10 for "everything 10% lower").
+    """
+    with pipeline_stage("summarize"):
+        simulated = paths * (1 + shock_pct / 100) if shock_pct else paths
+        bands = np.percentile(simulated, percentiles, axis=0)
+        forecast_dates = pd.date_range(start=pd.Timestamp(forecast_model["last_historical_date"]) + pd.DateOffset(months=1),
+                                       periods=simulated.shape[1], freq='MS').strftime('%Y-%m-%d')
+        band_rows = [{"date": date, **{f"p{p:g}": value for p, value in zip(percentiles, column)}}
+                     for date, column in zip(forecast_dates, np.round(bands.T, 2).tolist())]
+
+        history = np.asarray(forecast_model["history"], dtype=float)
+        compare_months = min(compare_months, simulated.shape[1], len(history))
+        baseline_total = float(history[-compare_months:].sum())
+        totals = simulated[:, :compare_months].sum(axis=1)
+        probabilities = []
+        if baseline_total > 0:
+            change_pct = (totals / baseline_total - 1) * 100
+            for threshold in thresholds:
+                hits = change_pct < threshold if threshold <= 0 else change_pct > threshold
+                probabilities.append({"threshold_pct": threshold, "probability": round(float(hits.mean()), 4),
+                                      "description": describe_scenario_probability(metric_name, threshold, compare_months)})
+
+    return {
+        "bands": band_rows,
+        "compare_months": compare_months,
+        "baseline_total": round(baseline_total, 2),
+        "simulated_total": {f"p{p:g}": round(float(value), 2) for p, value in zip(percentiles, np.percentile(totals, percentiles))},
+        "probabilities": probabilities,
+    }
+
+def _parse_number_list(raw, default, cast=float):
+    """'5,-5' -> [5.0, -5.0]; default when missing. Raises ValueError on malformed input."""
+    if raw is None or not raw.strip():
+        return list(default)
+    return [cast(part) for part in raw.split(',') if part.strip()]
+
+@app.route('/api/predictive-analytics/scenarios', methods=['GET'])
+@verify_token
+@profile_on_request
+def predictive_scenarios():
+    """
+    API endpoint for Monte Carlo scenarios on a metric's forecast.
+    Query params: metric_type, forecast_months, time_budget (as for /api/predictive-analytics, and
+    selecting the same cached model), paths (default 5000), percentiles (default '5,25,50,75,95'),
+    thresholds (percent changes, default '-10,-5,5,10'), compare_months (default 12), shock_pct (default 0).
+    """
+    metric_type = (request.args.get('metric_type') or '').strip().lower()
+    if metric_type not in PREDICTIVE_METRIC_NAMES:
+        return jsonify({"error": "metric_type must be one of: " + ", ".join(PREDICTIVE_METRIC_NAMES) + "."}), 400
+    metric_name = PREDICTIVE_METRIC_NAMES[metric_type]
+    forecast_periods, time_budget = parse_forecast_request_args(request.args)
+    try:
+        n_paths = int(request.args.get('paths', SCENARIO_DEFAULT_PATHS))
+        percentiles = _parse_number_list(request.args.get('percentiles'), SCENARIO_DEFAULT_PERCENTILES)
+        thresholds = _parse_number_list(request.args.get('thresholds'), SCENARIO_DEFAULT_THRESHOLDS)
+        compare_months = int(request.args.get('compare_months', SCENARIO_COMPARE_MONTHS))
+        shock_pct = float(request.args.get('shock_pct', 0))
+    except ValueError:
+        return jsonify({"error": "paths and compare_months must be integers; percentiles, thresholds and shock_pct numbers."}), 400
+    if not 100 <= n_paths <= SCENARIO_MAX_PATHS:
+        return jsonify({"error": f"paths must be between 100 and {SCENARIO_MAX_PATHS}."}), 400
+    if not percentiles or any(not 0 <= p <= 100 for p in percentiles):
+        return jsonify({"error": "percentiles must be numbers between 0 and 100."}), 400
+    if compare_months < 1 or shock_pct <= -100:
+        return jsonify({"error": "compare_months must be positive and shock_pct greater than -100."}), 400
 
+    try:
+        model_key = forecast_model_key(metric_type, forecast_periods, time_budget)
+        forecast_model, status_code = cached_analytics(
+            model_key, lambda: compute_forecast_model(metric_type, forecast_periods, time_budget))
+        if status_code != 200:
+            return jsonify(forecast_model), status_code
+
+        paths = get_simulated_paths(model_key, forecast_model, n_paths)
+        scenarios = summarize_scenarios(forecast_model, paths, metric_name, sorted(percentiles), thresholds,
+                                        compare_months, shock_pct)
         return jsonify({
-            "historical_data": historical_formatted,
-            "forecast_data": forecast_results,
-            "recommendation": recommendation,
-            "message": "Predictive analytics successful."
-        })
+            "metric_type": metric_type,
+            "model": forecast_model["model"],
+            "paths": n_paths,
+            "forecast_months": forecast_periods,
+            "shock_pct": shock_pct,
+            **scenarios,
+            "message": "Scenario simulation successful.",
+        }), 200
 
     except Exception as e:
-        logging.error(f"Server error during predictive analytics for {metric_type}: {e}", exc_info=True)
-        return jsonify({"error": f"An error occurred during predictive analytics for {metric_name}: {str(e)}"}), 500
+        logging.error(f"Server error during scenario simulation for {metric_type}: {e}", exc_info=True)
+        return jsonify({"error": f"An error occurred during scenario simulation for {metric_name}: {str(e)}"}), 500
+
+# --- Per-product batch forecasting ---
+# The merchandising team needs a revenue forecast for every product_id, which is thousands of series:
+# far too many for perform_forecast's per-series model selection (auto_arima alone costs seconds).
+# A refresh instead builds every product's monthly revenue series at once from the sales rollup
+# (one products x months matrix), picks one model per series up front and fits the series in chunks
+# across the forecast process pool:
+#   * short (< PRODUCT_FORECAST_ARIMA_MIN_MONTHS) or sparse (sales in fewer than
+#     PRODUCT_FORECAST_SPARSE_SHARE of its months) series get the seasonal naive model, which falls
+#     back to a plain naive forecast below two years of history;
+#   * long, dense series get auto_arima, capped at the PRODUCT_FORECAST_MAX_ARIMA_SERIES
+#     highest-revenue products so a refresh stays within minutes; the rest of them get ETS.
+# A series whose values and model are unchanged since the last refresh is not refitted.
+# Results are written to a local SQLite forecast table that the per-product and top-movers
+# routes read, so queries never fit anything.
+PRODUCT_FORECAST_DB_PATH = os.environ.get("PRODUCT_FORECAST_DB_PATH", "product_forecasts.sqlite3")
+PRODUCT_FORECAST_MONTHS = int(os.environ.get("PRODUCT_FORECAST_MONTHS", 12))
+PRODUCT_FORECAST_ARIMA_MIN_MONTHS = int(os.environ.get("PRODUCT_FORECAST_ARIMA_MIN_MONTHS", 36))
+PRODUCT_FORECAST_SPARSE_SHARE = float(os.environ.get("PRODUCT_FORECAST_SPARSE_SHARE", 0.5))
+PRODUCT_FORECAST_MAX_ARIMA_SERIES = int(os.environ.get("PRODUCT_FORECAST_MAX_ARIMA_SERIES", 200))
+PRODUCT_FORECAST_CHUNK_SIZE = int(os.environ.get("PRODUCT_FORECAST_CHUNK_SIZE", 250)) # Cheap series per pool task
+PRODUCT_FORECAST_COMPARE_MONTHS = 12 # Movers compare the next (up to) 12 forecast months with the last 12 actual ones
+PRODUCT_FORECAST_FALLBACK_MODELS = ("seasonal_naive", "linear_trend")
+
+def _last_complete_month(now=None):
+    """The last complete calendar month, as months since 1970-01 (same rule as prepare_monthly_forecast_series)."""
+    now = now or datetime.now()
+    current_month = (now.year - 1970) * 12 + now.month - 1
+    return current_month if now.day >= pd.Timestamp(now).days_in_month else current_month - 1
+
+def _month_start(month_number):
+    return pd.Timestamp(np.datetime64(int(month_number), 'M'))
+
+def choose_product_forecast_model(history_months, active_months, revenue_rank):
+    """Model for one product series, from its length, months with sales and revenue rank (0 = highest)."""
+    if history_months < FORECAST_MODELS["seasonal_naive"]["min_points"]:
+        return "linear_trend"
+    if history_months < PRODUCT_FORECAST_ARIMA_MIN_MONTHS or active_months < PRODUCT_FORECAST_SPARSE_SHARE * history_months:
+        return "seasonal_naive"
+    return "auto_arima" if revenue_rank < PRODUCT_FORECAST_MAX_ARIMA_SERIES else "ets"
+
+def build_product_forecast_tasks(product_ids, first_month, matrix, last_month):
+    """
+    Turns the products x months revenue matrix into forecast tasks. Each product's series runs from its
+    first month with sales to `last_month`. Returns [(product_id, model, start_month, values)] and the
+    product_ids with less than two months of history (which get no forecast).
+    """
+    n_months = last_month - first_month + 1
+    if n_months <= 0 or not len(product_ids):
+        return [], list(product_ids)
+    with pipeline_stage("build_series"):
+        matrix = matrix[:, :n_months]
+        if matrix.shape[1] < n_months:
+            # No sales at all in the most recent complete months: those months are zeros, not missing
+            matrix = np.pad(matrix, ((0, 0), (0, n_months - matrix.shape[1])))
+        sold = matrix != 0
+        has_sales = sold.any(axis=1)
+        starts = np.where(has_sales, sold.argmax(axis=1), n_months)
+        history_months = n_months - starts
+        active_months = sold.sum(axis=1)
+        # Rank by revenue so the auto_arima budget goes to the products that matter most
+        revenue_rank = np.empty(len(product_ids), dtype='int64')
+        revenue_rank[np.argsort(-matrix.sum(axis=1), kind='stable')] = np.arange(len(product_ids))
+
+    tasks, insufficient = [], []
+    for index, product_id in enumerate(product_ids):
+        if history_months[index] < 2:
+            insufficient.append(product_id)
+            continue
+        model_name = choose_product_forecast_model(int(history_months[index]), int(active_months[index]), int(revenue_rank[index]))
+        tasks.append((product_id, model_name, first_month + int(starts[index]), matrix[index, starts[index]:].copy()))
+    return tasks, insufficient
 
-@app.route('/api/correlation-analysis', methods=['GET'])
+def _product_series_hash(model_name, forecast_periods, start_month, values):
+    digest = hashlib.blake2b(f"{model_name}|{forecast_periods}|{start_month}|".encode(), digest_size=16)
+    digest.update(np.ascontiguousarray(values, dtype='float64').tobytes())
+    return digest.hexdigest()
+
+def _product_forecast_worker(tasks, forecast_periods):
+    """
+    Process pool entry point: fits one chunk of product series. Returns one dict per task with the model
+    actually used (falling back to cheaper models if the chosen one fails) and the clipped forecast arrays.
+    """
+    alpha = 1 - FORECAST_CONFIDENCE_LEVEL
+    results = []
+    for product_id, model_name, start_month, values in tasks:
+        series = pd.Series(values, index=pd.date_range(_month_start(start_month), periods=len(values), freq='MS'))
+        result = {"product_id": product_id, "model": None, "error": None}
+        for candidate in dict.fromkeys((model_name,) + PRODUCT_FORECAST_FALLBACK_MODELS):
+            if len(series) < FORECAST_MODELS[candidate]["min_points"]:
+                continue
+            try:
+                mean, lower, upper, _ = FORECAST_MODELS[candidate]["fit"](series, forecast_periods, alpha)
+            except Exception as e:
+                result["error"] = f"{candidate}: {e}"
+                continue
+            result.update(model=candidate, error=None, mean=np.clip(mean, 0, None),
+                          lower=np.clip(lower, 0, None), upper=np.clip(upper, 0, None))
+            break
+        results.append(result)
+    return results
+
+def _chunk_product_tasks(tasks):
+    """Pool chunks, auto_arima fits first and one per chunk so the slowest work starts earliest."""
+    expensive = [task for task in tasks if FORECAST_MODELS[task[1]]["expensive"]]
+    cheap = [task for task in tasks if not FORECAST_MODELS[task[1]]["expensive"]]
+    return [[task] for task in expensive] + [cheap[i:i + PRODUCT_FORECAST_CHUNK_SIZE]
+                                             for i in range(0, len(cheap), PRODUCT_FORECAST_CHUNK_SIZE)]
+
+def fit_product_forecasts(tasks, forecast_periods):
+    """Yields lists of worker results as chunks finish, across the forecast pool when there is more than one worker."""
+    chunks = _chunk_product_tasks(tasks)
+    if len(chunks) <= 1 or FORECAST_POOL_WORKERS <= 1:
+        for chunk in chunks:
+            yield _product_forecast_worker(chunk, forecast_periods)
+        return
+
+    pool = get_forecast_pool()
+    futures = {pool.submit(_product_forecast_worker, chunk, forecast_periods): chunk for chunk in chunks}
+    broken = False
+    for future in as_completed(futures):
+        try:
+            yield future.result()
+        except BrokenProcessPool as e:
+            # Every outstanding chunk fails the same way; fit them in-process and start a fresh pool next time
+            if not broken:
+                logging.error(f"Forecast process pool broke ({e}). Fitting remaining chunks in-process.", exc_info=True)
+                reset_forecast_pool()
+                broken = True
+            yield _product_forecast_worker(futures[future], forecast_periods)
+
+class ProductForecastStore:
+    """SQLite forecast table: one summary row per product plus its monthly forecast points."""
+    def __init__(self, path):
+        self.path = path
+        self.ready = False
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        if not self.ready:
+            with self.lock, conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS product_forecast_summary (product_id TEXT PRIMARY KEY, product_name TEXT, "
+                             "model TEXT, history_months INTEGER, active_months INTEGER, last_month TEXT, forecast_months INTEGER, "
+                             "recent_total REAL, forecast_total REAL, change REAL, change_pct REAL, series_hash TEXT, "
+                             "refreshed_at TEXT, seen_at TEXT, error TEXT)")
+                conn.execute("CREATE INDEX IF NOT EXISTS product_forecast_summary_change ON product_forecast_summary (change)")
+                conn.execute("CREATE TABLE IF NOT EXISTS product_forecasts (product_id TEXT, month TEXT, value REAL, "
+                             "lower_bound REAL, upper_bound REAL, PRIMARY KEY (product_id, month))")
+                conn.execute("CREATE TABLE IF NOT EXISTS product_forecast_meta (key TEXT PRIMARY KEY, value TEXT)")
+                self.ready = True
+        return conn
+
+    def series_hashes(self):
+        """{product_id: series_hash} for products with a stored forecast."""
+        conn = self._connect()
+        try:
+            return {row["product_id"]: row["series_hash"]
+                    for row in conn.execute("SELECT product_id, series_hash FROM product_forecast_summary WHERE model IS NOT NULL")}
+        finally:
+            conn.close()
+
+    def write(self, summaries, points):
+        """Replaces the summary rows and forecast points of the products in `summaries`."""
+        conn = self._connect()
+        try:
+            with conn:
+                product_ids = [(summary["product_id"],) for summary in summaries]
+                conn.executemany("DELETE FROM product_forecasts WHERE product_id = ?", product_ids)
+                conn.executemany("INSERT OR REPLACE INTO product_forecast_summary VALUES (:product_id, :product_name, :model, "
+                                 ":history_months, :active_months, :last_month, :forecast_months, :recent_total, :forecast_total, "
+                                 ":change, :change_pct, :series_hash, :refreshed_at, :seen_at, :error)", summaries)
+                conn.executemany("INSERT INTO product_forecasts VALUES (?, ?, ?, ?, ?)", points)
+        finally:
+            conn.close()
+
+    def mark_seen(self, product_ids, seen_at, product_names):
+        """Keeps unchanged products through the end-of-refresh cleanup (and picks up renamed products)."""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany("UPDATE product_forecast_summary SET seen_at = ?, product_name = ? WHERE product_id = ?",
+                                 [(seen_at, product_names.get(product_id), product_id) for product_id in product_ids])
+        finally:
+            conn.close()
+
+    def remove_unseen(self, seen_at):
+        """Drops products that no longer have sales (not seen by the refresh that started at `seen_at`)."""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM product_forecasts WHERE product_id IN "
+                             "(SELECT product_id FROM product_forecast_summary WHERE seen_at < ?)", (seen_at,))
+                return conn.execute("DELETE FROM product_forecast_summary WHERE seen_at < ?", (seen_at,)).rowcount
+        finally:
+            conn.close()
+
+    def product(self, product_id):
+        """Summary dict with a 'forecast' list for one product, or None if it has never been forecast."""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM product_forecast_summary WHERE product_id = ?", (product_id,)).fetchone()
+            if row is None:
+                return None
+            forecast = [dict(point) for point in conn.execute(
+                "SELECT month AS date, value, lower_bound, upper_bound FROM product_forecasts WHERE product_id = ? ORDER BY month",
+                (product_id,))]
+            return {**self._summary(row), "forecast": forecast}
+        finally:
+            conn.close()
+
+    def top_movers(self, limit=10, direction="up"):
+        """Products with the largest forecast revenue increase ('up') or decrease ('down'), largest first."""
+        comparison, order = (">", "DESC") if direction == "up" else ("<", "ASC")
+        conn = self._connect()
+        try:
+            return [self._summary(row) for row in conn.execute(
+                f"SELECT * FROM product_forecast_summary WHERE model IS NOT NULL AND change {comparison} 0 "
+                f"ORDER BY change {order} LIMIT ?", (limit,))]
+        finally:
+            conn.close()
+
+    def set_status(self, status):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO product_forecast_meta VALUES ('refresh_status', ?)", (json.dumps(status),))
+        finally:
+            conn.close()
+
+    def status(self):
+        """The last refresh status written by any worker process."""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM product_forecast_meta WHERE key = 'refresh_status'").fetchone()
+            return json.loads(row["value"]) if row else {"state": "never_run"}
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _summary(row):
+        summary = {key: row[key] for key in row.keys() if key not in ("series_hash", "seen_at")}
+        summary["insufficient_history"] = row["model"] is None and row["error"] is None
+        return summary
+
+product_forecast_store = ProductForecastStore(PRODUCT_FORECAST_DB_PATH)
+
+def summarize_product_forecast(task, result, forecast_periods, product_names, refreshed_at):
+    """The summary row and forecast points stored for one fitted product series."""
+    product_id, _, start_month, values = task
+    last_month = start_month + len(values) - 1
+    summary = {
+        "product_id": product_id, "product_name": product_names.get(product_id), "model": result["model"],
+        "history_months": len(values), "active_months": int(np.count_nonzero(values)),
+        "last_month": _month_start(last_month).strftime('%Y-%m-%d'), "forecast_months": forecast_periods,
+        "recent_total": None, "forecast_total": None, "change": None, "change_pct": None,
+        "series_hash": _product_series_hash(task[1], forecast_periods, start_month, values),
+        "refreshed_at": refreshed_at, "seen_at": refreshed_at, "error": result["error"],
+    }
+    if result["model"] is None:
+        return summary, []
+
+    compare = min(PRODUCT_FORECAST_COMPARE_MONTHS, forecast_periods, len(values))
+    recent_total, forecast_total = float(values[-compare:].sum()), float(result["mean"][:compare].sum())
+    summary.update(recent_total=round(recent_total, 2), forecast_total=round(forecast_total, 2),
+                   change=round(forecast_total - recent_total, 2),
+                   change_pct=round((forecast_total - recent_total) / recent_total * 100, 2) if recent_total > 0 else None)
+    months = pd.date_range(_month_start(last_month + 1), periods=forecast_periods, freq='MS').strftime('%Y-%m-%d')
+    points = [(product_id, month, value, lower, upper) for month, value, lower, upper in zip(
+        months, np.round(result["mean"], 2).tolist(), np.round(result["lower"], 2).tolist(), np.round(result["upper"], 2).tolist())]
+    return summary, points
+
+def refresh_product_forecasts(forecast_periods=None, force=False, store=None, rollup=None):
+    """
+    Refits the forecast of every product whose monthly series changed since the last refresh (all of
+    them with `force`) and writes the results to the forecast table. Returns the refresh status dict.
+    Raises SupabaseFetchError if the sales rollup cannot be built.
+    """
+    forecast_periods = forecast_periods or PRODUCT_FORECAST_MONTHS
+    store, rollup = store or product_forecast_store, rollup or sales_rollup
+    started = time.perf_counter()
+    refreshed_at = datetime.now().isoformat(timespec='seconds')
+    status = {"state": "running", "started_at": refreshed_at, "finished_at": None, "forecast_months": forecast_periods,
+              "products": 0, "fitted": 0, "unchanged": 0, "insufficient_history": 0, "failed": 0, "models": {}}
+    store.set_status(status)
+
+    product_ids, product_names, first_month, matrix = rollup.monthly_revenue()
+    tasks, insufficient = build_product_forecast_tasks(product_ids, first_month, matrix, _last_complete_month())
+    status.update(products=len(product_ids), insufficient_history=len(insufficient))
+
+    stored_hashes = {} if force else store.series_hashes()
+    unchanged = [task[0] for task in tasks if stored_hashes.get(task[0]) == _product_series_hash(task[1], forecast_periods, task[2], task[3])]
+    store.mark_seen(unchanged, refreshed_at, product_names)
+    unchanged_set = set(unchanged)
+    tasks = [task for task in tasks if task[0] not in unchanged_set]
+    status["unchanged"] = len(unchanged)
+    store.write([{"product_id": product_id, "product_name": product_names.get(product_id), "model": None,
+                  "history_months": 0, "active_months": 0, "last_month": None, "forecast_months": forecast_periods,
+                  "recent_total": None, "forecast_total": None, "change": None, "change_pct": None, "series_hash": None,
+                  "refreshed_at": refreshed_at, "seen_at": refreshed_at, "error": None} for product_id in insufficient], [])
+
+    logging.info(f"Product forecast refresh: fitting {len(tasks)} series ({len(unchanged)} unchanged, "
+                 f"{len(insufficient)} with too little history) for {forecast_periods} months.")
+    tasks_by_product = {task[0]: task for task in tasks}
+    models = Counter()
+    with pipeline_stage("model_fit"):
+        for results in fit_product_forecasts(tasks, forecast_periods):
+            summaries, points = [], []
+            for result in results:
+                summary, product_points = summarize_product_forecast(tasks_by_product[result["product_id"]], result,
+                                                                     forecast_periods, product_names, refreshed_at)
+                summaries.append(summary)
+                points.extend(product_points)
+                models[result["model"] or "failed"] += 1
+            store.write(summaries, points)
+            status.update(fitted=status["fitted"] + len(results), models=dict(models))
+            store.set_status(status)
+
+    removed = store.remove_unseen(refreshed_at)
+    status.update(state="completed", finished_at=datetime.now().isoformat(timespec='seconds'),
+                  failed=models.get("failed", 0), removed=removed, seconds=round(time.perf_counter() - started, 1))
+    store.set_status(status)
+    logging.info(f"Product forecast refresh finished in {status['seconds']}s: {status}")
+    return status
+
+_product_forecast_refresh_lock = threading.Lock()
+
+def _run_product_forecast_refresh(forecast_periods, force):
+    try:
+        refresh_product_forecasts(forecast_periods, force)
+    except Exception as e:
+        logging.error(f"Product forecast refresh failed: {e}", exc_info=True)
+        product_forecast_store.set_status({**product_forecast_store.status(), "state": "failed", "error": str(e),
+                                           "finished_at": datetime.now().isoformat(timespec='seconds')})
+    finally:
+        _product_forecast_refresh_lock.release()
+
+@app.route('/api/product-forecasts/refresh', methods=['POST'])
 @verify_token
-def correlation_analysis():
+@admin_required
+def start_product_forecast_refresh():
     """
-    API endpoint for Spearman's Rank Correlation analysis.
-    Calculates correlations between Engagement, Reach, and Sales.
-    Provides automated recommendations based on correlation strength.
-    Also returns the underlying data for scatter plotting.
-    Filters data by platform.
+    Starts a background refresh of every product's revenue forecast (admin only). Returns 202, or 409 if a
+    refresh is already running in this process. JSON body (optional): forecast_months (default
+    PRODUCT_FORECAST_MONTHS), force (refit series that have not changed).
     """
-    start_date_str = request.args.get('start_date')
-    end_date_str = request.args.get('end_date')
-    platform_filter = request.args.get('platform', 'all') # Get platform filter
+    data = request.get_json(silent=True) or {}
+    try:
+        forecast_periods = int(data.get('forecast_months', PRODUCT_FORECAST_MONTHS))
+    except (TypeError, ValueError):
+        return jsonify({"error": "forecast_months must be an integer."}), 400
+    if not 1 <= forecast_periods <= MAX_FORECAST_MONTHS:
+        return jsonify({"error": f"forecast_months must be between 1 and {MAX_FORECAST_MONTHS}."}), 400
+
+    if not _product_forecast_refresh_lock.acquire(blocking=False):
+        return jsonify({"error": "A product forecast refresh is already running.", "status": product_forecast_store.status()}), 409
+    thread = threading.Thread(target=_run_product_forecast_refresh, args=(forecast_periods, bool(data.get('force'))),
+                              name="product-forecast-refresh", daemon=True)
+    thread.start()
+    return jsonify({"message": "Product forecast refresh started.", "status_url": "/api/product-forecasts/refresh"}), 202
+
+@app.route('/api/product-forecasts/refresh', methods=['GET'])
+@verify_token
+def product_forecast_refresh_status():
+    """Progress of the running (or last) product forecast refresh."""
+    return jsonify(product_forecast_store.status())
 
-    # Fetch data from all relevant tables
-    # IMPORTANT: fetch_table now handles pagination internally when limit is None
-    tiktok_records = fetch_table("tiktokdata", select="date,views,likes,comments,shares", start_date=start_date_str, end_date=end_date_str, limit=None)
-    facebook_records = fetch_table("facebookdata", select="date,likes,comments,shares,reach", start_date=start_date_str, end_date=end_date_str, limit=None)
-    sales_records = fetch_table("sales", select="date,revenue", start_date=start_date_str, end_date=end_date_str, limit=None)
+@app.route('/api/product-forecasts/top-movers', methods=['GET'])
+@verify_token
+def product_forecast_top_movers():
+    """
+    Products whose forecast revenue for the next months moves the most against the same number of
+    past months. Query params: direction ('up' or 'down', default 'up'), limit (default 10).
+    """
+    direction = request.args.get('direction', 'up').lower()
+    if direction not in ('up', 'down'):
+        return jsonify({"error": "direction must be 'up' or 'down'."}), 400
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        return jsonify({"error": "limit must be a positive integer."}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be a positive integer."}), 400
+
+    return jsonify({"direction": direction, "products": product_forecast_store.top_movers(limit, direction),
+                    "refresh": product_forecast_store.status()})
 
+@app.route('/api/product-forecasts/<product_id>', methods=['GET'])
+@verify_token
+def product_forecast(product_id):
+    """Stored revenue forecast for one product, as written by the last refresh."""
+    result = product_forecast_store.product(product_id)
+    if result is None:
+        return jsonify({"error": f"No forecast for product '{product_id}'. It has no sales, or no refresh has run yet."}), 404
+    return jsonify(result)
+
+def build_correlation_frame(tiktok_records, facebook_records, sales_records, platform_filter='all'):
+    """
+    Aggregates raw records into one daily frame with 'engagement', 'reach' and 'revenue' columns
+    (outer-joined on date, missing values filled with 0), filtered by platform.
+    """
     # Prepare dataframes
-    df_tiktok = pd.DataFrame(tiktok_records)
-    df_facebook = pd.DataFrame(facebook_records)
-    df_sales = pd.DataFrame(sales_records)
+    with pipeline_stage("build_frames"):
+        df_tiktok = records_to_frame(tiktok_records)
+        df_facebook = records_to_frame(facebook_records)
+        df_sales = records_to_frame(sales_records)
 
     # Convert 'date' columns to datetime and set as index for all DFs
-    for df in [df_tiktok, df_facebook, df_sales]:
-        if 'date' in df.columns:
-            df['date'] = pd.to_datetime(df['date'], errors='coerce')
-            df.set_index('date', inplace=True)
-        else:
-            logging.warning(f"DataFrame is missing 'date' column.")
-            continue
+    with pipeline_stage("coerce"):
+        for df in [df_tiktok, df_facebook, df_sales]:
+            if 'date' in df.columns:
+                df['date'] = pd.to_datetime(df['date'], errors='coerce')
+                df.set_index('date', inplace=True)
+            else:
+                logging.warning(f"DataFrame is missing 'date' column.")
+                continue
     
     # Aggregate social media data based on platform filter
     combined_social_df = pd.DataFrame()
     
-    if not df_tiktok.empty and (platform_filter == 'all' or platform_filter == 'tiktok'):
-        df_tiktok['engagement'] = df_tiktok['likes'].fillna(0) + df_tiktok['comments'].fillna(0) + df_tiktok['shares'].fillna(0)
-        df_tiktok['reach'] = df_tiktok['views'].fillna(0)
-        tiktok_daily_agg = df_tiktok.groupby(df_tiktok.index).agg({'engagement': 'sum', 'reach': 'sum'})
-        combined_social_df = pd.concat([combined_social_df, tiktok_daily_agg])
-
-    if not df_facebook.empty and (platform_filter == 'all' or platform_filter == 'facebook'):
-        df_facebook['engagement'] = df_facebook['likes'].fillna(0) + df_facebook['comments'].fillna(0) + df_facebook['shares'].fillna(0)
-        df_facebook['reach'] = df_facebook['reach'].fillna(0)
-        facebook_daily_agg = df_facebook.groupby(df_facebook.index).agg({'engagement': 'sum', 'reach': 'sum'})
-        combined_social_df = pd.concat([combined_social_df, facebook_daily_agg])
-
-    # If both DFs contributed, re-aggregate to ensure unique daily sums (after platform filtering)
-    if not combined_social_df.empty:
-        combined_social_df = combined_social_df.groupby(combined_social_df.index).agg({'engagement': 'sum', 'reach': 'sum'})
-    else:
-        # If no data after filtering, initialize with empty columns to avoid key errors later
-        combined_social_df = pd.DataFrame(columns=['engagement', 'reach'])
+    with pipeline_stage("aggregate"):
+        if not df_tiktok.empty and (platform_filter == 'all' or platform_filter == 'tiktok'):
+            df_tiktok['engagement'] = df_tiktok['likes'].fillna(0) + df_tiktok['comments'].fillna(0) + df_tiktok['shares'].fillna(0)
+            df_tiktok['reach'] = df_tiktok['views'].fillna(0)
+            tiktok_daily_agg = df_tiktok.groupby(df_tiktok.index).agg({'engagement': 'sum', 'reach': 'sum'})
+            combined_social_df = pd.concat([combined_social_df, tiktok_daily_agg])
+
+        if not df_facebook.empty and (platform_filter == 'all' or platform_filter == 'facebook'):
+            df_facebook['engagement'] = df_facebook['likes'].fillna(0) + df_facebook['comments'].fillna(0) + df_facebook['shares'].fillna(0)
+            df_facebook['reach'] = df_facebook['reach'].fillna(0)
+            facebook_daily_agg = df_facebook.groupby(df_facebook.index).agg({'engagement': 'sum', 'reach': 'sum'})
+            combined_social_df = pd.concat([combined_social_df, facebook_daily_agg])
+
+        # If both DFs contributed, re-aggregate to ensure unique daily sums (after platform filtering)
+        if not combined_social_df.empty:
+            combined_social_df = combined_social_df.groupby(combined_social_df.index).agg({'engagement': 'sum', 'reach': 'sum'})
+        else:
+            # If no data after filtering, initialize with empty columns to avoid key errors later
+            combined_social_df = pd.DataFrame(columns=['engagement', 'reach'])
 
 
-    # Aggregate sales data
-    if not df_sales.empty:
-        df_sales['revenue'] = df_sales['revenue'].fillna(0)
-        sales_daily_agg = df_sales.groupby(df_sales.index).agg({'revenue': 'sum'})
-    else:
-        sales_daily_agg = pd.DataFrame(columns=['revenue'])
+        # Aggregate sales data
+        if not df_sales.empty:
+            df_sales['revenue'] = df_sales['revenue'].fillna(0)
+            sales_daily_agg = df_sales.groupby(df_sales.index).agg({'revenue': 'sum'})
+        else:
+            sales_daily_agg = pd.DataFrame(columns=['revenue'])
 
     # Merge aggregated dataframes on date
     # Use outer join to keep all dates from social or sales data, then filter for common dates later for correlation
-    merged_df = pd.merge(combined_social_df, sales_daily_agg, left_index=True, right_index=True, how='outer')
-    merged_df = merged_df.fillna(0) # Fill any remaining NaNs with 0
+    with pipeline_stage("merge"):
+        merged_df = pd.merge(combined_social_df, sales_daily_agg, left_index=True, right_index=True, how='outer')
+        merged_df = merged_df.fillna(0) # Fill any remaining NaNs with 0
+    return merged_df
 
+def compute_correlation_results(merged_df, max_points=None):
+    """
+    Computes Spearman correlations, recommendations and scatter-plot data from the daily frame
+    built by build_correlation_frame. Returns the /api/correlation-analysis response body.
+    With max_points, chart_data is downsampled with LTTB; correlations always use every day.
+    """
+    from scipy.stats import spearmanr
     # Determine total possible unique dates in the merged dataset before filtering for correlation.
     # This helps in assessing data gaps.
     total_possible_dates = len(merged_df.index.unique())
@@ -1430,15 +4987,22 @@ def correlation_analysis():
 
     # Prepare data for scatter plots (from the full merged_df, which includes dates with zeros after fillna)
     chart_data = []
-    if not merged_df.empty:
-        merged_df_sorted = merged_df.sort_index() # Ensure data is sorted by date
-        for index, row in merged_df_sorted.iterrows():
-            chart_data.append({
-                'date': index.strftime('%Y-%m-%d'), # Format date for Chart.js
-                'engagement': row.get('engagement', 0),
-                'reach': row.get('reach', 0),
-                'sales': row.get('revenue', 0)
-            })
+    with pipeline_stage("serialize"):
+        if not merged_df.empty:
+            # Sorted by date, missing columns as 0; converted column-wise instead of row by row
+            merged_df_sorted = merged_df.sort_index().reindex(columns=['engagement', 'reach', 'revenue'], fill_value=0)
+            if max_points is not None:
+                with pipeline_stage("downsample"):
+                    merged_df_sorted = downsample_chart_frame(merged_df_sorted, _day_numbers(merged_df_sorted.index),
+                                                              ['engagement', 'reach', 'revenue'], max_points)
+            chart_data = [
+                {'date': date, 'engagement': engagement, 'reach': reach, 'sales': sales}
+                for date, engagement, reach, sales in zip(
+                    merged_df_sorted.index.strftime('%Y-%m-%d'), # Format date for Chart.js
+                    merged_df_sorted['engagement'].to_numpy(dtype=float).tolist(),
+                    merged_df_sorted['reach'].to_numpy(dtype=float).tolist(),
+                    merged_df_sorted['revenue'].to_numpy(dtype=float).tolist())
+            ]
 
     correlations = {}
     recommendations = {}
@@ -1447,42 +5011,428 @@ def correlation_analysis():
     # Note: spearmanr handles NaN by dropping them, but we've already filled with 0.
     # It's important that the series used for spearmanr has variance.
     
-    if 'engagement' in correlation_df.columns and 'reach' in correlation_df.columns and \
-       correlation_df['engagement'].std() > 0 and correlation_df['reach'].std() > 0:
-        corr_er, _ = spearmanr(correlation_df['engagement'], correlation_df['reach'])
-        correlations['engage_reach'] = round(corr_er, 2)
-        recommendations['engage_reach'] = get_recommendation_text(corr_er, "Engagement", "Reach", correlation_df['engagement'], correlation_df['reach'], total_possible_dates)
-    else:
-        correlations['engage_reach'] = None
-        # Pass empty series and 0 for total_possible_dates if no data for correlation
-        recommendations['engage_reach'] = get_recommendation_text(pd.NA, "Engagement", "Reach", pd.Series(), pd.Series(), total_possible_dates) 
-
-    if 'engagement' in correlation_df.columns and 'revenue' in correlation_df.columns and \
-       correlation_df['engagement'].std() > 0 and correlation_df['revenue'].std() > 0:
-        corr_es, _ = spearmanr(correlation_df['engagement'], correlation_df['revenue'])
-        correlations['engage_sales'] = round(corr_es, 2)
-        recommendations['engage_sales'] = get_recommendation_text(corr_es, "Engagement", "Sales", correlation_df['engagement'], correlation_df['revenue'], total_possible_dates)
-    else:
-        correlations['engage_sales'] = None
-        # Pass empty series and 0 for total_possible_dates if no data for correlation
-        recommendations['engage_sales'] = get_recommendation_text(pd.NA, "Engagement", "Sales", pd.Series(), pd.Series(), total_possible_dates)
-
-    if 'reach' in correlation_df.columns and 'revenue' in correlation_df.columns and \
-       correlation_df['reach'].std() > 0 and correlation_df['revenue'].std() > 0:
-        corr_rs, _ = spearmanr(correlation_df['reach'], correlation_df['revenue'])
-        correlations['reach_sales'] = round(corr_rs, 2)
-        recommendations['reach_sales'] = get_recommendation_text(corr_rs, "Reach", "Sales", correlation_df['reach'], correlation_df['revenue'], total_possible_dates)
-    else:
-        correlations['reach_sales'] = None
-        # Pass empty series and 0 for total_possible_dates if no data for correlation
-        recommendations['reach_sales'] = get_recommendation_text(pd.NA, "Reach", "Sales", pd.Series(), pd.Series(), total_possible_dates)
+    with pipeline_stage("correlate"):
+        if 'engagement' in correlation_df.columns and 'reach' in correlation_df.columns and \
+           correlation_df['engagement'].std() > 0 and correlation_df['reach'].std() > 0:
+            corr_er, _ = spearmanr(correlation_df['engagement'], correlation_df['reach'])
+            correlations['engage_reach'] = round(corr_er, 2)
+            recommendations['engage_reach'] = get_recommendation_text(corr_er, "Engagement", "Reach", correlation_df['engagement'], correlation_df['reach'], total_possible_dates)
+        else:
+            correlations['engage_reach'] = None
+            # Pass empty series and 0 for total_possible_dates if no data for correlation
+            recommendations['engage_reach'] = get_recommendation_text(pd.NA, "Engagement", "Reach", pd.Series(), pd.Series(), total_possible_dates) 
+
+        if 'engagement' in correlation_df.columns and 'revenue' in correlation_df.columns and \
+           correlation_df['engagement'].std() > 0 and correlation_df['revenue'].std() > 0:
+            corr_es, _ = spearmanr(correlation_df['engagement'], correlation_df['revenue'])
+            correlations['engage_sales'] = round(corr_es, 2)
+            recommendations['engage_sales'] = get_recommendation_text(corr_es, "Engagement", "Sales", correlation_df['engagement'], correlation_df['revenue'], total_possible_dates)
+        else:
+            correlations['engage_sales'] = None
+            # Pass empty series and 0 for total_possible_dates if no data for correlation
+            recommendations['engage_sales'] = get_recommendation_text(pd.NA, "Engagement", "Sales", pd.Series(), pd.Series(), total_possible_dates)
+
+        if 'reach' in correlation_df.columns and 'revenue' in correlation_df.columns and \
+           correlation_df['reach'].std() > 0 and correlation_df['revenue'].std() > 0:
+            corr_rs, _ = spearmanr(correlation_df['reach'], correlation_df['revenue'])
+            correlations['reach_sales'] = round(corr_rs, 2)
+            recommendations['reach_sales'] = get_recommendation_text(corr_rs, "Reach", "Sales", correlation_df['reach'], correlation_df['revenue'], total_possible_dates)
+        else:
+            correlations['reach_sales'] = None
+            # Pass empty series and 0 for total_possible_dates if no data for correlation
+            recommendations['reach_sales'] = get_recommendation_text(pd.NA, "Reach", "Sales", pd.Series(), pd.Series(), total_possible_dates)
 
-    return jsonify({
+    payload = {
         "message": "Correlation analysis successful.",
         "correlations": correlations,
         "recommendations": recommendations,
         "chart_data": chart_data # Include the data for plotting
+    }
+    if max_points is not None:
+        payload["downsampling"] = {"method": "lttb", "max_points": max_points, "points": total_possible_dates}
+    return payload
+
+@app.route('/api/correlation-analysis', methods=['GET'])
+@verify_token
+@profile_on_request
+def correlation_analysis():
+    """
+    API endpoint for Spearman's Rank Correlation analysis.
+    Calculates correlations between Engagement, Reach, and Sales.
+    Provides automated recommendations based on correlation strength.
+    Also returns the underlying data for scatter plotting.
+    Filters data by platform.
+    With approx=true the analysis runs on a sample of days and adds confidence intervals
+    (see compute_approx_correlation_analysis).
+    """
+    start_date_str = _normalize_date_param(request.args.get('start_date'))
+    end_date_str = _normalize_date_param(request.args.get('end_date'))
+    platform_filter = (request.args.get('platform') or 'all').strip().lower() # Get platform filter
+    max_points, error = parse_max_points(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+
+    if parse_approx_flag(request.args):
+        payload, status_code = cached_analytics(
+            ("correlation-analysis/approx", start_date_str, end_date_str, platform_filter, max_points),
+            lambda: compute_approx_correlation_analysis(start_date_str, end_date_str, platform_filter, max_points))
+        return jsonify(payload), status_code
+
+    payload, status_code = cached_analytics(
+        ("correlation-analysis", start_date_str, end_date_str, platform_filter, max_points),
+        lambda: compute_correlation_analysis(start_date_str, end_date_str, platform_filter, max_points))
+    return jsonify(payload), status_code
+
+def compute_correlation_analysis(start_date_str, end_date_str, platform_filter='all', max_points=None):
+    """Fetches the three tables and computes the correlation response. Returns (payload, status_code)."""
+    # Fetch data from all relevant tables
+    # IMPORTANT: fetch_table now handles pagination internally when limit is None
+    tiktok_records = fetch_frame("tiktokdata", TIKTOK_METRIC_COLUMNS, start_date=start_date_str, end_date=end_date_str,
+                                 wire_format=ANALYTICS_WIRE_FORMAT)
+    facebook_records = fetch_frame("facebookdata", FACEBOOK_METRIC_COLUMNS, start_date=start_date_str, end_date=end_date_str,
+                                   wire_format=ANALYTICS_WIRE_FORMAT)
+    sales_records = fetch_frame("sales", SALES_REVENUE_COLUMNS, start_date=start_date_str, end_date=end_date_str,
+                                wire_format=ANALYTICS_WIRE_FORMAT)
+
+    merged_df = build_correlation_frame(tiktok_records, facebook_records, sales_records, platform_filter)
+    return compute_correlation_results(merged_df, max_points), 200
+
+# --- Approximate analytics (approx=true) ---
+# Exact performance and correlation results need every raw row in the range. With approx=true
+# they are estimated from a random sample of whole days instead. Days are the unit both endpoints
+# aggregate to, so a sampled day's totals are exact and only the choice of days is random:
+#   * the range is split into strata (the performance chart buckets, or calendar months for
+#     correlation) and days are drawn from each stratum in proportion to its length, at least
+#     APPROX_MIN_DAYS_PER_STRATUM, so every bucket gets its own estimate;
+#   * the number of days is sized so the sample is about APPROX_SAMPLE_ROWS rows (from the exact
+#     row counts), which bounds latency however long the range is;
+#   * sampled days are read with a PostgREST 'date=in.(...)' filter (PostgREST has no native
+#     sampling), or filtered locally when the shared-cache replica already holds the table.
+# Bucket totals are stratified estimates (days in bucket x mean sampled day) with finite-population
+# corrected 95% margins, engagement rates are ratio estimates, and correlations come with Fisher-z
+# intervals. Responses carry an "approximate" block describing the sample.
+APPROX_SAMPLE_ROWS = int(os.environ.get("APPROX_SAMPLE_ROWS", 50000)) # Target rows read per request, all tables together
+APPROX_MIN_SAMPLE_DAYS = 60
+APPROX_MIN_DAYS_PER_STRATUM = 2 # The fewest days that give a variance estimate
+APPROX_DATE_FILTER_CHUNK = 100 # Dates per in.(...) request, keeping URLs short
+APPROX_CONFIDENCE_LEVEL = 0.95
+APPROX_RANDOM_SEED = 7 # Fixed so the same range always samples the same days (and cached results agree)
+APPROX_TABLES = {"tiktokdata": TIKTOK_METRIC_COLUMNS, "facebookdata": FACEBOOK_METRIC_COLUMNS, "sales": SALES_REVENUE_COLUMNS}
+
+def parse_approx_flag(args):
+    return (args.get('approx') or '').strip().lower() in ('1', 'true', 'yes')
+
+def _replica_frame(table_name, columns):
+    """The table from the shared cache if it is already there (never fetches), else None."""
+    if not shared_cache.enabled:
+        return None
+    return shared_cache.get_frame(("frame", table_name, tuple(columns.items())), max_age=SHARED_TABLE_TTL_SECONDS)
+
+def approx_date_range(start_date_str, end_date_str):
+    """
+    (first day, last day) to sample from: the requested range clamped to the days that have data, so
+    no sample is spent on (and no zero-valued bucket reported for) days before or after the data.
+    """
+    firsts, lasts = [], []
+    for table_name in APPROX_TABLES:
+        for order, found in (("date.asc", firsts), ("date.desc", lasts)):
+            records = fetch_table(table_name, select="date", order=order, limit=1, start_date=start_date_str, end_date=end_date_str)
+            if records:
+                found.append(pd.Timestamp(records[0]["date"]).normalize())
+    return min(firsts, default=None), max(lasts, default=None)
+
+def approx_bucket_labels(days, freq):
+    """The chart bucket each day falls in, labelled the way resample(freq) labels it."""
+    if freq == 'D':
+        return days
+    if freq == 'W':
+        return days.to_period('W-SUN').end_time.normalize()
+    return days.to_period('M').start_time
+
+def count_range_rows(table_name, columns, start_date_str, end_date_str):
+    replica = _replica_frame(table_name, columns)
+    if replica is not None:
+        return len(slice_date_range(replica, start_date_str, end_date_str))
+    _, total = fetch_table(table_name, select="date", limit=1, count=True, start_date=start_date_str, end_date=end_date_str)
+    return total or 0
+
+def sample_days(first, last, freq, sample_size, seed=APPROX_RANDOM_SEED):
+    """
+    Stratified random sample of days in [first, last]. Returns (sampled days, {bucket: days in bucket},
+    {bucket: sampled days in bucket}), buckets being approx_bucket_labels(freq).
+    """
+    days = pd.date_range(first, last, freq='D')
+    buckets = approx_bucket_labels(days, freq)
+    sizes = pd.Series(1, index=buckets).groupby(level=0).sum()
+    # Proportional allocation, but enough days per bucket for a variance (or all of a short bucket)
+    allocation = np.minimum(sizes.to_numpy(), np.maximum(APPROX_MIN_DAYS_PER_STRATUM,
+                                                         np.round(sample_size * sizes.to_numpy() / len(days)).astype(int)))
+    rng = np.random.default_rng(seed)
+    sampled = []
+    bucket_codes = pd.Index(sizes.index).get_indexer(buckets)
+    for code, take in enumerate(allocation):
+        members = np.flatnonzero(bucket_codes == code)
+        sampled.append(rng.choice(members, size=int(take), replace=False))
+    sampled_days = days[np.sort(np.concatenate(sampled))] if sampled else days[:0]
+    return sampled_days, dict(zip(sizes.index, sizes.to_numpy().tolist())), dict(zip(sizes.index, allocation.tolist()))
+
+def fetch_sampled_frames(sampled_days):
+    """{table: frame of the rows on sampled days}, plus where they came from ('replica' or 'supabase')."""
+    day_strings = sampled_days.strftime('%Y-%m-%d')
+    frames, sources = {}, set()
+    for table_name, columns in APPROX_TABLES.items():
+        replica = _replica_frame(table_name, columns)
+        if replica is not None:
+            with pipeline_stage("sample"):
+                frames[table_name] = replica[np.isin(replica["date"].to_numpy().astype('datetime64[D]'),
+                                                     sampled_days.to_numpy().astype('datetime64[D]'))].reset_index(drop=True)
+            sources.add("replica")
+            continue
+        parts = [_fetch_frame_uncached(table_name, columns, order="date.asc", wire_format=ANALYTICS_WIRE_FORMAT, raise_errors=True,
+                                       filters={"date": ("in", "(" + ",".join(day_strings[i:i + APPROX_DATE_FILTER_CHUNK]) + ")")})
+                 for i in range(0, len(day_strings), APPROX_DATE_FILTER_CHUNK)]
+        frames[table_name] = pd.concat(parts, ignore_index=True) if parts else _empty_frame(columns)
+        sources.add("supabase")
+    return frames, "+".join(sorted(sources))
+
+def draw_approx_sample(start_date_str, end_date_str, freq, platform_filter):
+    """
+    Samples days and aggregates them. Returns (daily frame indexed by the sampled days with 'engagement',
+    'reach' and 'revenue' columns, bucket sizes, bucket sample sizes, description), or None without data.
+    """
+    first, last = approx_date_range(start_date_str, end_date_str)
+    if first is None or last is None or first > last:
+        return None
+    total_days = (last - first).days + 1
+    range_start, range_end = first.strftime('%Y-%m-%d'), last.strftime('%Y-%m-%d')
+    total_rows = sum(count_range_rows(table_name, columns, range_start, range_end) for table_name, columns in APPROX_TABLES.items())
+    rows_per_day = max(total_rows / total_days, 1e-9)
+    sample_size = int(min(total_days, max(APPROX_MIN_SAMPLE_DAYS, APPROX_SAMPLE_ROWS / rows_per_day)))
+
+    sampled_days, bucket_sizes, bucket_samples = sample_days(first, last, freq, sample_size)
+    frames, source = fetch_sampled_frames(sampled_days)
+    daily = build_correlation_frame(frames["tiktokdata"], frames["facebookdata"], frames["sales"], platform_filter)
+    # A sampled day without rows had nothing happen that day: it counts as 0, it is not missing
+    daily = daily.reindex(columns=['engagement', 'reach', 'revenue'], fill_value=0).reindex(sampled_days, fill_value=0)
+    description = {
+        "method": "stratified_day_sample",
+        "confidence_level": APPROX_CONFIDENCE_LEVEL,
+        "sampled_days": len(sampled_days),
+        "total_days": total_days,
+        "sampled_rows": int(sum(len(frame) for frame in frames.values())),
+        "total_rows": int(total_rows),
+        "source": source,
+    }
+    return daily, bucket_sizes, bucket_samples, description
+
+def estimate_bucket_totals(daily, freq, bucket_sizes, bucket_samples):
+    """
+    Per-bucket estimates from the sampled days: totals of engagement, reach and revenue and the engagement
+    rate, each with the half-width of its confidence interval. Returns a DataFrame indexed by bucket.
+    """
+    with pipeline_stage("estimate"):
+        labels = approx_bucket_labels(daily.index, freq)
+        grouped = daily.groupby(labels)
+        means, variances = grouped.mean(), grouped.var(ddof=1).fillna(0)
+        sizes = pd.Series(bucket_sizes).reindex(means.index).astype(float)
+        taken = pd.Series(bucket_samples).reindex(means.index).astype(float)
+        # Finite population correction: a fully sampled bucket has no sampling error. Buckets hold only
+        # a few sampled days, so margins use Student's t with (sampled days - 1) degrees of freedom
+        z = np.array([_normal_or_t_quantile(1 - APPROX_CONFIDENCE_LEVEL, max(int(n) - 1, 1)) for n in taken])
+        error_scale = sizes * np.sqrt((1 - taken / sizes) / taken)
+
+        estimates = pd.DataFrame(index=means.index)
+        for column in ('engagement', 'reach', 'revenue'):
+            estimates[column] = sizes * means[column]
+            estimates[f"{column}_margin"] = z * error_scale * np.sqrt(variances[column])
+
+        # Engagement rate as a ratio estimator, its variance from the residuals engagement - rate * reach
+        rate = np.divide(means['engagement'], means['reach'], out=np.zeros(len(means)), where=means['reach'].to_numpy() > 0)
+        residuals = daily['engagement'] - pd.Series(rate, index=means.index).reindex(labels).to_numpy() * daily['reach']
+        residual_std = np.sqrt(residuals.groupby(labels).var(ddof=1).fillna(0))
+        estimates['rate'] = rate * 100
+        estimates['rate_margin'] = np.divide(z * error_scale * residual_std * 100, estimates['reach'],
+                                             out=np.zeros(len(means)), where=estimates['reach'].to_numpy() > 0)
+    return estimates
+
+def compute_approx_performance_data(start_date_str, end_date_str, platform_filter='all'):
+    """Estimated /api/performance-data response from sampled days. Returns (payload, status_code)."""
+    start_date = datetime.strptime(start_date_str, '%Y-%m-%d') if start_date_str else None
+    end_date = datetime.strptime(end_date_str, '%Y-%m-%d') if end_date_str else None
+    freq, date_format = choose_performance_frequency(start_date, end_date)
+
+    try:
+        sample = draw_approx_sample(start_date_str, end_date_str, freq, platform_filter)
+    except SupabaseFetchError as e:
+        logging.error(f"Could not read the approximate performance sample: {e}")
+        return {"error": "Sampled data is currently unavailable."}, 502
+    if sample is None:
+        return compute_performance_data(start_date_str, end_date_str, platform_filter)
+    daily, bucket_sizes, bucket_samples, description = sample
+    estimates = estimate_bucket_totals(daily, freq, bucket_sizes, bucket_samples)
+
+    dates = estimates.index.strftime(date_format)
+    social = pd.DataFrame({
+        "date": dates,
+        "engagement": estimates['rate'].round(2).to_numpy(),
+        "engagement_margin": estimates['rate_margin'].round(2).to_numpy(),
+        "engagement_total": estimates['engagement'].round(0).to_numpy(),
+        "engagement_total_margin": estimates['engagement_margin'].round(0).to_numpy(),
+        "reach_total": estimates['reach'].round(0).to_numpy(),
+        "reach_total_margin": estimates['reach_margin'].round(0).to_numpy(),
+    })
+    sales = pd.DataFrame({
+        "date": dates,
+        "sales_total": estimates['revenue'].round(2).to_numpy(),
+        "sales_total_margin": estimates['revenue_margin'].round(2).to_numpy(),
     })
+    # Strata are independent, so variances (squared margins) add up
+    total_sales = float(estimates['revenue'].sum())
+    total_sales_margin = float(np.sqrt(np.square(estimates['revenue_margin']).sum()))
+
+    performance_insights = generate_performance_insights(social, sales, start_date, end_date, platform_filter)
+    performance_insights = (f"Approximate figures estimated from {description['sampled_days']} of {description['total_days']} days. "
+                            + performance_insights)
+    with pipeline_stage("serialize"):
+        return {
+            "performance_charts_data": social.to_dict(orient='records'),
+            "sales_charts_data": sales.to_dict(orient='records'),
+            "total_sales_summary": round(total_sales, 2),
+            "total_sales_margin": round(total_sales_margin, 2),
+            "performance_insights": performance_insights,
+            "approximate": description,
+        }, 200
+
+def _fisher_interval(correlation, n):
+    """Confidence interval for a Spearman correlation from n pairs (Fisher z with the Fieller variance 1.06 / (n - 3))."""
+    if correlation is None or n <= 3:
+        return None
+    z = _normal_or_t_quantile(1 - APPROX_CONFIDENCE_LEVEL)
+    center = np.arctanh(np.clip(correlation, -0.999999, 0.999999))
+    half_width = z * np.sqrt(1.06 / (n - 3))
+    return [round(float(np.tanh(center - half_width)), 2), round(float(np.tanh(center + half_width)), 2)]
+
+def compute_approx_correlation_analysis(start_date_str, end_date_str, platform_filter='all', max_points=None):
+    """Correlation analysis on a sample of days (stratified by month). Returns (payload, status_code)."""
+    try:
+        sample = draw_approx_sample(start_date_str, end_date_str, 'MS', platform_filter)
+    except SupabaseFetchError as e:
+        logging.error(f"Could not read the approximate correlation sample: {e}")
+        return {"error": "Sampled data is currently unavailable."}, 502
+    if sample is None:
+        return compute_correlation_analysis(start_date_str, end_date_str, platform_filter, max_points)
+    daily, _, _, description = sample
+    payload = compute_correlation_results(daily, max_points)
+
+    paired_days = int(((daily['engagement'] > 0) & (daily['reach'] > 0) & (daily['revenue'] > 0)).sum())
+    payload["correlation_intervals"] = {name: _fisher_interval(value, paired_days) for name, value in payload["correlations"].items()}
+    payload["approximate"] = {**description, "paired_days": paired_days}
+    payload["message"] = (f"Approximate correlation analysis from {description['sampled_days']} sampled days "
+                          f"of {description['total_days']}.")
+    return payload, 200
+
+# --- Startup cache prewarming ---
+# With ANALYTICS_PREWARM=1 a background thread computes the results the frontend asks for on
+# first load (the performance page's preset date ranges and the correlation page's default range
+# for every platform filter, plus the predictive batch for all three metrics) into the analytics
+# cache. /ready answers 503 until that has finished so a load balancer can hold traffic back.
+ANALYTICS_PREWARM_ENABLED = os.environ.get("ANALYTICS_PREWARM") == "1"
+PREWARM_PLATFORMS = ['all', 'facebook', 'tiktok']
+PREWARM_PERFORMANCE_PRESETS = {'3months': 3, '6months': 6, 'lastyear': 12} # Months back, as in performance-evaluation.js
+PREWARM_CORRELATION_START_DATE = '2024-05-01' # Default start date in correlation-analysis.js
+PREWARM_CORRELATION_MAX_POINTS = 1000 # CORRELATION_CHART_MAX_POINTS in correlation-analysis.js
+PREWARM_PREDICTIVE_METRICS = ('engagement', 'reach', 'sales') # Order used by predictive-analytics.js
+
+prewarm_status = {"state": "disabled", "total": 0, "completed": 0, "failed": [], "current": None,
+                  "started_at": None, "finished_at": None}
+
+def _months_before(day, months):
+    """Same month arithmetic as JavaScript's Date.setMonth(month - n), including day overflow."""
+    month_index = day.year * 12 + day.month - 1 - months
+    return datetime(month_index // 12, month_index % 12 + 1, 1).date() + timedelta(days=day.day - 1)
+
+def build_prewarm_tasks():
+    """Returns [(description, cache_key, compute)] for the results worth precomputing."""
+    # The frontend computes its defaults from the UTC date (Date.toISOString)
+    today = datetime.utcnow().date()
+    end_date_str = today.strftime('%Y-%m-%d')
+    tasks = []
+
+    forecast_periods, time_budget = DEFAULT_FORECAST_MONTHS, FORECAST_TIME_BUDGET_SECONDS
+    tasks.append((f"predictive-analytics/batch {','.join(PREWARM_PREDICTIVE_METRICS)}",
+                  ("predictive-analytics/batch", PREWARM_PREDICTIVE_METRICS, forecast_periods, time_budget),
+                  lambda: compute_predictive_batch(list(PREWARM_PREDICTIVE_METRICS), forecast_periods, time_budget)))
+
+    for platform_filter in PREWARM_PLATFORMS:
+        for preset, months in PREWARM_PERFORMANCE_PRESETS.items():
+            start_date_str = _months_before(today, months).strftime('%Y-%m-%d')
+            tasks.append((f"performance-data {preset} {platform_filter}",
+                          ("performance-data", start_date_str, end_date_str, platform_filter, None),
+                          lambda s=start_date_str, p=platform_filter: compute_performance_data(s, end_date_str, p)))
+        tasks.append((f"correlation-analysis {platform_filter}",
+                      ("correlation-analysis", PREWARM_CORRELATION_START_DATE, end_date_str, platform_filter, PREWARM_CORRELATION_MAX_POINTS),
+                      lambda p=platform_filter: compute_correlation_analysis(PREWARM_CORRELATION_START_DATE, end_date_str, p,
+                                                                             PREWARM_CORRELATION_MAX_POINTS)))
+    return tasks
+
+def prewarm_analytics_cache():
+    """Runs every prewarm task in turn, updating prewarm_status. Failures are logged and skipped."""
+    tasks = build_prewarm_tasks()
+    prewarm_status.update(state="warming", total=len(tasks), completed=0, failed=[],
+                          started_at=datetime.now().isoformat(timespec='seconds'), finished_at=None)
+    started = time.perf_counter()
+    for description, key, compute in tasks:
+        prewarm_status["current"] = description
+        try:
+            cached_analytics(key, compute)
+        except Exception as e:
+            logging.error(f"Prewarm of {description} failed: {e}", exc_info=True)
+            prewarm_status["failed"].append(description)
+        prewarm_status["completed"] += 1
+    prewarm_status.update(state="ready", current=None, finished_at=datetime.now().isoformat(timespec='seconds'))
+    logging.info(f"Analytics cache prewarmed in {time.perf_counter() - started:.1f}s "
+                 f"({len(tasks) - len(prewarm_status['failed'])}/{len(tasks)} results).")
+
+def start_analytics_prewarm():
+    prewarm_status["state"] = "warming"
+    thread = threading.Thread(target=prewarm_analytics_cache, name="analytics-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+# --- Background services ---
+# The startup prewarm and the upload job threads run in serving processes only, never on a plain
+# 'import app' (the benchmark and backtest scripts, forecast pool workers). A WSGI server starts them
+# through the create_app() factory (e.g. gunicorn 'app:create_app()'); if it serves 'app:app'
+# directly they start with the first request instead.
+_background_services_started = False
+_background_services_lock = threading.Lock()
+
+def start_background_services():
+    """Starts the analytics prewarm (if enabled) and the upload job threads, once per process."""
+    global _background_services_started
+    with _background_services_lock:
+        if _background_services_started:
+            return
+        _background_services_started = True
+    if ANALYTICS_PREWARM_ENABLED:
+        start_analytics_prewarm()
+    start_upload_job_workers()
+
+def create_app():
+    """WSGI entry point: the Flask app with its background services running."""
+    start_background_services()
+    return app
+
+@app.before_request
+def ensure_background_services():
+    if not _background_services_started:
+        start_background_services()
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: 503 while the startup prewarm is running, 200 once it has finished (or is disabled)."""
+    status_code = 503 if prewarm_status["state"] == "warming" else 200
+    return jsonify({**prewarm_status, "ready": status_code == 200}), status_code
 
 # --- NEW ACTIVITY LOGGING ENDPOINT ---
 @app.route('/api/log_activity', methods=['POST'])
@@ -1575,5 +5525,14 @@ def get_activity_logs():
         return jsonify({"error": f"Failed to retrieve activity logs: {str(e)}"}), 500
 
 
+logging.info(f"app.py loaded in {time.perf_counter() - _module_import_started:.2f}s "
+             f"(analytics libraries deferred: {', '.join(name for name in ANALYTICS_MODULES if name not in sys.modules) or 'none'})")
+if ANALYTICS_WARMUP_ENABLED and __name__ != "__main__" and IS_MAIN_PROCESS:
+    warm_up_analytics_imports()
 if __name__ == "__main__":
+    if ANALYTICS_WARMUP_ENABLED:
+        warm_up_analytics_imports(wait_for=('127.0.0.1', 5000))
+    # The debug reloader's watcher process never serves; its child runs with WERKZEUG_RUN_MAIN=true
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_services()
     app.run(debug=True, host='127.0.0.1', port=5000)
@@ -0,0 +1,296 @@
+# fake_postgrest.py
+"""
+A local stand-in for the Supabase PostgREST API, for offline development and load testing.
+
+Serves the tables app.py reads (tiktokdata, facebookdata, sales, products, activity_logs) from
+memory and understands the query syntax fetch_table / fetch_summary emit:
+
+    select=col1,col2 | select=*  | select=sum(col)
+    order=col.asc | order=col.desc (comma separated for several keys)
+    col=eq.x  col=neq.x  col=gte.x  col=lte.x  col=gt.x  col=lt.x  col=in.(x,y,z)
+    limit=N&offset=M
+    Prefer: count=exact            -> total in the Content-Range header
+    Accept: text/csv               -> rows as CSV instead of JSON
+    col=in.("x,1","y")             -> double-quoted list items (backslash escapes)
+    POST JSON rows                 -> insert (Prefer: resolution=merge-duplicates upserts on the key)
+    DELETE with filters            -> delete (Prefer: return=representation answers with the rows)
+
+Tables are seeded with synthetic data (see synthetic_data.py) or loaded from CSV exports.
+
+Usage:
+    python fake_postgrest.py --rows 100000 --port 54321 --latency-ms 20
+    python fake_postgrest.py --table sales=sales.csv --table products=products.csv
+
+Then point the API at it:
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_API_KEY=local SCAPE_TEST_AUTH=1 python app.py
+"""
+import argparse
+import json
+import logging
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from synthetic_data import generate_synthetic_data
+
+# Upsert keys used for 'Prefer: resolution=merge-duplicates'
+PRIMARY_KEYS = {
+    "products": ["product_id"],
+    "sales": ["sale_id"],
+    "facebookdata": ["date", "post_id"],
+    "tiktokdata": ["date"],
+    "activity_logs": ["id"],
+}
+FILTER_OPERATORS = {
+    "eq": lambda column, value: column == value,
+    "neq": lambda column, value: column != value,
+    "gte": lambda column, value: column >= value,
+    "lte": lambda column, value: column <= value,
+    "gt": lambda column, value: column > value,
+    "lt": lambda column, value: column < value,
+}
+AGGREGATE_PATTERN = re.compile(r"^(sum|avg|min|max|count)\((\w+)\)$")
+IN_LIST_ITEM_PATTERN = re.compile(r'"((?:[^"\\]|\\.)*)"|([^,]+)')
+RESERVED_PARAMS = {"select", "order", "limit", "offset"}
+
+
+class TableStore:
+    """In-memory tables, one DataFrame each, guarded by a lock for inserts."""
+
+    def __init__(self):
+        self.tables = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        with self.lock:
+            return self.tables.get(name)
+
+    def insert(self, name, rows, upsert=False):
+        incoming = pd.DataFrame(rows)
+        with self.lock:
+            existing = self.tables.get(name, pd.DataFrame())
+            combined = pd.concat([existing, incoming], ignore_index=True)
+            keys = [k for k in PRIMARY_KEYS.get(name, []) if k in combined.columns]
+            if upsert and keys:
+                combined = combined.drop_duplicates(subset=keys, keep="last", ignore_index=True)
+            self.tables[name] = combined
+        return len(incoming)
+
+    def delete(self, name, params):
+        """Deletes the rows matching the filters in params. Returns the deleted rows."""
+        with self.lock:
+            frame = self.tables.get(name)
+            if frame is None:
+                return None
+            matched, _ = apply_query(frame, {key: values for key, values in params.items() if key not in RESERVED_PARAMS})
+            self.tables[name] = frame.drop(index=matched.index).reset_index(drop=True)
+            return matched
+
+
+def _coerce_filter_value(column, raw):
+    """Compares numerically on numeric columns, as strings otherwise (ISO dates sort lexically)."""
+    if pd.api.types.is_numeric_dtype(column):
+        try:
+            return float(raw)
+        except ValueError:
+            return raw
+    return raw
+
+
+def apply_query(frame, params):
+    """Applies PostgREST filters, ordering and select to a table. Returns (frame, aggregate_or_None)."""
+    mask = pd.Series(True, index=frame.index)
+    for key, values in params.items():
+        if key in RESERVED_PARAMS:
+            continue
+        if key not in frame.columns:
+            raise ValueError(f"column {key} does not exist")
+        for raw in values:
+            operator, _, value = raw.partition(".")
+            if operator == "in":
+                if not (value.startswith("(") and value.endswith(")")):
+                    raise ValueError(f"malformed in filter {value}")
+                items = [re.sub(r"\\(.)", r"\1", quoted) if quoted else bare.strip()
+                         for quoted, bare in IN_LIST_ITEM_PATTERN.findall(value[1:-1])]
+                mask &= frame[key].isin([_coerce_filter_value(frame[key], item) for item in items if item])
+                continue
+            if operator not in FILTER_OPERATORS:
+                raise ValueError(f"unsupported operator {operator}")
+            mask &= FILTER_OPERATORS[operator](frame[key], _coerce_filter_value(frame[key], value))
+    frame = frame[mask]
+
+    select = params.get("select", ["*"])[0]
+    aggregate = AGGREGATE_PATTERN.match(select.replace(" ", ""))
+    if aggregate:
+        function, column = aggregate.groups()
+        if column not in frame.columns:
+            raise ValueError(f"column {column} does not exist")
+        values = pd.to_numeric(frame[column], errors="coerce")
+        if function == "count":
+            return frame, {function: int(values.count())}
+        # Like Postgres, aggregates over no rows are NULL
+        result = getattr(values, "mean" if function == "avg" else function)() if values.count() else None
+        return frame, {function: None if result is None else float(result)}
+
+    if "order" in params:
+        columns, ascending = [], []
+        for term in params["order"][0].split(","):
+            column, _, direction = term.partition(".")
+            columns.append(column)
+            ascending.append(direction != "desc")
+        frame = frame.sort_values(columns, ascending=ascending, kind="stable")
+
+    if select != "*":
+        frame = frame[[c for c in select.split(",") if c]]
+    return frame, None
+
+
+def make_handler(store, latency_seconds):
+    class PostgrestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            logging.debug("%s - %s", self.address_string(), fmt % args)
+
+        def _table_name(self):
+            path = urllib.parse.urlsplit(self.path).path
+            prefix = "/rest/v1/"
+            return path[len(prefix):].strip("/") if path.startswith(prefix) else None
+
+        def _send(self, status, body, content_type="application/json", headers=None):
+            payload = body if isinstance(body, bytes) else body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _error(self, status, message):
+            self._send(status, json.dumps({"message": message}))
+
+        def do_GET(self):
+            if latency_seconds:
+                time.sleep(latency_seconds)
+            name = self._table_name()
+            frame = store.get(name) if name else None
+            if frame is None:
+                return self._error(404, f"relation \"{name}\" does not exist")
+
+            params = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query, keep_blank_values=True)
+            try:
+                frame, aggregate = apply_query(frame, params)
+            except (ValueError, KeyError) as e:
+                return self._error(400, str(e))
+            if aggregate is not None:
+                return self._send(200, json.dumps([aggregate]))
+
+            total = len(frame)
+            offset = int(params.get("offset", ["0"])[0])
+            limit = int(params["limit"][0]) if "limit" in params else total
+            page = frame.iloc[offset:offset + limit]
+
+            wants_count = "count=exact" in self.headers.get("Prefer", "")
+            range_end = offset + len(page) - 1
+            content_range = f"{offset}-{range_end}" if len(page) else "*"
+            content_range += f"/{total}" if wants_count else "/*"
+
+            if "text/csv" in self.headers.get("Accept", ""):
+                # Like PostgREST: header row plus one line per row, NULLs as empty fields
+                return self._send(200, page.to_csv(index=False), content_type="text/csv; charset=utf-8",
+                                  headers={"Content-Range": content_range})
+            body = page.to_json(orient="records", date_format="iso")
+            self._send(200, body, headers={"Content-Range": content_range})
+
+        def do_POST(self):
+            if latency_seconds:
+                time.sleep(latency_seconds)
+            name = self._table_name()
+            if not name:
+                return self._error(404, "unknown path")
+            try:
+                rows = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"[]")
+            except json.JSONDecodeError as e:
+                return self._error(400, f"invalid JSON: {e}")
+            if isinstance(rows, dict):
+                rows = [rows]
+            upsert = "resolution=merge-duplicates" in self.headers.get("Prefer", "")
+            store.insert(name, rows, upsert=upsert)
+            self._send(201, b"", headers={})
+
+        def do_DELETE(self):
+            if latency_seconds:
+                time.sleep(latency_seconds)
+            name = self._table_name()
+            params = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query, keep_blank_values=True)
+            if not name or not set(params) - RESERVED_PARAMS:
+                # Like Supabase, refuse to delete a whole table
+                return self._error(400, "DELETE requires a filter")
+            try:
+                deleted = store.delete(name, params)
+            except (ValueError, KeyError) as e:
+                return self._error(400, str(e))
+            if deleted is None:
+                return self._error(404, f"relation \"{name}\" does not exist")
+            if "return=representation" in self.headers.get("Prefer", ""):
+                return self._send(200, deleted.to_json(orient="records", date_format="iso"))
+            self._send(204, b"")
+
+    return PostgrestHandler
+
+
+def seed_store(args):
+    store = TableStore()
+    for spec in args.table:
+        name, _, path = spec.partition("=")
+        store.tables[name] = pd.read_csv(path)
+
+    if args.rows:
+        data = generate_synthetic_data(args.rows)
+        seeded = {
+            "tiktokdata": data["tiktok_records"],
+            "facebookdata": data["facebook_records"],
+            "sales": data["sales_records"],
+            "products": data["products_records"],
+        }
+        for name, records in seeded.items():
+            store.tables.setdefault(name, pd.DataFrame(records))
+
+    store.tables.setdefault("activity_logs", pd.DataFrame(columns=["id", "user_id", "action", "details", "timestamp"]))
+    # Keep the sales table keyed like production so upserts behave
+    if "sales" in store.tables and "sale_id" not in store.tables["sales"].columns:
+        store.tables["sales"]["sale_id"] = [f"seed-{i}" for i in range(len(store.tables["sales"]))]
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake PostgREST server for SCAPE.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--rows", type=int, default=10_000, help="Synthetic rows per table (0 to skip seeding).")
+    parser.add_argument("--table", action="append", default=[], help="Load a table from CSV: name=path.csv")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Artificial per-request latency.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    store = seed_store(args)
+    for name, frame in store.tables.items():
+        logging.info(f"Table {name}: {len(frame):,} rows")
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(store, args.latency_ms / 1000))
+    logging.info(f"Fake PostgREST listening on http://{args.host}:{args.port}/rest/v1/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
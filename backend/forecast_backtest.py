@@ -0,0 +1,253 @@
+# forecast_backtest.py
+"""
+Rolling-origin backtesting for the forecast models in app.py.
+
+Replays the monthly sales, engagement and reach history: for every forecast origin it fits
+each model on the months before the origin, forecasts the next `--horizon` months and scores
+the forecast against what actually happened. Accuracy (MAPE, sMAPE, interval coverage), fit and
+predict wall time and peak traced memory are aggregated per metric and model and written as JSON.
+The budgeted 'auto' selection fits and scores several models internally, so all of its time is
+counted as fit time.
+
+Usage:
+    # Against Supabase (needs the same environment variables as app.py)
+    python forecast_backtest.py --out backtest_report.json
+
+    # Offline, from CSV exports of the Supabase tables
+    python forecast_backtest.py --sales-csv sales.csv --tiktok-csv tiktokdata.csv \
+        --facebook-csv facebookdata.csv --models ets,auto_arima --arima-setting max_p=2
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of SCAPE forecast models.")
+    parser.add_argument("--metrics", default="sales,engagement,reach",
+                        help="Comma separated metrics to backtest.")
+    parser.add_argument("--models", default=None,
+                        help="Comma separated registry models to score (default: all), plus 'auto' for budgeted selection.")
+    parser.add_argument("--horizon", type=int, default=12, help="Months forecast from each origin.")
+    parser.add_argument("--min-train", type=int, default=24, help="Months of history before the first origin.")
+    parser.add_argument("--step", type=int, default=1, help="Months between consecutive origins.")
+    parser.add_argument("--time-budget", type=float, default=None,
+                        help="Time budget (seconds) passed to the 'auto' selection.")
+    parser.add_argument("--arima-setting", action="append", default=[],
+                        help="Override an AUTO_ARIMA_SEARCH_SETTINGS entry, e.g. max_p=2 or stepwise=false.")
+    parser.add_argument("--sales-csv", help="CSV export of the 'sales' table (date, revenue).")
+    parser.add_argument("--tiktok-csv", help="CSV export of the 'tiktokdata' table.")
+    parser.add_argument("--facebook-csv", help="CSV export of the 'facebookdata' table.")
+    parser.add_argument("--out", default="backtest_report.json", help="Where to write the JSON report.")
+    return parser.parse_args()
+
+
+def parse_setting(raw):
+    """Parses 'key=value' into a typed (key, value) pair for the auto_arima settings."""
+    key, _, value = raw.partition("=")
+    lowered = value.lower()
+    if lowered in ("true", "false"):
+        return key, lowered == "true"
+    try:
+        return key, int(value)
+    except ValueError:
+        return key, float(value)
+
+
+def load_source_records(args, app):
+    """Loads the raw table records, from CSV files if given, otherwise from Supabase."""
+    offline = args.sales_csv or args.tiktok_csv or args.facebook_csv
+
+    def from_csv(path):
+        return pd.read_csv(path).to_dict(orient="records") if path else []
+
+    if offline:
+        return {
+            "sales_records": from_csv(args.sales_csv),
+            "tiktok_records": from_csv(args.tiktok_csv),
+            "facebook_records": from_csv(args.facebook_csv),
+        }
+    return {
+        "sales_records": app.fetch_table("sales", select="date,revenue", order="date.asc", limit=None),
+        "tiktok_records": app.fetch_table("tiktokdata", select="date,views,likes,comments,shares", order="date.asc", limit=None),
+        "facebook_records": app.fetch_table("facebookdata", select="date,likes,comments,shares,reach", order="date.asc", limit=None),
+    }
+
+
+def run_model(app, model_name, train, horizon, time_budget):
+    """
+    Fits one model and forecasts `horizon` months.
+    Returns (mean, lower, upper, chosen_model, fit_seconds, predict_seconds).
+    """
+    if model_name == "auto":
+        started = time.perf_counter()
+        results, _, selection = app.perform_forecast(train, horizon, time_budget=time_budget)
+        fit_seconds = time.perf_counter() - started
+        frame = pd.DataFrame(results)
+        return (frame["value"].to_numpy(), frame["lower_bound"].to_numpy(),
+                frame["upper_bound"].to_numpy(), selection["model"], fit_seconds, 0.0)
+
+    alpha = 1 - app.FORECAST_CONFIDENCE_LEVEL
+    model = app.FORECAST_MODELS[model_name]
+    started = time.perf_counter()
+    fitted = model["fit_model"](train)
+    fit_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    mean, lower, upper, _ = model["predict"](fitted, horizon, alpha)
+    predict_seconds = time.perf_counter() - started
+    # Same non-negativity the API applies before returning forecasts
+    return (np.clip(mean, 0, None), np.clip(lower, 0, None), np.clip(upper, 0, None), model_name,
+            fit_seconds, predict_seconds)
+
+
+def score_forecast(actual, mean, lower, upper):
+    """Accuracy metrics for one forecast. MAPE ignores months whose actual value is 0."""
+    nonzero = actual != 0
+    mape = float(np.mean(np.abs((actual[nonzero] - mean[nonzero]) / actual[nonzero])) * 100) if nonzero.any() else None
+    denominator = np.abs(actual) + np.abs(mean)
+    smape_terms = np.divide(2 * np.abs(mean - actual), denominator,
+                            out=np.zeros_like(denominator, dtype=float), where=denominator != 0)
+    coverage = float(np.mean((actual >= lower) & (actual <= upper)))
+    return {"mape": mape, "smape": float(np.mean(smape_terms) * 100), "coverage": coverage}
+
+
+def backtest_series(app, series, models, args):
+    """Runs every model from every rolling origin of one monthly series."""
+    runs = []
+    last_origin = len(series) - args.horizon
+    for origin in range(args.min_train, last_origin + 1, args.step):
+        train = series.iloc[:origin]
+        actual = series.iloc[origin:origin + args.horizon].to_numpy(dtype=float)
+        for model_name in models:
+            if model_name != "auto" and len(train) < app.FORECAST_MODELS[model_name]["min_points"]:
+                continue
+
+            tracemalloc.start()
+            started = time.perf_counter()
+            fit_seconds = predict_seconds = None
+            try:
+                mean, lower, upper, chosen, fit_seconds, predict_seconds = run_model(
+                    app, model_name, train, args.horizon, args.time_budget)
+                error = None
+            except Exception as e:
+                error = str(e)
+            elapsed = time.perf_counter() - started
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            run = {
+                "model": model_name,
+                "origin": train.index.max().strftime("%Y-%m-%d"),
+                "train_points": len(train),
+                "fit_predict_seconds": round(elapsed, 4),
+                "fit_seconds": None if fit_seconds is None else round(fit_seconds, 4),
+                "predict_seconds": None if predict_seconds is None else round(predict_seconds, 4),
+                "peak_memory_bytes": peak_bytes,
+            }
+            if error:
+                run["error"] = error
+            else:
+                run.update(score_forecast(actual, mean, lower, upper))
+                run["chosen_model"] = chosen
+            runs.append(run)
+    return runs
+
+
+def summarize(runs):
+    """Aggregates per-origin runs into one row per model."""
+    summary = {}
+    frame = pd.DataFrame(runs)
+    if frame.empty:
+        return summary
+    for model_name, group in frame.groupby("model", sort=False):
+        ok = group[group["error"].isna()] if "error" in group else group
+        summary[model_name] = {
+            "origins": int(len(group)),
+            "failures": int(len(group) - len(ok)),
+            "mape_mean": None if ok.empty or ok["mape"].isna().all() else round(float(ok["mape"].mean()), 2),
+            "smape_mean": None if ok.empty else round(float(ok["smape"].mean()), 2),
+            "coverage_mean": None if ok.empty else round(float(ok["coverage"].mean()), 3),
+            "fit_predict_seconds_mean": round(float(group["fit_predict_seconds"].mean()), 4),
+            "fit_predict_seconds_p95": round(float(group["fit_predict_seconds"].quantile(0.95)), 4),
+            "fit_seconds_mean": None if ok.empty else round(float(ok["fit_seconds"].mean()), 4),
+            "fit_seconds_p95": None if ok.empty else round(float(ok["fit_seconds"].quantile(0.95)), 4),
+            "predict_seconds_mean": None if ok.empty else round(float(ok["predict_seconds"].mean()), 4),
+            "predict_seconds_p95": None if ok.empty else round(float(ok["predict_seconds"].quantile(0.95)), 4),
+            "peak_memory_bytes_max": int(group["peak_memory_bytes"].max()),
+        }
+        if model_name == "auto" and not ok.empty:
+            summary[model_name]["chosen_models"] = ok["chosen_model"].value_counts().to_dict()
+    return summary
+
+
+def main():
+    args = parse_args()
+    offline = args.sales_csv or args.tiktok_csv or args.facebook_csv
+    if offline:
+        # app.py refuses to import without a Supabase key; it is never used for offline runs
+        os.environ.setdefault("SUPABASE_API_KEY", "offline-backtest")
+
+    import app
+    logging.getLogger().setLevel(logging.WARNING)
+    # app.py imports scipy, statsmodels and pmdarima on first use; load them now so that cost
+    # does not land in the first timed fit or predict
+    for name in app.ANALYTICS_MODULES:
+        app.import_analytics_module(name)
+
+    for raw in args.arima_setting:
+        key, value = parse_setting(raw)
+        app.AUTO_ARIMA_SEARCH_SETTINGS[key] = value
+
+    models = args.models.split(",") if args.models else list(app.FORECAST_MODELS) + ["auto"]
+    unknown = [m for m in models if m != "auto" and m not in app.FORECAST_MODELS]
+    if unknown:
+        raise SystemExit(f"Unknown model(s): {', '.join(unknown)}. Available: {', '.join(app.FORECAST_MODELS)}, auto")
+
+    source_records = load_source_records(args, app)
+    report = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "horizon": args.horizon,
+        "min_train": args.min_train,
+        "step": args.step,
+        "confidence_level": app.FORECAST_CONFIDENCE_LEVEL,
+        "auto_arima_settings": dict(app.AUTO_ARIMA_SEARCH_SETTINGS),
+        "metrics": {},
+    }
+
+    for metric_type in args.metrics.split(","):
+        try:
+            series = app.prepare_monthly_forecast_series(app.build_metric_series(metric_type, **source_records))
+        except ValueError as e:
+            report["metrics"][metric_type] = {"error": str(e)}
+            continue
+
+        if len(series) < args.min_train + args.horizon:
+            report["metrics"][metric_type] = {
+                "error": f"Need at least {args.min_train + args.horizon} complete months, have {len(series)}."
+            }
+            continue
+
+        print(f"Backtesting {metric_type}: {len(series)} months, models {', '.join(models)}")
+        runs = backtest_series(app, series, models, args)
+        report["metrics"][metric_type] = {"months": len(series), "summary": summarize(runs), "runs": runs}
+
+        for model_name, row in report["metrics"][metric_type]["summary"].items():
+            print(f"  {model_name:<15} sMAPE {row['smape_mean']}  coverage {row['coverage_mean']}  "
+                  f"fit {row['fit_seconds_mean']}s  predict {row['predict_seconds_mean']}s  peak {row['peak_memory_bytes_max'] / 1e6:.1f} MB")
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote backtest report to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# load_test.py
+"""
+Concurrent load driver for the SCAPE API.
+
+Simulated users replay page sessions drawn from a weighted mix that mirrors what the frontend
+requests on each page load (dashboard, performance evaluation, correlation, predictive analytics,
+activity log). Latency is recorded per endpoint and reported as p50/p95/p99 together with
+throughput and error counts; the full result is also written as JSON.
+
+Offline setup (no Supabase or Firebase needed):
+    python fake_postgrest.py --rows 100000 --latency-ms 20
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_API_KEY=local SCAPE_TEST_AUTH=1 python app.py
+    python load_test.py --users 20 --duration 60
+
+Usage:
+    python load_test.py --base-url http://127.0.0.1:5000 --token test:loadtest:admin --users 20 --duration 60
+"""
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import requests
+
+
+def _months_ago(months):
+    today = date.today()
+    month_index = today.year * 12 + today.month - 1 - months
+    return date(month_index // 12, month_index % 12 + 1, 1).isoformat()
+
+
+def build_session_mix():
+    """
+    Page sessions as (weight, [(method, path, params)]). Weights approximate how often each page
+    is opened; request lists follow what the page's JavaScript fetches on load.
+    """
+    today = date.today().isoformat()
+    three_months_ago = (date.today() - timedelta(days=90)).isoformat()
+    return {
+        "dashboard": (40, [
+            ("GET", "/api/dashboard", {"start_date": _months_ago(12), "end_date": today, "platform": "all"}),
+        ]),
+        "performance_evaluation": (25, [
+            ("GET", "/api/performance-data", {"start_date": three_months_ago, "end_date": today, "platform": "all"}),
+        ]),
+        "correlation_analysis": (15, [
+            ("GET", "/api/correlation-analysis", {"start_date": "2024-05-01", "end_date": today, "max_points": 1000}),
+        ]),
+        "predictive_analytics": (15, [
+            ("GET", "/api/predictive-analytics/batch", {"metric_types": "engagement,reach,sales", "forecast_months": 36}),
+        ]),
+        "activity_log": (5, [
+            ("GET", "/api/activity_logs", {"page": 1, "limit": 10}),
+            ("POST", "/api/log_activity", {"action": "PAGE_VIEW", "details": "Load test page view."}),
+        ]),
+    }
+
+
+class LatencyRecorder:
+    """Thread-safe per-endpoint latency and status collection."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint, seconds, status):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_user(user_index, args, sessions, recorder, deadline):
+    """One simulated user: picks sessions by weight and replays them until the deadline."""
+    rng = random.Random(args.seed + user_index)
+    names = list(sessions)
+    weights = [sessions[name][0] for name in names]
+    http = requests.Session()
+    http.headers["Authorization"] = f"Bearer {args.token}"
+
+    while time.monotonic() < deadline:
+        for method, path, params in sessions[rng.choices(names, weights)[0]][1]:
+            started = time.perf_counter()
+            try:
+                if method == "POST":
+                    response = http.post(args.base_url + path, json=params, timeout=args.timeout)
+                else:
+                    response = http.get(args.base_url + path, params=params, timeout=args.timeout)
+                status = response.status_code
+            except requests.RequestException as e:
+                status = type(e).__name__
+            recorder.record(f"{method} {path}", time.perf_counter() - started, status)
+        if args.think_time:
+            time.sleep(rng.uniform(0, 2 * args.think_time))
+
+
+def summarize(recorder, elapsed):
+    summary = {}
+    for endpoint, values in sorted(recorder.latencies.items()):
+        ordered = sorted(values)
+        statuses = dict(recorder.statuses[endpoint])
+        errors = sum(count for status, count in statuses.items() if not (isinstance(status, int) and status < 400))
+        summary[endpoint] = {
+            "requests": len(ordered),
+            "errors": errors,
+            "throughput_rps": round(len(ordered) / elapsed, 2),
+            "mean_ms": round(statistics.fmean(ordered) * 1000, 1),
+            "p50_ms": round(percentile(ordered, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(ordered, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(ordered, 0.99) * 1000, 1),
+            "max_ms": round(ordered[-1] * 1000, 1),
+            "statuses": {str(status): count for status, count in statuses.items()},
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for the SCAPE API.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--token", default="test:loadtest:admin",
+                        help="Bearer token; 'test:<uid>[:admin]' works when the API runs with SCAPE_TEST_AUTH=1.")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent simulated users.")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to run.")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean pause between sessions per user (seconds).")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout (seconds).")
+    parser.add_argument("--sessions", help="Comma separated subset of sessions to run.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="load_test_results.json")
+    args = parser.parse_args()
+    args.base_url = args.base_url.rstrip("/")
+
+    sessions = build_session_mix()
+    if args.sessions:
+        sessions = {name: sessions[name] for name in args.sessions.split(",")}
+
+    recorder = LatencyRecorder()
+    started = time.monotonic()
+    deadline = started + args.duration
+    print(f"Running {args.users} users for {args.duration:.0f}s against {args.base_url} ({', '.join(sessions)})")
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        for future in [pool.submit(run_user, i, args, sessions, recorder, deadline) for i in range(args.users)]:
+            future.result()
+    elapsed = time.monotonic() - started
+
+    summary = summarize(recorder, elapsed)
+    print(f"\n{'endpoint':<42}{'reqs':>7}{'err':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, row in summary.items():
+        print(f"{endpoint:<42}{row['requests']:>7}{row['errors']:>6}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+
+    with open(args.out, "w") as f:
+        json.dump({"base_url": args.base_url, "users": args.users, "elapsed_seconds": round(elapsed, 2),
+                   "endpoints": summary}, f, indent=2)
+    print(f"\nWrote load test results to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
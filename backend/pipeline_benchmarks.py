@@ -0,0 +1,223 @@
+# pipeline_benchmarks.py
+"""
+Micro-benchmarks for the pandas pipelines in app.py, run on synthetic data.
+
+Generates tiktokdata / facebookdata / sales / products records shaped like fetch_table output
+(lists of dicts with string dates) at the requested sizes, then runs each pipeline the API uses:
+
+    performance_data      aggregate_performance_data + insights + payload + JSON encoding
+    correlation_analysis  build_correlation_frame + compute_correlation_results + JSON encoding
+    predictive_analytics  build_metric_series + prepare_monthly_forecast_series (no model fit)
+    fetch_top_products    aggregate_top_products
+    sales_rollup          SalesRollup build plus top-5 queries over one, three and twelve months
+    anomaly_detection     build_daily_metric_matrix + detect_anomalies over the full history
+    upload_normalization  prepare_upload_tables for Facebook, TikTok and Sales uploads
+    raw_data              JSON encoding of the raw table records (/api/tiktokdata etc.)
+
+Per-stage wall time (build_frames, coerce, aggregate, resample, merge, serialize, ...) is collected
+through app.record_pipeline_stages, and peak memory through tracemalloc in a separate pass so it does
+not distort the timings. Results are written as JSON tagged with the current git commit; pass
+--compare with an earlier results file to print the change per pipeline.
+
+--json-provider flask swaps in Flask's built-in JSON provider, so the orjson-backed provider can be
+compared against it on the same data:
+    python pipeline_benchmarks.py --pipelines raw_data,correlation_analysis --json-provider flask --out flask.json
+    python pipeline_benchmarks.py --pipelines raw_data,correlation_analysis --compare flask.json
+
+Usage:
+    python pipeline_benchmarks.py --sizes 10k,1M --out bench_results.json
+    python pipeline_benchmarks.py --sizes 10k,1M --compare bench_results.json
+Note: 10M rows per table needs tens of GB of RAM, because records are held as Python dicts
+exactly like fetch_table returns them.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from flask.json.provider import DefaultJSONProvider
+
+from synthetic_data import generate_synthetic_data
+
+# app.py refuses to import without a Supabase key; nothing here talks to Supabase
+os.environ.setdefault("SUPABASE_API_KEY", "benchmark")
+import app  # noqa: E402
+
+SIZE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+PIPELINES = ["performance_data", "correlation_analysis", "predictive_analytics", "fetch_top_products", "sales_rollup",
+             "anomaly_detection", "upload_normalization", "raw_data"]
+
+
+def parse_size(raw):
+    """'10k' -> 10000, '1M' -> 1000000, '2500' -> 2500."""
+    raw = raw.strip().lower()
+    if raw[-1] in SIZE_SUFFIXES:
+        return int(float(raw[:-1]) * SIZE_SUFFIXES[raw[-1]])
+    return int(raw)
+
+
+def json_encode(payload):
+    """Encodes a response body the same way Flask's jsonify does (timed as the json_encode stage)."""
+    with app.app.app_context():
+        return app.app.json.dumps(payload)
+
+
+def run_pipeline(name, data):
+    """Runs one pipeline end to end on the synthetic data."""
+    if name == "performance_data":
+        freq, date_format = app.choose_performance_frequency(data["start_date"], data["end_date"])
+        social, sales, total_sales = app.aggregate_performance_data(
+            data["tiktok_records"], data["facebook_records"], data["sales_records"], freq, date_format, "all")
+        insights = app.generate_performance_insights(social, sales, data["start_date"], data["end_date"], "all")
+        json_encode(app.build_performance_payload(social, sales, total_sales, insights))
+    elif name == "correlation_analysis":
+        merged_df = app.build_correlation_frame(data["tiktok_records"], data["facebook_records"], data["sales_records"], "all")
+        json_encode(app.compute_correlation_results(merged_df))
+    elif name == "predictive_analytics":
+        for metric_type in app.PREDICTIVE_METRIC_NAMES:
+            series = app.build_metric_series(metric_type, sales_records=data["sales_records"],
+                                             tiktok_records=data["tiktok_records"],
+                                             facebook_records=data["facebook_records"])
+            app.prepare_monthly_forecast_series(series)
+    elif name == "fetch_top_products":
+        json_encode(app.aggregate_top_products(data["sales_records"], data["products_records"], limit=5))
+    elif name == "sales_rollup":
+        rollup = app.SalesRollup().load(app.records_to_frame(data["sales_records"]), data["products_records"])
+        end_date = data["end_date"].strftime("%Y-%m-%d")
+        for months in (1, 3, 12):
+            start_date = (data["end_date"] - pd.DateOffset(months=months)).strftime("%Y-%m-%d")
+            json_encode(rollup.top_products(limit=5, start_date=start_date, end_date=end_date))
+    elif name == "anomaly_detection":
+        keys, days, values = app.build_daily_metric_matrix(data["tiktok_records"], data["facebook_records"], data["sales_records"])
+        json_encode(app.detect_anomalies(keys, days, values))
+    elif name == "upload_normalization":
+        for app_name, frame in data["uploads"].items():
+            app.prepare_upload_tables(frame.copy(), app_name)
+    elif name == "raw_data":
+        for table in ("tiktok_records", "facebook_records", "sales_records"):
+            json_encode(data[table])
+    else:
+        raise ValueError(f"Unknown pipeline: {name}")
+
+
+def time_pipeline(name, data, repeats):
+    """Returns (median total seconds, {stage: median seconds}) over `repeats` runs."""
+    totals, stage_runs = [], defaultdict(list)
+    for _ in range(repeats):
+        stages = defaultdict(float)
+
+        def recorder(stage, seconds):
+            stages[stage] += seconds
+
+        started = time.perf_counter()
+        with app.record_pipeline_stages(recorder):
+            run_pipeline(name, data)
+        totals.append(time.perf_counter() - started)
+        for stage, seconds in stages.items():
+            stage_runs[stage].append(seconds)
+
+    return statistics.median(totals), {stage: round(statistics.median(values), 6) for stage, values in stage_runs.items()}
+
+
+def measure_peak_memory(name, data):
+    """Peak bytes allocated (as traced by tracemalloc) while running the pipeline once."""
+    tracemalloc.start()
+    try:
+        run_pipeline(name, data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)), text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(current, baseline):
+    """Prints per-pipeline time and memory ratios against an earlier results file."""
+    print(f"\nComparison against {baseline.get('commit')} (ratio > 1 means slower / more memory now):")
+    for size, pipelines in current["results"].items():
+        for name, row in pipelines.items():
+            old = baseline.get("results", {}).get(size, {}).get(name)
+            if not old:
+                continue
+            time_ratio = row["total_seconds"] / old["total_seconds"] if old["total_seconds"] else float("nan")
+            memory_ratio = (row["peak_memory_bytes"] / old["peak_memory_bytes"]
+                            if row.get("peak_memory_bytes") and old.get("peak_memory_bytes") else float("nan"))
+            print(f"  {size:>9} {name:<22} time x{time_ratio:.2f}  memory x{memory_ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SCAPE pandas pipelines on synthetic data.")
+    parser.add_argument("--sizes", default="10k,1M", help="Rows per table, e.g. 10k,1M,10M.")
+    parser.add_argument("--pipelines", default=",".join(PIPELINES), help="Comma separated pipelines to run.")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per pipeline (median is reported).")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc peak memory pass.")
+    parser.add_argument("--out", default="bench_results.json", help="Where to write the JSON results.")
+    parser.add_argument("--compare", help="Earlier results file to compare against.")
+    parser.add_argument("--json-provider", choices=["fast", "flask"], default="fast",
+                        help="JSON provider used for encoding: the app's (orjson when installed) or Flask's built-in one.")
+    args = parser.parse_args()
+
+    if args.json_provider == "flask":
+        app.app.json = DefaultJSONProvider(app.app)
+
+    # The pipelines log every record at INFO level; keep benchmark output readable
+    logging.getLogger().setLevel(logging.WARNING)
+
+    report = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "json_provider": type(app.app.json).__name__ + ("" if args.json_provider == "flask" or app.orjson is None else " (orjson)"),
+        "results": {},
+    }
+
+    for raw_size in args.sizes.split(","):
+        rows = parse_size(raw_size)
+        print(f"Generating {rows:,} rows per table...")
+        data = generate_synthetic_data(rows)
+        # Large inputs take long enough that one timed run is representative
+        repeats = args.repeats if rows < 1_000_000 else 1
+
+        size_results = {}
+        for name in args.pipelines.split(","):
+            total, stages = time_pipeline(name, data, repeats)
+            row = {"rows": rows, "repeats": repeats, "total_seconds": round(total, 6), "stages": stages}
+            if not args.no_memory:
+                row["peak_memory_bytes"] = measure_peak_memory(name, data)
+            size_results[name] = row
+
+            memory = f"  peak {row['peak_memory_bytes'] / 1e6:,.1f} MB" if "peak_memory_bytes" in row else ""
+            stage_text = ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in stages.items())
+            print(f"  {name:<22} {total:8.3f}s{memory}  [{stage_text}]")
+        report["results"][raw_size.strip()] = size_results
+        del data
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote benchmark results to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
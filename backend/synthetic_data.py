@@ -0,0 +1,75 @@
+# synthetic_data.py
+"""
+Synthetic tiktokdata / facebookdata / sales / products data shaped like the Supabase tables.
+Shared by the pipeline benchmarks and the fake PostgREST server.
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+
+def generate_synthetic_data(rows, days=3 * 365, seed=0):
+    """
+    Builds `rows` records per table spread over `days` days ending yesterday, plus the raw
+    DataFrames an upload of the same data would start from.
+    """
+    rng = np.random.default_rng(seed)
+    end = datetime.now().date() - timedelta(days=1)
+    start = end - timedelta(days=days - 1)
+    all_dates = pd.date_range(start, end, freq="D").strftime("%Y-%m-%d").to_numpy()
+
+    def dates():
+        return np.sort(all_dates[rng.integers(0, days, rows)])
+
+    tiktok = pd.DataFrame({
+        "date": dates(),
+        "views": rng.integers(100, 50_000, rows),
+        "likes": rng.integers(0, 5_000, rows),
+        "comments": rng.integers(0, 500, rows),
+        "shares": rng.integers(0, 500, rows),
+    })
+    facebook = pd.DataFrame({
+        "date": dates(),
+        "likes": rng.integers(0, 3_000, rows),
+        "comments": rng.integers(0, 300, rows),
+        "shares": rng.integers(0, 300, rows),
+        "reach": rng.integers(100, 30_000, rows),
+        "post_id": np.char.add("post-", np.arange(rows).astype(str)),
+    })
+
+    product_count = int(min(5_000, max(50, rows // 1_000)))
+    product_ids = np.char.add("P", np.arange(product_count).astype(str))
+    products = pd.DataFrame({
+        "product_id": product_ids,
+        "product_name": np.char.add("Product ", np.arange(product_count).astype(str)),
+    })
+    quantity = rng.integers(1, 10, rows)
+    price = np.round(rng.uniform(50, 2_000, rows), 2)
+    sales = pd.DataFrame({
+        "date": dates(),
+        "product_id": product_ids[rng.integers(0, product_count, rows)],
+        "quantity_sold": quantity,
+        "price": price,
+        "revenue": np.round(quantity * price, 2),
+    })
+
+    sales_upload = sales.rename(columns={
+        "date": "Date", "product_id": "Product ID", "quantity_sold": "Quantity Sold",
+        "price": "Price", "revenue": "Revenue",
+    })
+    sales_upload["Product Name"] = "Product " + sales_upload["Product ID"].str[1:]
+
+    return {
+        "tiktok_records": tiktok.to_dict(orient="records"),
+        "facebook_records": facebook.drop(columns=["post_id"]).to_dict(orient="records"),
+        "sales_records": sales.to_dict(orient="records"),
+        "products_records": products.to_dict(orient="records"),
+        "uploads": {
+            "facebook": facebook.rename(columns=str.title),
+            "tiktok": tiktok.rename(columns=str.title),
+            "sales": sales_upload,
+        },
+        "start_date": datetime.combine(start, datetime.min.time()),
+        "end_date": datetime.combine(end, datetime.min.time()),
+    }
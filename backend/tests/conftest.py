@@ -0,0 +1,48 @@
+# conftest.py
+"""
+Shared setup for the backend tests. app.py reads its configuration at import time and refuses to
+import without a Supabase key, so the environment is prepared before any test imports it. Nothing
+here talks to Supabase: tests call the pure functions and classes directly, or run against the
+in-memory fake_postgrest server through the `fake_supabase` fixture.
+"""
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+os.environ.setdefault("SUPABASE_API_KEY", "test")
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9") # Unroutable on purpose
+os.environ.setdefault("SHARED_CACHE", "0")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def fake_supabase(monkeypatch, tmp_path):
+    """
+    A fake_postgrest TableStore served on a free local port, with app pointed at it and given its own
+    row hash index. Tests seed tables with store.tables[name] = DataFrame.
+    """
+    import app
+    import fake_postgrest
+
+    store = fake_postgrest.TableStore()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), fake_postgrest.make_handler(store, 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(app, "SUPABASE_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setattr(app, "row_hash_index", app.RowHashIndex(str(tmp_path / "row_hashes.sqlite3")))
+    try:
+        yield store
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def table_rows(store, name):
+    """The rows a fake_postgrest table holds, as records without pandas' missing-value markers."""
+    frame = store.tables.get(name, pd.DataFrame())
+    return frame.astype(object).where(frame.notna(), None).to_dict(orient="records")
@@ -0,0 +1,108 @@
+# test_analytics_cache.py
+"""cached_analytics: single-flight misses, shared errors and invalidation while a computation runs."""
+import threading
+
+import pytest
+
+import app
+
+FOLLOWERS = 4
+
+
+class CountingEvent(threading.Event):
+    """An Event that counts the threads waiting on it, so a test can tell when followers have joined."""
+    def __init__(self):
+        super().__init__()
+        self.waiting = threading.Semaphore(0)
+
+    def wait(self, timeout=None):
+        self.waiting.release()
+        return super().wait(timeout)
+
+
+@pytest.fixture(autouse=True)
+def flights(monkeypatch):
+    class Flight(app.AnalyticsFlight):
+        def __init__(self):
+            super().__init__()
+            self.done = CountingEvent()
+            flights.append(self)
+
+    flights = []
+    monkeypatch.setattr(app, "AnalyticsFlight", Flight)
+    app.invalidate_analytics_cache()
+    yield flights
+    app.invalidate_analytics_cache()
+
+
+def run_with_followers(flights, key, compute):
+    """Calls cached_analytics(key, compute) from a leader and FOLLOWERS threads; returns their outcomes."""
+    outcomes = []
+
+    def call():
+        try:
+            outcomes.append(app.cached_analytics(key, compute))
+        except Exception as e:
+            outcomes.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    followers = [threading.Thread(target=call) for _ in range(FOLLOWERS)]
+    for thread in followers:
+        thread.start()
+    for thread in [leader] + followers:
+        thread.join(timeout=10)
+    return outcomes
+
+
+def blocking_compute(flights, result=None, error=None, during=None):
+    """A compute function that returns (or raises) only once every follower is waiting on its flight."""
+    calls = []
+
+    def compute():
+        calls.append(1)
+        for _ in range(FOLLOWERS):
+            assert flights[0].done.waiting.acquire(timeout=10)
+        if during is not None:
+            during()
+        if error is not None:
+            raise error
+        return result
+
+    return compute, calls
+
+
+def test_concurrent_misses_share_one_computation(flights):
+    compute, calls = blocking_compute(flights, result=({"value": 1}, 200))
+    outcomes = run_with_followers(flights, ("test", "coalesce"), compute)
+    assert outcomes == [({"value": 1}, 200)] * (FOLLOWERS + 1)
+    assert len(calls) == 1
+    assert app.cached_analytics(("test", "coalesce"), compute) == ({"value": 1}, 200)
+    assert len(calls) == 1
+
+
+def test_an_error_is_raised_in_every_waiting_request_and_not_cached(flights):
+    error = RuntimeError("Supabase is down")
+    compute, calls = blocking_compute(flights, error=error)
+    outcomes = run_with_followers(flights, ("test", "error"), compute)
+    assert outcomes == [error] * (FOLLOWERS + 1)
+    assert len(calls) == 1
+    assert ("test", "error") not in app._analytics_cache
+
+
+def test_failed_statuses_are_shared_but_not_cached(flights):
+    compute, _ = blocking_compute(flights, result=({"error": "No data"}, 404))
+    outcomes = run_with_followers(flights, ("test", "404"), compute)
+    assert outcomes == [({"error": "No data"}, 404)] * (FOLLOWERS + 1)
+    assert ("test", "404") not in app._analytics_cache
+
+
+def test_a_result_computed_across_an_invalidation_is_not_cached(flights):
+    compute, _ = blocking_compute(flights, result=({"value": "old"}, 200),
+                                  during=app.invalidate_analytics_cache)
+    outcomes = run_with_followers(flights, ("test", "stale"), compute)
+    # Requests already waiting get the result they asked for, but it is not kept
+    assert outcomes == [({"value": "old"}, 200)] * (FOLLOWERS + 1)
+    assert ("test", "stale") not in app._analytics_cache
+
+    assert app.cached_analytics(("test", "stale"), lambda: ({"value": "new"}, 200)) == ({"value": "new"}, 200)
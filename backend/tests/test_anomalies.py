@@ -0,0 +1,57 @@
+# test_anomalies.py
+"""detect_anomalies on daily series with a weekly pattern and injected spikes and drops."""
+import numpy as np
+import pandas as pd
+
+import app
+
+DAYS = pd.date_range("2024-01-01", periods=140, freq="D")
+KEYS = [("sales", "revenue"), ("tiktok", "engagement"), ("facebook", "reach")]
+SPIKE_DAY, DROP_DAY = 100, 110
+
+
+def weekly_series(rng, level):
+    """Weekends run 40% above weekdays, plus a little noise."""
+    weekend = np.isin(DAYS.dayofweek, [5, 6])
+    return level * np.where(weekend, 1.4, 1.0) * (1 + rng.normal(0, 0.02, len(DAYS)))
+
+
+def make_values():
+    rng = np.random.default_rng(3)
+    values = np.vstack([weekly_series(rng, level) for level in (1000.0, 500.0, 20000.0)])
+    values[0, SPIKE_DAY] *= 4
+    values[1, DROP_DAY] *= 0.2
+    return values
+
+
+def flagged(anomalies, platform, metric):
+    return {anomaly["date"]: anomaly for anomaly in anomalies if (anomaly["platform"], anomaly["metric"]) == (platform, metric)}
+
+
+def test_injected_spike_and_drop_are_flagged_with_their_direction():
+    anomalies = app.detect_anomalies(KEYS, DAYS, make_values())
+
+    spike_date, drop_date = DAYS[SPIKE_DAY].strftime("%Y-%m-%d"), DAYS[DROP_DAY].strftime("%Y-%m-%d")
+    spike = flagged(anomalies, "sales", "revenue")[spike_date]
+    drop = flagged(anomalies, "tiktok", "engagement")[drop_date]
+    assert spike["direction"] == "spike" and drop["direction"] == "drop"
+    assert spike["value"] > spike["expected"] and drop["value"] < drop["expected"]
+    assert set(spike["methods"]) <= {"rolling_zscore", "seasonal_residual"} and spike["methods"]
+
+
+def test_ordinary_days_are_rarely_flagged():
+    # Many plain weekly series with no injected anomalies: weekends should not stand out as unusual
+    rng = np.random.default_rng(5)
+    values = np.vstack([weekly_series(rng, 1000.0) for _ in range(60)])
+    keys = [("sales", f"series_{i}") for i in range(len(values))]
+    anomalies = app.detect_anomalies(keys, DAYS, values)
+
+    weekend_dates = set(DAYS[np.isin(DAYS.dayofweek, [5, 6])].strftime("%Y-%m-%d"))
+    weekend_flags = sum(anomaly["date"] in weekend_dates for anomaly in anomalies)
+    assert len(anomalies) / values.size < 0.03
+    assert weekend_flags / (len(values) * len(weekend_dates)) < 0.03
+
+
+def test_results_are_sorted_oldest_first():
+    anomalies = app.detect_anomalies(KEYS, DAYS, make_values())
+    assert [anomaly["date"] for anomaly in anomalies] == sorted(anomaly["date"] for anomaly in anomalies)
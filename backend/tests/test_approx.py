@@ -0,0 +1,63 @@
+# test_approx.py
+"""Stratified day sampling and the per-bucket estimates of the approximate performance endpoint."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+
+COLUMNS = ["engagement", "reach", "revenue"]
+
+
+def full_daily(first, last, seed=0):
+    """Every day in [first, last] with noisy engagement, reach and revenue."""
+    days = pd.date_range(first, last, freq="D")
+    rng = np.random.default_rng(seed)
+    reach = rng.uniform(1000, 5000, len(days))
+    return pd.DataFrame({"engagement": reach * rng.uniform(0.02, 0.08, len(days)), "reach": reach,
+                         "revenue": rng.uniform(100, 900, len(days))}, index=days)
+
+
+def estimate(daily, first, last, freq, sample_size):
+    sampled, sizes, samples = app.sample_days(first, last, freq, sample_size)
+    return app.estimate_bucket_totals(daily.loc[sampled], freq, sizes, samples), sizes, samples
+
+
+@pytest.mark.parametrize("freq", ["D", "W", "MS"])
+def test_sample_days_allocation(freq):
+    sampled, sizes, samples = app.sample_days(pd.Timestamp("2024-01-10"), pd.Timestamp("2024-06-20"), freq, 40)
+    assert sum(sizes.values()) == 163
+    assert sizes.keys() == samples.keys()
+    assert all(min(app.APPROX_MIN_DAYS_PER_STRATUM, sizes[bucket]) <= taken <= sizes[bucket] for bucket, taken in samples.items())
+    assert len(sampled) == sum(samples.values()) and sampled.is_unique and sampled.is_monotonic_increasing
+    counted = pd.Series(1, index=app.approx_bucket_labels(sampled, freq)).groupby(level=0).sum()
+    assert counted.to_dict() == samples
+
+
+@pytest.mark.parametrize("freq", ["W", "MS"])
+def test_fully_sampled_buckets_have_exact_totals_and_no_margin(freq):
+    first, last = pd.Timestamp("2024-01-01"), pd.Timestamp("2024-03-31")
+    daily = full_daily(first, last)
+    estimates, sizes, samples = estimate(daily, first, last, freq, sample_size=1000)
+    assert samples == sizes
+
+    exact = daily.groupby(app.approx_bucket_labels(daily.index, freq)).sum()
+    for column in COLUMNS:
+        assert estimates[column].to_numpy() == pytest.approx(exact[column].to_numpy())
+        assert (estimates[f"{column}_margin"] == 0).all()
+    assert (estimates["rate_margin"] == 0).all()
+
+
+def test_only_partly_sampled_buckets_have_a_margin():
+    # The range starts on the 30th, so January is a two-day bucket that the minimum allocation covers fully
+    first, last = pd.Timestamp("2024-01-30"), pd.Timestamp("2024-05-31")
+    daily = full_daily(first, last, seed=1)
+    estimates, sizes, samples = estimate(daily, first, last, "MS", sample_size=20)
+
+    january = pd.Timestamp("2024-01-01")
+    assert samples[january] == sizes[january] == 2
+    partial = [bucket for bucket in sizes if samples[bucket] < sizes[bucket]]
+    assert partial
+    for column in COLUMNS + ["rate"]:
+        assert estimates.loc[january, f"{column}_margin"] == 0
+        assert (estimates.loc[partial, f"{column}_margin"] > 0).all()
@@ -0,0 +1,29 @@
+# test_dashboard_bundle.py
+"""The /api/dashboard bundle when one of its sections fails."""
+import pytest
+
+import app
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app, "TEST_AUTH_ENABLED", True)
+    app.invalidate_analytics_cache()
+    yield app.app.test_client()
+    app.invalidate_analytics_cache()
+
+
+def test_a_failing_section_is_reported_in_a_200_response(client, monkeypatch):
+    def broken(sources):
+        raise RuntimeError("top products unavailable")
+
+    monkeypatch.setattr(app, "compute_dashboard_summary", lambda sources, platform: ({"total_sales": 1.5}, 200))
+    monkeypatch.setattr(app, "compute_dashboard_top_products", broken)
+
+    response = client.get("/api/dashboard?sections=summary,top_products&start_date=2024-01-01",
+                          headers={"Authorization": "Bearer test:someone"})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["summary"] == {"total_sales": 1.5}
+    assert body["top_products"] is None
+    assert body["errors"] == {"top_products": "top products unavailable"}
@@ -0,0 +1,51 @@
+# test_forecast_budget.py
+"""perform_forecast's time budget also bounds the auto_arima order search, not just which models are tried."""
+import time
+
+import numpy as np
+import pandas as pd
+import pmdarima
+import pytest
+from pmdarima.arima._context import ContextStore, ContextType
+
+import app
+
+
+@pytest.fixture
+def search_limits(monkeypatch):
+    """Replaces auto_arima with a stub recording the stepwise max_dur it would have run under."""
+    limits = []
+
+    def auto_arima(series, **kwargs):
+        limits.append(ContextStore.get_or_empty(ContextType.STEPWISE).max_dur)
+        raise ValueError("stub")
+
+    monkeypatch.setattr(pmdarima, "auto_arima", auto_arima)
+    return limits
+
+
+def monthly_series(months=48):
+    index = pd.date_range("2020-01-01", periods=months, freq="MS")
+    return pd.Series(1000 + 10 * np.arange(months) + 100 * np.sin(np.arange(months) * np.pi / 6), index=index)
+
+
+def test_order_search_gets_the_remaining_budget(search_limits):
+    with app.forecast_deadline(time.perf_counter() + 7):
+        with pytest.raises(ValueError):
+            app._fit_auto_arima(monthly_series())
+    assert 6 < search_limits[0] <= 7
+
+    # A spent budget still leaves the minimum search time; no deadline means no limit (the backtest)
+    with app.forecast_deadline(time.perf_counter() - 1):
+        with pytest.raises(ValueError):
+            app._fit_auto_arima(monthly_series())
+    with pytest.raises(ValueError):
+        app._fit_auto_arima(monthly_series())
+    assert search_limits[1:] == [app.AUTO_ARIMA_MIN_SEARCH_SECONDS, None]
+
+
+def test_perform_forecast_passes_its_deadline_to_the_search(search_limits):
+    forecast_results, _, selection = app.perform_forecast(monthly_series(), 6, time_budget=30, models=["auto_arima"])
+    assert len(search_limits) == 1 and 0 < search_limits[0] <= 30
+    # The stubbed search failed, so the linear trend fallback answered
+    assert selection["model"] == "linear_trend" and len(forecast_results) == 6
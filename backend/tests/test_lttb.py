@@ -0,0 +1,58 @@
+# test_lttb.py
+"""lttb_indices and the chart downsampling built on it."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+
+
+def noisy_series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.arange(n, dtype=float), np.sin(np.arange(n) / 15.0) * 100 + rng.normal(0, 5, n)
+
+
+@pytest.mark.parametrize("n, n_out", [(10, 3), (100, 7), (1000, 50), (1001, 999), (365, 52)])
+def test_keeps_both_endpoints_and_exactly_n_out_points(n, n_out):
+    x, y = noisy_series(n)
+    selected = app.lttb_indices(x, y, n_out)
+    assert len(selected) == n_out
+    assert selected[0] == 0 and selected[-1] == n - 1
+    # Sorted and unique, so they can index the frame directly
+    assert np.all(np.diff(selected) > 0)
+
+
+@pytest.mark.parametrize("n_out", [100, 101, 500, 2, 1, 0])
+def test_returns_every_point_when_nothing_to_drop_or_budget_too_small(n_out):
+    x, y = noisy_series(100)
+    assert app.lttb_indices(x, y, n_out).tolist() == list(range(100))
+
+
+def test_keeps_an_isolated_peak():
+    x, y = noisy_series(1000)
+    y[437] = 10000.0
+    assert 437 in app.lttb_indices(x, y, 30)
+
+
+def test_downsample_chart_frame_respects_the_budget_per_column():
+    x, y = noisy_series(600)
+    frame = pd.DataFrame({"date": x, "engagement": y, "reach": y[::-1].copy()})
+
+    kept = app.downsample_chart_frame(frame, x, ["engagement", "reach"], 100)
+    assert len(kept) <= 100
+    assert kept.index[0] == 0 and kept.index[-1] == 599
+    assert kept.index.is_monotonic_increasing
+
+    assert app.downsample_chart_frame(frame, x, ["engagement"], None) is frame
+    assert app.downsample_chart_frame(frame, x, ["engagement"], 600) is frame
+
+
+@pytest.mark.parametrize("max_points", [3, 4, 5])
+def test_downsample_chart_frame_stays_within_a_budget_smaller_than_the_column_minimum(max_points):
+    x, y = noisy_series(600)
+    frame = pd.DataFrame({"date": x, "engagement": y, "reach": y[::-1].copy()})
+
+    kept = app.downsample_chart_frame(frame, x, ["engagement", "reach"], max_points)
+    assert len(kept) == max_points
+    assert kept.index[0] == 0 and kept.index[-1] == 599
+    assert kept.index.is_monotonic_increasing
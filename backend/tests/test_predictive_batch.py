@@ -0,0 +1,116 @@
+# test_predictive_batch.py
+"""compute_predictive_batch: shared table pulls, per-metric caching and uploads that land mid-computation."""
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import app
+from synthetic_data import generate_synthetic_data
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    data = generate_synthetic_data(3000, days=3 * 365, seed=2)
+    frames = {"sales": data["sales_records"], "tiktokdata": data["tiktok_records"], "facebookdata": data["facebook_records"]}
+    pulls = []
+
+    def fetch_frame(table_name, columns, **kwargs):
+        pulls.append(table_name)
+        return app.records_to_frame(frames[table_name])
+
+    monkeypatch.setattr(app, "fetch_frame", fetch_frame)
+    app._clear_local_analytics_cache()
+    yield pulls
+    app._clear_local_analytics_cache()
+
+
+def cached(metric_type, forecast_periods=12):
+    return app._analytics_cache.get(("predictive-analytics", metric_type, forecast_periods, None))
+
+
+def test_batch_pulls_each_table_once_and_caches_every_metric(tables):
+    payload, status_code = app.compute_predictive_batch(["sales", "engagement", "reach"], 12)
+
+    assert status_code == 200
+    assert list(payload["forecasts"]) == ["sales", "engagement", "reach"]
+    assert sorted(tables) == ["facebookdata", "sales", "tiktokdata"]
+    for metric_type in ("sales", "engagement", "reach"):
+        assert cached(metric_type) == payload["forecasts"][metric_type]
+        assert app._analytics_cache.get(app.forecast_model_key(metric_type, 12, None)) is not None
+
+
+def test_upload_during_the_fits_keeps_the_old_results_out_of_the_cache(tables, monkeypatch):
+    forecast_many = app.forecast_many
+
+    def forecast_many_with_upload(*args, **kwargs):
+        app.invalidate_analytics_cache() # An upload finishing while the models fit
+        return forecast_many(*args, **kwargs)
+
+    monkeypatch.setattr(app, "forecast_many", forecast_many_with_upload)
+    payload, status_code = app.compute_predictive_batch(["sales", "reach"], 12)
+
+    assert status_code == 200 and set(payload["forecasts"]) == {"sales", "reach"}
+    assert cached("sales") is None and cached("reach") is None
+    assert app._analytics_cache.get(app.forecast_model_key("sales", 12, None)) is None
+
+
+def worker_side_effects():
+    """Runs in a forecast pool worker: what importing app started there."""
+    import firebase_admin
+    import app as worker_app
+    return worker_app.IS_MAIN_PROCESS, worker_app.background_sampler, len(firebase_admin._apps)
+
+
+@pytest.fixture
+def forecast_pool(monkeypatch):
+    monkeypatch.setattr(app, "FORECAST_POOL_WORKERS", 2)
+    app.reset_forecast_pool()
+    yield app.get_forecast_pool()
+    app.reset_forecast_pool()
+
+
+def test_pool_workers_fit_like_the_server_and_start_nothing(forecast_pool):
+    data = generate_synthetic_data(3000, days=3 * 365, seed=2)
+    series = {metric_type: app.prepare_monthly_forecast_series(app.build_metric_series(
+                  metric_type, sales_records=data["sales_records"], tiktok_records=data["tiktok_records"],
+                  facebook_records=data["facebook_records"]))
+              for metric_type in ("sales", "reach")}
+
+    pooled = app.forecast_many(series, 6, time_budget=5)
+    for metric_type, monthly in series.items():
+        forecast_results, selection = pooled[metric_type]
+        in_process = app._forecast_worker(monthly, 6, time_budget=5)[0]
+        assert len(forecast_results) == 6
+        if selection["model"] == "auto_arima":
+            continue # Its stepwise search may stop at a different order under a different clock
+        assert forecast_results == in_process
+
+    assert forecast_pool.submit(worker_side_effects).result(timeout=120) == (False, None, 0)
+
+
+class BrokenPool:
+    """A forecast pool whose workers have died: every submitted fit fails with BrokenProcessPool."""
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_exception(BrokenProcessPool("A child process terminated abruptly"))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def test_a_broken_pool_falls_back_to_fitting_in_process(monkeypatch):
+    data = generate_synthetic_data(3000, days=3 * 365, seed=2)
+    series = {metric_type: app.prepare_monthly_forecast_series(app.build_metric_series(
+                  metric_type, sales_records=data["sales_records"], tiktok_records=data["tiktok_records"],
+                  facebook_records=data["facebook_records"]))
+              for metric_type in ("engagement", "reach")}
+    monkeypatch.setattr(app, "FORECAST_POOL_WORKERS", 2)
+    monkeypatch.setattr(app, "_forecast_pool", BrokenPool())
+
+    fitted = app.forecast_many(series, 6, time_budget=5)
+    assert set(fitted) == {"engagement", "reach"}
+    assert all(len(forecast_results) == 6 for forecast_results, _ in fitted.values())
+    # The broken pool was discarded, so the next batch starts a fresh one
+    assert app._forecast_pool is None
@@ -0,0 +1,95 @@
+# test_row_hashes.py
+"""Row hash canonicalization and the count-based skipping of already stored upload rows."""
+from collections import Counter
+
+import pytest
+
+import app
+
+
+class FakeIndex:
+    """Stands in for RowHashIndex: stored hash counts per date, recording which dates were asked for."""
+    def __init__(self, stored):
+        self.stored = stored
+        self.requests = []
+
+    def stored_counts(self, table, dates):
+        self.requests.append(sorted(dates))
+        return {date: Counter(self.stored.get(date, {})) for date in dates}
+
+
+def stored_hashes(table, records):
+    counts = {}
+    for record in records:
+        counts.setdefault(record["date"], Counter())[app.row_content_hash(table, record)] += 1
+    return counts
+
+
+@pytest.mark.parametrize("upload, stored", [
+    (12.0, 12),
+    (12, "12"),
+    (0.1 + 0.2, 0.3),
+    (" P1 ", "P1"),
+    (None, float("nan")),
+    (None, ""),
+])
+def test_canonical_hash_value_spells_upload_and_stored_values_alike(upload, stored):
+    assert app._canonical_hash_value(upload) == app._canonical_hash_value(stored)
+
+
+def test_canonical_hash_value_keeps_distinct_values_apart():
+    assert app._canonical_hash_value(12.5) != app._canonical_hash_value(12)
+    assert app._canonical_hash_value(0) != app._canonical_hash_value(None)
+    assert app._canonical_hash_value("P1") != app._canonical_hash_value("P10")
+
+
+def test_row_content_hash_ignores_generated_ids_and_time_of_day():
+    upload = {"date": "2024-05-01", "sale_id": "a", "product_id": "P1", "quantity_sold": 2.0, "price": 5.0, "revenue": 10.0}
+    stored = {"date": "2024-05-01T00:00:00", "sale_id": "b", "product_id": "P1", "quantity_sold": 2, "price": 5, "revenue": 10}
+    assert app.row_content_hash("sales", upload) == app.row_content_hash("sales", stored)
+    assert app.row_content_hash("sales", upload) != app.row_content_hash("sales", {**stored, "revenue": 11})
+
+
+def test_keep_mask_skips_stored_rows_and_keeps_new_or_changed_ones():
+    stored = [{"date": "2024-05-01", "views": 100, "likes": 10, "comments": 1, "shares": 1},
+              {"date": "2024-05-03", "views": 300, "likes": 30, "comments": 3, "shares": 3}]
+    index = FakeIndex(stored_hashes("tiktokdata", stored))
+    upload = [
+        {"date": "2024-05-01", "views": 100.0, "likes": 10.0, "comments": 1.0, "shares": 1.0}, # unchanged
+        {"date": "2024-05-02", "views": 200.0, "likes": 20.0, "comments": 2.0, "shares": 2.0}, # new day
+        {"date": "2024-05-03", "views": 301.0, "likes": 30.0, "comments": 3.0, "shares": 3.0}, # changed
+    ]
+    assert app.RowChangeFilter(index).keep_mask("tiktokdata", upload) == [False, True, True]
+
+
+def test_keep_mask_matches_by_count():
+    sale = {"date": "2024-05-01", "product_id": "P1", "quantity_sold": 1, "price": 5, "revenue": 5}
+    other = {**sale, "product_id": "P2"}
+    index = FakeIndex(stored_hashes("sales", [sale, sale, other]))
+    # Two identical sales in the file, both already stored: both are skipped
+    assert app.RowChangeFilter(index).keep_mask("sales", [dict(sale), dict(other), dict(sale)]) == [False, False, False]
+
+
+def test_keep_mask_writes_every_row_of_a_changed_key():
+    sale = {"date": "2024-05-01", "product_id": "P1", "quantity_sold": 1, "price": 5, "revenue": 5}
+    other = {**sale, "product_id": "P2"}
+    index = FakeIndex(stored_hashes("sales", [sale, other]))
+    # A second P1 sale is new: P1's rows replace the stored ones, so the unchanged P1 row is written too
+    upload = [dict(sale), dict(other), {**sale, "quantity_sold": 2, "revenue": 10}]
+    assert app.RowChangeFilter(index).keep_mask("sales", upload) == [True, False, True]
+
+
+def test_keep_mask_reads_each_date_once_per_upload():
+    sale = {"date": "2024-05-01", "product_id": "P1", "quantity_sold": 1, "price": 5, "revenue": 5}
+    index = FakeIndex({})
+    change_filter = app.RowChangeFilter(index)
+    assert change_filter.keep_mask("sales", [dict(sale)]) == [True]
+    # Rows the upload wrote itself in an earlier batch never make its later identical rows look stored
+    assert change_filter.keep_mask("sales", [dict(sale)]) == [True]
+    assert index.requests == [["2024-05-01"]]
+
+
+def test_keep_mask_keeps_every_row_of_tables_without_hashes():
+    index = FakeIndex({})
+    assert app.RowChangeFilter(index).keep_mask("products", [{"product_id": "P1"}] * 2) == [True, True]
+    assert index.requests == []
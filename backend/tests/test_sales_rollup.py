@@ -0,0 +1,76 @@
+# test_sales_rollup.py
+"""SalesRollup.top_products must agree with aggregate_top_products, the pandas pipeline it replaced."""
+import pytest
+
+import app
+from synthetic_data import generate_synthetic_data
+
+
+@pytest.fixture(scope="module")
+def data():
+    return generate_synthetic_data(5000, days=120, seed=1)
+
+
+def build_rollup(sales_records, products_records):
+    return app.SalesRollup().load(app.records_to_frame(sales_records), products_records)
+
+
+def assert_same_ranking(actual, expected):
+    """Same products in the same order; the rollup rounds sales to cents, the old pipeline did not."""
+    assert [row["product_name"] for row in actual] == [row["product_name"] for row in expected]
+    assert [row["sales"] for row in actual] == pytest.approx([row["sales"] for row in expected], abs=0.005)
+
+
+def in_range(records, start_date, end_date):
+    return [record for record in records if start_date <= record["date"] <= end_date]
+
+
+@pytest.mark.parametrize("limit", [1, 5, 1000])
+def test_top_products_matches_aggregate_top_products(data, limit):
+    rollup = build_rollup(data["sales_records"], data["products_records"])
+    expected = app.aggregate_top_products(data["sales_records"], data["products_records"], limit=limit)
+    assert_same_ranking(rollup.top_products(limit=limit), expected)
+
+
+def test_top_products_matches_on_a_date_range(data):
+    rollup = build_rollup(data["sales_records"], data["products_records"])
+    dates = sorted({record["date"] for record in data["sales_records"]})
+    start_date, end_date = dates[30], dates[59]
+    expected = app.aggregate_top_products(in_range(data["sales_records"], start_date, end_date),
+                                          data["products_records"], limit=5)
+    assert_same_ranking(rollup.top_products(limit=5, start_date=start_date, end_date=end_date), expected)
+
+
+def test_products_without_a_name_are_left_out_like_the_inner_join(data):
+    named_products = data["products_records"][::2]
+    rollup = build_rollup(data["sales_records"], named_products)
+    expected = app.aggregate_top_products(data["sales_records"], named_products, limit=10)
+    assert_same_ranking(rollup.top_products(limit=10), expected)
+
+
+def test_recorded_inserts_are_included(data):
+    rollup = build_rollup(data["sales_records"], data["products_records"])
+    new_sale = {"date": data["sales_records"][-1]["date"], "product_id": "NEW", "revenue": 1e9}
+    rollup.record_inserted("sales", [new_sale])
+    # Not a known product yet, so it stays out until its products row arrives
+    assert rollup.top_products(limit=1) != [{"product_name": "Brand new", "sales": 1e9}]
+    rollup.record_inserted("products", [{"product_id": "NEW", "product_name": "Brand new"}])
+    assert rollup.top_products(limit=1) == [{"product_name": "Brand new", "sales": 1e9}]
+
+    products = data["products_records"] + [{"product_id": "NEW", "product_name": "Brand new"}]
+    expected = app.aggregate_top_products(data["sales_records"] + [new_sale], products, limit=5)
+    assert_same_ranking(rollup.top_products(limit=5), expected)
+
+
+def test_sales_without_a_usable_date_are_left_out(data):
+    undated = [dict(data["sales_records"][0], date=None, revenue=1e9),
+               dict(data["sales_records"][1], date="not a date", revenue=1e9)]
+    rollup = build_rollup(data["sales_records"] + undated, data["products_records"])
+    expected = app.aggregate_top_products(data["sales_records"], data["products_records"], limit=5)
+    assert_same_ranking(rollup.top_products(limit=5), expected)
+
+    product_ids, _, first_month, matrix = rollup.monthly_revenue()
+    dates = sorted(record["date"] for record in data["sales_records"])
+    assert first_month == (int(dates[0][:4]) - 1970) * 12 + int(dates[0][5:7]) - 1
+    assert matrix.shape == (len(product_ids), len({date[:7] for date in dates}))
+    assert matrix.sum() == pytest.approx(sum(record["revenue"] for record in data["sales_records"]))
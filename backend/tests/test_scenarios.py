@@ -0,0 +1,63 @@
+# test_scenarios.py
+"""Monte Carlo scenarios: simulated paths, their cache, and the percentile and probability summary."""
+import numpy as np
+import pytest
+
+import app
+
+MEAN = [1000.0 + 10 * month for month in range(24)]
+SIGMA = [20.0 * np.sqrt(month + 1) for month in range(24)]
+
+
+@pytest.fixture
+def forecast_model():
+    return {"metric_type": "sales", "model": "ets", "last_historical_date": "2024-06-01",
+            "history": [950.0 + 5 * month for month in range(24)], "mean": MEAN, "sigma": SIGMA}
+
+
+def test_paths_are_deterministic_and_spread_like_the_model_says():
+    paths = app.simulate_forecast_paths(MEAN, SIGMA, 20000)
+    assert paths.shape == (20000, 24)
+    assert np.array_equal(paths, app.simulate_forecast_paths(MEAN, SIGMA, 20000))
+    assert paths.mean(axis=0) == pytest.approx(MEAN, rel=0.01)
+    assert paths.std(axis=0) == pytest.approx(SIGMA, rel=0.05)
+
+
+def test_paths_never_go_negative():
+    assert app.simulate_forecast_paths([1.0] * 6, [50.0] * 6, 1000).min() == 0.0
+
+
+def test_paths_are_drawn_once_per_model_and_data_generation(forecast_model):
+    app.invalidate_analytics_cache()
+    key = app.forecast_model_key("sales", 24, None)
+    paths = app.get_simulated_paths(key, forecast_model, 500)
+    assert app.get_simulated_paths(key, forecast_model, 500) is paths
+    assert not paths.flags.writeable
+
+    app.invalidate_analytics_cache()
+    redrawn = app.get_simulated_paths(key, forecast_model, 500)
+    assert redrawn is not paths and np.array_equal(redrawn, paths)
+
+
+def test_summary_bands_are_ordered_and_probabilities_consistent(forecast_model):
+    paths = app.simulate_forecast_paths(MEAN, SIGMA, 5000)
+    summary = app.summarize_scenarios(forecast_model, paths, "Sales", [5, 25, 50, 75, 95], [-10, -5, 5, 10], 12)
+
+    assert [row["date"] for row in summary["bands"][:2]] == ["2024-07-01", "2024-08-01"]
+    for row in summary["bands"]:
+        assert row["p5"] <= row["p25"] <= row["p50"] <= row["p75"] <= row["p95"]
+    assert summary["baseline_total"] == pytest.approx(sum(forecast_model["history"][-12:]))
+
+    probabilities = {entry["threshold_pct"]: entry["probability"] for entry in summary["probabilities"]}
+    assert all(0 <= probability <= 1 for probability in probabilities.values())
+    # A bigger move is never more likely than a smaller one in the same direction
+    assert probabilities[-10] <= probabilities[-5] and probabilities[10] <= probabilities[5]
+    assert probabilities[-5] + probabilities[5] <= 1
+
+
+def test_a_shock_scales_every_simulated_value(forecast_model):
+    paths = app.simulate_forecast_paths(MEAN, SIGMA, 2000)
+    plain = app.summarize_scenarios(forecast_model, paths, "Sales", [50], [-10], 12)
+    shocked = app.summarize_scenarios(forecast_model, paths, "Sales", [50], [-10], 12, shock_pct=-20)
+    assert shocked["simulated_total"]["p50"] == pytest.approx(plain["simulated_total"]["p50"] * 0.8, rel=1e-6)
+    assert shocked["probabilities"][0]["probability"] >= plain["probabilities"][0]["probability"]
@@ -0,0 +1,125 @@
+# test_shared_cache.py
+"""SharedCache: atomic writes, generations, expiry and LRU eviction by size."""
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import app
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return app.SharedCache(str(tmp_path / "cache"), max_bytes=10 ** 9)
+
+
+def age(cache, key, extension, seconds):
+    """Back-dates an entry's write time (mtime), as if it had been written `seconds` ago."""
+    path = cache._path(key, extension)
+    written = time.time() - seconds
+    os.utime(path, (written, written))
+
+
+def test_entries_older_than_max_age_are_misses(cache):
+    cache.put_result(("result",), {"value": 1})
+    cache.put_frame(("frame",), pd.DataFrame({"x": [1, 2, 3]}))
+    assert cache.get_result(("result",), max_age=60) == {"value": 1}
+    assert cache.get_frame(("frame",), max_age=60)["x"].tolist() == [1, 2, 3]
+
+    age(cache, ("result",), "json", 120)
+    age(cache, ("frame",), "arrow", 120)
+    assert cache.get_result(("result",), max_age=60) is None
+    assert cache.get_frame(("frame",), max_age=60) is None
+    # Callers that accept any age still see them
+    assert cache.get_result(("result",)) == {"value": 1}
+
+
+def test_reads_do_not_extend_an_entrys_life(cache):
+    cache.put_result(("result",), {"value": 1})
+    age(cache, ("result",), "json", 50)
+    assert cache.get_result(("result",), max_age=60) is not None
+    # The read marked the entry used (atime) but kept its write time
+    assert time.time() - os.stat(cache._path(("result",), "json")).st_mtime >= 50
+
+
+def test_shared_table_frame_refetches_an_expired_table(monkeypatch, cache):
+    monkeypatch.setattr(app, "shared_cache", cache)
+    fetched = []
+
+    def fetch(table_name, columns, order=None, wire_format="json", raise_errors=False):
+        fetched.append(table_name)
+        return pd.DataFrame({"date": pd.to_datetime(["2024-01-01"]), "revenue": [float(len(fetched))]})
+
+    monkeypatch.setattr(app, "_fetch_frame_uncached", fetch)
+    columns = {"date": "datetime64[ns]", "revenue": "float64"}
+    assert app.shared_table_frame("sales", columns)["revenue"].tolist() == [1.0]
+    assert app.shared_table_frame("sales", columns)["revenue"].tolist() == [1.0]
+    age(cache, ("frame", "sales", tuple(columns.items())), "arrow", app.SHARED_TABLE_TTL_SECONDS + 1)
+    assert app.shared_table_frame("sales", columns)["revenue"].tolist() == [2.0]
+    assert fetched == ["sales", "sales"]
+
+
+@pytest.mark.parametrize("max_rows, cached_whole", [(10, True), (3, False)])
+def test_fetch_frame_caches_whole_tables_only_up_to_the_row_cap(fake_supabase, monkeypatch, cache, max_rows, cached_whole):
+    fake_supabase.tables["tiktokdata"] = pd.DataFrame({
+        "date": [f"2024-01-0{day}" for day in range(1, 6)], "views": [10, 20, 30, 40, 50]})
+    monkeypatch.setattr(app, "shared_cache", cache)
+    monkeypatch.setattr(app, "SHARED_TABLE_MAX_ROWS", max_rows)
+    columns = {"date": "datetime64[ns]", "views": "int64"}
+
+    frame = app.fetch_frame("tiktokdata", columns, order="date.asc", start_date="2024-01-02", end_date="2024-01-03")
+    assert frame["views"].tolist() == [20, 30]
+    assert app.shared_table_rows("tiktokdata") == 5
+    assert (cache.get_frame(("frame", "tiktokdata", tuple(columns.items()))) is not None) == cached_whole
+
+
+def test_writes_leave_no_temporary_files(cache):
+    cache.put_result(("result",), {"value": 1})
+    cache.put_frame(("frame",), pd.DataFrame({"x": [1.5, 2.5]}))
+    names = sorted(os.listdir(cache.directory))
+    assert not [name for name in names if name.endswith(".tmp")]
+    assert names == sorted(["GENERATION", os.path.basename(cache._path(("result",), "json")),
+                            os.path.basename(cache._path(("frame",), "arrow"))])
+
+
+def test_invalidate_hides_and_then_removes_earlier_generations(cache):
+    cache.put_result(("result",), {"value": 1})
+    old_path = cache._path(("result",), "json")
+    old_generation = cache.generation()
+
+    assert cache.invalidate() != old_generation
+    assert cache.get_result(("result",)) is None
+    cache.put_result(("other",), {"value": 2})
+    assert not os.path.exists(old_path)
+    assert cache.get_result(("other",)) == {"value": 2}
+
+
+def test_eviction_drops_least_recently_used_entries_beyond_max_bytes(cache):
+    payload = {"data": "x" * 1000}
+    for name in ("a", "b", "c"):
+        cache.put_result((name,), payload)
+    entry_size = os.stat(cache._path(("a",), "json")).st_size
+    cache.max_bytes = 3 * entry_size
+    # Mark a used after b and c were written, so b is now the least recently used
+    for offset, name in ((30, "b"), (20, "c"), (10, "a")):
+        used = time.time() - offset
+        path = cache._path((name,), "json")
+        os.utime(path, (used, os.stat(path).st_mtime))
+
+    cache.put_result(("d",), payload)
+    assert cache.get_result(("b",)) is None
+    assert [cache.get_result((name,)) == payload for name in ("a", "c", "d")] == [True, True, True]
+
+
+def test_another_workers_invalidation_clears_the_local_result_cache(monkeypatch, cache):
+    monkeypatch.setattr(app, "shared_cache", cache)
+    monkeypatch.setattr(app, "_shared_generation_seen", None)
+    app.sync_shared_cache_generation()
+    app._analytics_cache[("test", "key")] = ({"value": 1}, 200)
+
+    app.sync_shared_cache_generation()
+    assert ("test", "key") in app._analytics_cache
+    cache.invalidate() # As another worker does after an upload
+    app.sync_shared_cache_generation()
+    assert ("test", "key") not in app._analytics_cache
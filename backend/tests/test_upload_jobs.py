@@ -0,0 +1,98 @@
+# test_upload_jobs.py
+"""Background upload jobs: status reporting, and resuming a job interrupted part-way without re-sending rows."""
+import functools
+import io
+import os
+
+import pandas as pd
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import app
+from conftest import table_rows
+
+DAYS = 8
+
+
+class Crash(BaseException):
+    """Stands in for the worker process dying: not caught by run_upload_job like an ordinary error."""
+
+
+def tiktok_csv():
+    lines = ["Date,Views,Likes,Comments,Shares"]
+    lines += [f"2024-03-{day:02d},{day * 100},{day},1,0" for day in range(1, DAYS + 1)]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+@pytest.fixture
+def jobs(fake_supabase, monkeypatch, tmp_path):
+    fake_supabase.tables["tiktokdata"] = pd.DataFrame(columns=["date", "views", "likes", "comments", "shares"])
+    monkeypatch.setattr(app, "UPLOAD_JOB_DIR", str(tmp_path / "jobs"))
+    monkeypatch.setattr(app, "BatchedTableWriter", functools.partial(app.BatchedTableWriter, batch_rows=3))
+    posted = []
+    post_records = app._post_records
+
+    def record_posts(tbl_name, records, upsert=False):
+        posted.append([record["date"] for record in records])
+        return post_records(tbl_name, records, upsert)
+
+    monkeypatch.setattr(app, "_post_records", record_posts)
+    yield fake_supabase, posted
+
+
+def create_job():
+    upload = FileStorage(stream=io.BytesIO(tiktok_csv()), filename="tiktok_march.csv")
+    return app.create_upload_job([upload], None, "user-1")["id"]
+
+
+def test_a_job_reports_its_progress_and_cleans_up_its_files(jobs):
+    store, posted = jobs
+    job_id = create_job()
+    assert app.describe_upload_job(app.load_upload_job(job_id))["status"] == "queued"
+
+    app.run_upload_job(job_id)
+    status = app.describe_upload_job(app.load_upload_job(job_id))
+    assert status["status"] == "completed"
+    assert status["attempts"] == 1
+    assert status["files"] == ["tiktok_march.csv"]
+    assert (status["rows_parsed"], status["rows_inserted"], status["rows_skipped"]) == (DAYS, DAYS, 0)
+    assert status["reports"][0]["rows_inserted"] == {"tiktokdata": DAYS}
+    assert status["errors"] == []
+    assert [len(batch) for batch in posted] == [3, 3, 2]
+    assert len(table_rows(store, "tiktokdata")) == DAYS
+    assert not os.path.exists(app._upload_job_path(job_id, "files"))
+
+    # Finished jobs are not picked up again, and are removed once past their retention
+    assert app.scan_upload_jobs() == []
+    app.scan_upload_jobs(now=app.time.time() + app.UPLOAD_JOB_RETENTION_SECONDS + 60)
+    assert app.load_upload_job(job_id) is None
+
+
+def test_an_interrupted_job_resumes_after_the_rows_it_already_wrote(jobs, monkeypatch):
+    store, posted = jobs
+    job_id = create_job()
+    post_records = app._post_records
+
+    def crash_after_first_batch(tbl_name, records, upsert=False):
+        if posted:
+            raise Crash()
+        return post_records(tbl_name, records, upsert)
+
+    monkeypatch.setattr(app, "_post_records", crash_after_first_batch)
+    with pytest.raises(Crash):
+        app.run_upload_job(job_id)
+    job = app.load_upload_job(job_id)
+    assert job["status"] == "running"
+    assert job["processed_rows"] == {"tiktokdata": 3}
+    assert app.scan_upload_jobs() == [job_id]
+
+    monkeypatch.setattr(app, "_post_records", post_records)
+    app.run_upload_job(job_id)
+    status = app.describe_upload_job(app.load_upload_job(job_id))
+    assert status["status"] == "completed"
+    assert status["attempts"] == 2
+    assert status["rows_inserted"] == DAYS
+    # The resumed attempt started after the checkpointed batch
+    assert posted == [["2024-03-01", "2024-03-02", "2024-03-03"],
+                      ["2024-03-04", "2024-03-05", "2024-03-06"], ["2024-03-07", "2024-03-08"]]
+    assert sorted(row["views"] for row in table_rows(store, "tiktokdata")) == [day * 100 for day in range(1, DAYS + 1)]
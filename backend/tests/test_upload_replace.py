@@ -0,0 +1,100 @@
+# test_upload_replace.py
+"""Re-uploaded rows that changed replace the stored rows under their key instead of being added next to them."""
+import pandas as pd
+
+import app
+from conftest import table_rows
+
+
+def sale(sale_id, date, product_id, quantity, price):
+    return {"sale_id": sale_id, "product_id": product_id, "date": date, "quantity_sold": quantity,
+            "price": price, "revenue": quantity * price}
+
+
+def upload(tables):
+    target_tables, skipped = app.skip_unchanged_rows(tables)
+    messages, status_code = app.insert_upload_tables(target_tables)
+    assert status_code == 200, messages
+    return target_tables, skipped
+
+
+def test_changed_sales_row_replaces_the_stored_rows_for_its_day_and_product(fake_supabase):
+    fake_supabase.tables["sales"] = pd.DataFrame([
+        sale("s1", "2024-05-01", "P1", 1, 10.0),
+        sale("s2", "2024-05-01", "P1", 2, 10.0),
+        sale("s3", "2024-05-01", "P2", 1, 50.0),
+        sale("s4", "2024-05-02", "P1", 3, 10.0),
+    ])
+    # A corrected export: the second P1 sale on May 1 was really 4 units; everything else is unchanged
+    corrected = [
+        sale("u1", "2024-05-01", "P1", 1, 10.0),
+        sale("u2", "2024-05-01", "P1", 4, 10.0),
+        sale("u3", "2024-05-01", "P2", 1, 50.0),
+        sale("u4", "2024-05-02", "P1", 3, 10.0),
+    ]
+    written, skipped = upload({"sales": corrected})
+
+    # Both May 1 P1 rows are written (the unchanged one replaces its stored twin), nothing else is
+    assert sorted(row["sale_id"] for row in written["sales"]) == ["u1", "u2"]
+    assert skipped == {"sales": 2}
+    stored = table_rows(fake_supabase, "sales")
+    assert sorted(row["sale_id"] for row in stored) == ["s3", "s4", "u1", "u2"]
+    assert sum(row["revenue"] for row in stored) == 10 + 40 + 50 + 30
+
+    # Uploading the same export again changes nothing
+    written, skipped = upload({"sales": corrected})
+    assert written == {"sales": []} and skipped == {"sales": 4}
+    assert len(table_rows(fake_supabase, "sales")) == 4
+
+
+def test_changed_metric_rows_replace_the_stored_day_or_post(fake_supabase):
+    fake_supabase.tables["tiktokdata"] = pd.DataFrame([
+        {"date": "2024-05-01", "views": 100, "likes": 10, "comments": 1, "shares": 1},
+        {"date": "2024-05-02", "views": 200, "likes": 20, "comments": 2, "shares": 2},
+    ])
+    fake_supabase.tables["facebookdata"] = pd.DataFrame([
+        {"date": "2024-05-01", "post_url": "https://fb.example/p/1?a=1,2", "likes": 5, "comments": 0, "shares": 0, "reach": 50},
+        {"date": "2024-05-01", "post_url": "https://fb.example/p/2", "likes": 7, "comments": 1, "shares": 0, "reach": 70},
+    ])
+    upload({
+        "tiktokdata": [{"date": "2024-05-02", "views": 250, "likes": 20, "comments": 2, "shares": 2}],
+        "facebookdata": [{"date": "2024-05-01", "post_url": "https://fb.example/p/1?a=1,2", "likes": 9, "comments": 0,
+                          "shares": 0, "reach": 90}],
+    })
+
+    tiktok = {row["date"]: row["views"] for row in table_rows(fake_supabase, "tiktokdata")}
+    assert tiktok == {"2024-05-01": 100, "2024-05-02": 250}
+    facebook = {row["post_url"]: row["reach"] for row in table_rows(fake_supabase, "facebookdata")}
+    assert facebook == {"https://fb.example/p/1?a=1,2": 90, "https://fb.example/p/2": 70}
+
+
+def test_failed_insert_puts_the_replaced_rows_back(fake_supabase, monkeypatch):
+    fake_supabase.tables["tiktokdata"] = pd.DataFrame([{"date": "2024-05-01", "views": 100, "likes": 10, "comments": 1, "shares": 1}])
+    real_post = app._post_records
+    calls = []
+
+    def failing_first_post(tbl_name, records, upsert=False):
+        calls.append(records)
+        if len(calls) == 1:
+            return 500, "insert failed"
+        return real_post(tbl_name, records, upsert)
+
+    monkeypatch.setattr(app, "_post_records", failing_first_post)
+    status_code, error_detail = app.post_table_records(
+        "tiktokdata", [{"date": "2024-05-01", "views": 999, "likes": 10, "comments": 1, "shares": 1}])
+
+    assert (status_code, error_detail) == (500, "insert failed")
+    assert [row["views"] for row in table_rows(fake_supabase, "tiktokdata")] == [100]
+
+
+def test_batched_writer_keeps_a_files_rows_for_one_key_in_one_batch(fake_supabase):
+    fake_supabase.tables["sales"] = pd.DataFrame([sale("s1", "2024-05-01", "P1", 1, 10.0)])
+    rows = [sale(f"u{i}", "2024-05-01", "P1", i + 1, 10.0) for i in range(3)] + [sale("u9", "2024-05-02", "P2", 1, 5.0)]
+    batches = []
+    writer = app.BatchedTableWriter(batch_rows=2, on_batch=lambda table, n, *_: batches.append(n))
+    # Interleaved in the file; the writer groups them by key before batching
+    writer.add("export.csv", {"sales": [rows[0], rows[3], rows[1], rows[2]]})
+    writer.flush()
+
+    assert batches == [3, 1]
+    assert sorted(row["sale_id"] for row in table_rows(fake_supabase, "sales")) == ["u0", "u1", "u2", "u9"]
@@ -6,6 +6,7 @@ import { logActivity } from "/js/auth.js"; // Import the logActivity function
 let correlationData = {}; // Global variable to store fetched correlation results
 let charts = {}; // Object to store Chart.js instances
 let customAlertModalInstance = null; // Global instance for the custom alert modal
+const CORRELATION_CHART_MAX_POINTS = 1000; // Daily points plotted per chart; the backend downsamples long ranges (LTTB)
 
 // Helper function to show a custom alert modal
 function showCustomAlert(message, title = 'Notification') {
@@ -274,9 +275,8 @@ async function fetchCorrelationData(startDate = null, endDate = null, platform =
     if (platform && platform !== 'all') { // Only append if a specific platform is selected
         params.append('platform', platform);
     }
-    if (params.toString()) {
-        url += `?${params.toString()}`;
-    }
+    params.append('max_points', CORRELATION_CHART_MAX_POINTS);
+    url += `?${params.toString()}`;
 
     // Show loading overlays for all charts
     showChartLoadingOverlay('engageReach', true);
@@ -1,151 +1,10 @@
 // Import functions from other modules
 import { getMonthYearAbbreviation } from './dashboard-utils.js';
-import { fetchPlatformData, fetchSalesChartData, fetchTopPerformersData } from './dashboard-dataFetcher.js';
+import { fetchDashboardBundle } from './dashboard-dataFetcher.js';
 import { updateSummaryTotals } from './dashboard-summaryUpdater.js';
 import { renderReachChart, renderEngagementChart, renderSalesChart, renderTopPerformersChart } from './dashboard-chartRenderers.js';
 import { logActivity } from "/js/auth.js"; // Import the logActivity function
 
-/**
- * Merges two arrays of data, summing common date entries and including unique ones.
- * Assumes data objects have a 'date' property and numerical 'reach', 'engagement', 'sales' properties.
- * This function expects already normalized data (i.e., 'reach', 'engagement', 'sales' keys are present).\
- * @param {Array<Object>} data1 - First array of normalized data.
- * @param {Array<Object>} data2 - Second array of normalized data.
- * @returns {Array<Object>} Merged and sorted data.
- */
-function mergeData(data1, data2) {
-    const mergedMap = new Map();
-
-    // Process data1: Add items to map, using date as key.
-    data1.forEach(item => {
-        const date = item.date; // Expecting 'date' as it's normalized
-        if (date) {
-            mergedMap.set(date, {
-                date: date,
-                reach: (item.reach ?? 0),
-                engagement: (item.engagement ?? 0),
-                sales: (item.sales ?? 0)
-            });
-        }
-    });
-
-    // Process data2: Merge with existing entries or add new ones.
-    data2.forEach(item => {
-        const date = item.date; // Expecting 'date' as it's normalized
-        if (date) {
-            if (mergedMap.has(date)) {
-                const existing = mergedMap.get(date);
-                mergedMap.set(date, {
-                    date: date,
-                    reach: existing.reach + (item.reach ?? 0),
-                    engagement: existing.engagement + (item.engagement ?? 0),
-                    sales: existing.sales + (item.sales ?? 0)
-                });
-            } else {
-                mergedMap.set(date, {
-                    date: date,
-                    reach: (item.reach ?? 0),
-                    engagement: (item.engagement ?? 0),
-                    sales: (item.sales ?? 0)
-                });
-            }
-        }
-    });
-
-    // Convert map back to array and sort by date for chronological order.
-    const mergedArray = Array.from(mergedMap.values());
-    mergedArray.sort((a, b) => new Date(a.date) - new Date(b.date));
-    console.log("Merged Data:", mergedArray);
-    return mergedArray;
-}
-
-/**
- * Filters and aggregates data by month and year based on the selected time range.
- * This ensures that x-axis labels are unique (e.g., "Nov 2023" vs. "Nov 2024")
- * and data is summed for each month.
- * @param {Array<Object>} data - The normalized data array, typically daily.
- * @param {string} timeRange - The time range to filter ('last3months', 'last6months', 'lastYear', 'allTime').
- * @returns {Object} An object with aggregated labels, reachData, engagementData, and salesData.
- */
-function filterAndAggregateData(data, timeRange) {
-    let filteredData = [];
-    const now = new Date(); // Get today's date
-
-    // The end date for filtering is always today's date, as per your request
-    const effectiveEndDate = now; 
-    console.log("Effective End Date for Filtering (today's date):", effectiveEndDate.toISOString().split('T')[0]);
-
-    let startDateFilter;
-    // Determine the start date for filtering based on timeRange, relative to today's date
-    switch (timeRange) {
-        case 'last3months':
-            // Start of the month 3 months ago from today's current month
-            startDateFilter = new Date(now.getFullYear(), now.getMonth() - 2, 1);
-            break;
-        case 'last6months':
-            // Start of the month 6 months ago from today's current month
-            startDateFilter = new Date(now.getFullYear(), now.getMonth() - 5, 1);
-            break;
-        case 'lastYear':
-            // Start of the month 1 year ago from today's current month
-            // Example: if today is June 25, 2025 (month 5), start date is June 1, 2024 (month 5)
-            startDateFilter = new Date(now.getFullYear() - 1, now.getMonth(), 1);
-            break;
-        case 'allTime':
-        default:
-            startDateFilter = null; // No date filtering, include all data up to effectiveEndDate
-            break;
-    }
-    console.log("Calculated Start Date for Filtering (1st of the month):", startDateFilter ? startDateFilter.toISOString().split('T')[0] : "All Time");
-
-
-    // Apply date filtering
-    filteredData = data.filter(item => {
-        const itemDate = new Date(item.date);
-        return (!startDateFilter || itemDate >= startDateFilter) && itemDate <= effectiveEndDate;
-    });
-    console.log("Data filtered based on calculated range:", filteredData);
-
-
-    // Aggregate filtered data by month and year
-    // The map key will be "YYYY-MM" to ensure unique month-year combinations
-    const monthlyAggregatedData = new Map();
-
-    filteredData.forEach(item => {
-        const itemDate = new Date(item.date);
-        const yearMonthKey = `${itemDate.getFullYear()}-${String(itemDate.getMonth() + 1).padStart(2, '0')}`;
-
-        if (!monthlyAggregatedData.has(yearMonthKey)) {
-            monthlyAggregatedData.set(yearMonthKey, {
-                // Store date key so we can sort and create labels later
-                dateKey: yearMonthKey, 
-                reach: 0,
-                engagement: 0,
-                sales: 0
-            });
-        }
-        const currentMonthData = monthlyAggregatedData.get(yearMonthKey);
-        currentMonthData.reach += item.reach;
-        currentMonthData.engagement += item.engagement;
-        currentMonthData.sales += item.sales;
-    });
-
-    // Convert the aggregated map to an array and sort it by dateKey
-    const sortedAggregatedData = Array.from(monthlyAggregatedData.values())
-        .sort((a, b) => a.dateKey.localeCompare(b.dateKey)); // Sort by "YYYY-MM" string
-
-    // Prepare labels and datasets for Chart.js
-    const labels = sortedAggregatedData.map(item => {
-        // Reconstruct a date string from the dateKey to pass to getMonthYearAbbreviation
-        return getMonthYearAbbreviation(`${item.dateKey}-01`); 
-    });
-    const reachData = sortedAggregatedData.map(item => item.reach);
-    const engagementData = sortedAggregatedData.map(item => item.engagement);
-    const salesData = sortedAggregatedData.map(item => item.sales);
-
-    return { labels, reachData, engagementData, salesData };
-}
-
 /**
  * Shows a loading overlay for a specific chart.
  * @param {string} chartId - The ID of the chart's loading overlay element.
@@ -234,13 +93,11 @@ async function renderSales(labels, salesData) {
 
 /**
  * Renders the Top Performers Chart.
- * @param {string} timeRange - The time range to filter data.
+ * @param {Array<Object>} topPerformersData - Top products as [{product_name, sales}].
  */
-async function renderTopPerformers(timeRange) { // Added timeRange parameter
+async function renderTopPerformers(topPerformersData) {
     showChartLoading('topPerformersChartLoadingOverlay');
     try {
-        // Pass timeRange to the fetch function
-        const topPerformersData = await fetchTopPerformersData(timeRange); 
         const topPerformersCard = document.querySelector('.row.g-3 #topPerformersChartLoadingOverlay').parentElement; // Get the parent card of the overlay
 
         // Clear any previous "No data" messages or existing chart content
@@ -298,32 +155,22 @@ async function renderAllCharts(platform = 'all', timeRange = 'lastYear') {
 
 
     try {
-        let reachEngagementData = { rawData: [] };
-        let salesChartRawData = [];
-
-        // Fetch all necessary raw data concurrently
-        // fetchPlatformData now explicitly does NOT take timeRange for backend filtering.
-        // Frontend will filter and aggregate data.
-        [reachEngagementData, salesChartRawData] = await Promise.all([
-            fetchPlatformData(platform), 
-            fetchSalesChartData(timeRange) // Keep passing timeRange for Sales to filter at backend
-        ]);
+        // One request returns the summary, the monthly chart series and the top products,
+        // already filtered by platform and time range on the server
+        const bundle = await fetchDashboardBundle(platform, timeRange);
+        const series = bundle?.chart_series ?? { months: [], reach: [], engagement: [], sales: [] };
+        const summary = bundle?.summary ?? { total_reach: 0, total_engagement: 0, total_sales: 0 };
 
-        // Combine and aggregate data
-        // This is where filtering based on timeRange happens for Reach/Engagement/Sales
-        const combinedRawData = mergeData(reachEngagementData.rawData, salesChartRawData);
-        // Pass the effectiveEndDate to filterAndAggregateData if needed, 
-        // but the function itself now calculates it dynamically based on the data.
-        const { labels, reachData, engagementData, salesData } = filterAndAggregateData(combinedRawData, timeRange);
+        // Months come as "YYYY-MM"; labels are unique month-year pairs such as "Nov 2024"
+        const labels = series.months.map(month => getMonthYearAbbreviation(`${month}-01`));
 
         // Render charts and summary individually with their own loading states
-        // Pass timeRange to renderTopPerformers for backend filtering
         await Promise.all([
-            renderSummary(reachData, engagementData, salesData),
-            renderReach(labels, reachData),
-            renderEngagement(labels, engagementData),
-            renderSales(labels, salesData),
-            renderTopPerformers(timeRange) // Pass timeRange here
+            renderSummary([summary.total_reach], [summary.total_engagement], [summary.total_sales]),
+            renderReach(labels, series.reach),
+            renderEngagement(labels, series.engagement),
+            renderSales(labels, series.sales),
+            renderTopPerformers(bundle?.top_products ?? [])
         ]);
 
     } catch (error) {
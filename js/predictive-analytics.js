@@ -155,6 +155,60 @@ async function fetchPredictiveData(metricType, forecastMonths) {
 }
 
 
+/**
+ * Fetches predictive data for several metrics in a single request to the batch endpoint,
+ * which loads the source data once and fits all forecasts in parallel on the server.
+ * Results are stored in the same cache used by fetchPredictiveData.
+ * @param {Array<string>} metricTypes Metrics to fetch, e.g. ['engagement', 'reach', 'sales'].
+ * @param {number} forecastMonths The fixed number of months to forecast (e.g., 36).
+ * @returns {Promise<boolean>} True if the batch request succeeded, false otherwise.
+ */
+async function prefetchPredictiveDataBatch(metricTypes, forecastMonths) {
+    const token = window.currentUserToken;
+    if (!token) {
+        return false;
+    }
+
+    try {
+        const API_BASE_URL = "http://127.0.0.1:5000/api";
+        const response = await fetch(`${API_BASE_URL}/predictive-analytics/batch?metric_types=${metricTypes.join(',')}&forecast_months=${forecastMonths}`, {
+            headers: {
+                'Authorization': `Bearer ${token}`
+            }
+        });
+
+        if (!response.ok) {
+            const errorData = await response.json();
+            throw new Error(errorData.error || `HTTP error! Status: ${response.status}`);
+        }
+
+        const data = await response.json();
+        console.log(`Batch predictive data (fixed forecast of ${forecastMonths} months):`, data);
+
+        metricTypes.forEach(metricType => {
+            const metricData = data.forecasts ? data.forecasts[metricType] : null;
+            // Metrics that failed server-side are left uncached so they fall back to the single-metric endpoint
+            if (!metricData || metricData.error) {
+                return;
+            }
+            predictiveDataCache[`${metricType}-${forecastMonths}`] = {
+                data: {
+                    historical_data: metricData.historical_data,
+                    forecast_data: metricData.forecast_data,
+                    recommendation: metricData.recommendation,
+                    message: metricData.message
+                },
+                timestamp: Date.now()
+            };
+        });
+        return true;
+    } catch (error) {
+        console.error('Error fetching batch predictive data, falling back to per-metric requests:', error);
+        return false;
+    }
+}
+
+
 /**
  * Renders the Chart.js chart for a given metric.
  * @param {string} chartId The ID of the canvas element.
@@ -430,6 +484,9 @@ async function showVisualization(metricType) {
  */
 async function initializeAllChartsOnLoad() {
     const metricsToLoad = ['engagement', 'reach', 'sales'];
+    // Load all metrics in one batch request first; showVisualization then reads them from cache
+    metricsToLoad.forEach(metricType => showChartLoadingOverlay(metricType, true));
+    await prefetchPredictiveDataBatch(metricsToLoad, fixedForecastMonths);
     // Directly call showVisualization for each metric, which handles its own loading state
     const fetchPromises = metricsToLoad.map(metricType => showVisualization(metricType));
 
@@ -15,18 +15,59 @@ async function initUploadButton() {
   }
 }
 
+const API_BASE_URL = "http://127.0.0.1:5000";
+const JOB_POLL_INTERVAL_MS = 1000;
+
+// Text shown while a background upload job runs, e.g. "Processing... 12,000 rows parsed, 8,000 inserted (4,000 rows/s)"
+function formatJobProgress(job) {
+  const parsed = (job.rows_parsed || 0).toLocaleString();
+  const inserted = (job.rows_inserted || 0).toLocaleString();
+  const skipped = job.rows_skipped ? `, ${job.rows_skipped.toLocaleString()} unchanged skipped` : "";
+  const rate = job.rows_per_second ? ` (${Math.round(job.rows_per_second).toLocaleString()} rows/s)` : "";
+  const state = job.status === "queued" ? "Queued" : "Processing";
+  return `${state}... ${parsed} rows parsed, ${inserted} inserted${skipped}${rate}`;
+}
+
+// Collects the job-level and per-file errors reported by the job status endpoint
+function collectJobErrors(job) {
+  const errors = [...(job.errors || [])];
+  (job.reports || []).forEach((report) => {
+    (report.errors || []).forEach((error) => errors.push(`${report.source}: ${error}`));
+  });
+  return errors;
+}
+
+// Polls the job status endpoint until the job completes or fails, updating the status text
+async function waitForUploadJob(statusUrl, token) {
+  while (true) {
+    const response = await fetch(`${API_BASE_URL}${statusUrl}`, {
+      headers: { 'Authorization': `Bearer ${token}` }
+    });
+    const job = await response.json();
+    if (!response.ok) {
+      throw new Error(job.message || `Status: ${response.status}`);
+    }
+    if (job.status !== "queued" && job.status !== "running") {
+      return job;
+    }
+    uploadStatus.textContent = formatJobProgress(job);
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+  }
+}
+
 uploadForm.addEventListener("submit", async (e) => {
   e.preventDefault();
 
   const app = document.getElementById("appSelect").value;
   const fileInput = document.getElementById("dataFile");
-  const file = fileInput.files[0];
+  const files = Array.from(fileInput.files);
+  const fileNames = files.map((file) => file.name).join(", ");
 
   if (!app) {
     showCustomAlert("Please select an app.", "Selection Required"); // Use custom alert
     return;
   }
-  if (!file) {
+  if (!files.length) {
     showCustomAlert("Please select a file.", "File Required"); // Use custom alert
     return;
   }
@@ -37,7 +78,7 @@ uploadForm.addEventListener("submit", async (e) => {
   try {
     const formData = new FormData();
     formData.append("app", app);
-    formData.append("file", file);
+    files.forEach((file) => formData.append("files", file));
 
     // Get current user token from window.currentUserToken for authorization
     const token = window.currentUserToken; 
@@ -47,7 +88,8 @@ uploadForm.addEventListener("submit", async (e) => {
         return;
     }
 
-    const response = await fetch("http://127.0.0.1:5000/api/upload-data", {
+    // The server accepts the files straight away (202) and processes them in a background job
+    const response = await fetch(`${API_BASE_URL}/api/upload-jobs`, {
       method: "POST",
       headers: {
           'Authorization': `Bearer ${token}` // Add Authorization header
@@ -56,18 +98,27 @@ uploadForm.addEventListener("submit", async (e) => {
     });
 
     let result = {};
-    if (response.status !== 204 && response.headers.get('content-type')?.includes('application/json')) {
+    if (response.headers.get('content-type')?.includes('application/json')) {
       result = await response.json();
-    } else if (response.status === 204) {
-      result = { message: "Upload successful (no content returned from server)." };
     } else {
       result = { message: response.statusText || "Unknown error occurred." };
     }
 
+    if (!response.ok) {
+      uploadStatus.textContent = "Upload failed: " + (result.message || `Status: ${response.status}`);
+      logActivity("DATA_UPLOAD_FAILED", `Failed to upload data for app '${app}' from file(s) '${fileNames}'. Error: ${result.message || response.statusText}`); // Log failure
+      return;
+    }
+
+    uploadStatus.textContent = formatJobProgress(result);
+    const job = await waitForUploadJob(result.status_url, token);
+    const errors = collectJobErrors(job);
 
-    if (response.ok) {
-      uploadStatus.textContent = "Upload successful! " + (result.message || "");
-      logActivity("DATA_UPLOAD_SUCCESS", `Uploaded data for app '${app}' from file '${file.name}'.`); // Log success
+    if (job.status === "completed") {
+      const skipped = job.rows_skipped ? ` ${job.rows_skipped.toLocaleString()} unchanged rows were already stored and skipped.` : "";
+      const summary = `${job.rows_inserted.toLocaleString()} of ${job.rows_parsed.toLocaleString()} rows inserted.${skipped}`;
+      uploadStatus.textContent = "Upload successful! " + summary + (errors.length ? ` Some rows failed: ${errors.join("; ")}` : "");
+      logActivity("DATA_UPLOAD_SUCCESS", `Uploaded data for app '${app}' from file(s) '${fileNames}'. ${summary}`); // Log success
       setTimeout(() => {
         uploadStatus.style.display = "none";
         const uploadModal = bootstrap.Modal.getInstance(document.getElementById('uploadModal'));
@@ -83,14 +134,14 @@ uploadForm.addEventListener("submit", async (e) => {
         } else {
             console.warn("renderAllCharts function not found. Charts may not auto-update.");
         }
-      }, 1500);
+      }, errors.length ? 5000 : 1500);
     } else {
-      uploadStatus.textContent = "Upload failed: " + (result.message || `Status: ${response.status}`);
-      logActivity("DATA_UPLOAD_FAILED", `Failed to upload data for app '${app}' from file '${file.name}'. Error: ${result.message || response.statusText}`); // Log failure
+      uploadStatus.textContent = "Upload failed: " + (errors.join("; ") || "Unknown error occurred.");
+      logActivity("DATA_UPLOAD_FAILED", `Failed to upload data for app '${app}' from file(s) '${fileNames}'. Error: ${errors.join("; ")}`); // Log failure
     }
   } catch (err) {
     uploadStatus.textContent = "Upload error: " + err.message;
-    logActivity("DATA_UPLOAD_ERROR", `Error during data upload for app '${app}' from file '${file?.name}'. Error: ${err.message}`); // Log error
+    logActivity("DATA_UPLOAD_ERROR", `Error during data upload for app '${app}' from file(s) '${fileNames}'. Error: ${err.message}`); // Log error
   }
 });
 